@@ -15,6 +15,8 @@ OP_READ, OP_WRITE, OP_ERASE = 'OP_READ', 'OP_WRITE', 'OP_ERASE'
 OP_DISCARD = 'OP_DISCARD'
 OP_REC_TIMESTAMP = 'OP_REC_TIMESTAMP'
 OP_BARRIER = 'OP_BARRIER'
+# host processes of SimulatorDESSync wait here for each other
+OP_HOST_BARRIER = 'OP_HOST_BARRIER'
 OP_CLEAN = 'OP_CLEAN'
 OP_ENABLE_RECORDER = 'OP_ENABLE_RECORDER'
 OP_DISABLE_RECORDER = 'OP_DISABLE_RECORDER'
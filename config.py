@@ -205,6 +205,16 @@ class Config(dict):
             "sector_size"           : 512,
             "sort_block_trace"      : True,
             "trace_issue_and_complete": False,
+            # feed blkparse output to the simulator while the target
+            # workload runs, without event files. Events are not sorted.
+            "stream_blktrace_to_simulator": False,
+            # checkpoint interval (in events) of the index of event files
+            # for seeking, None: do not index. Indexing parses the event
+            # files once more after they are created.
+            "event_file_index_interval": None,
+            # for LBAMULTIPROC, merge the event streams of all processes
+            # into one stream ordered by timestamp
+            "merge_multiproc_streams": False,
 
             ############## For wiscsim ######
             "enable_simulation"     : True,
@@ -1,8 +1,13 @@
+import heapq
 import os
 import re
+import shutil
 import subprocess
+import tempfile
 import time
 
+import numpy as np
+
 from pyreuse.helpers import *
 from pyreuse.macros import *
 
@@ -243,6 +248,262 @@ class BlktraceResultInMem(object):
         return size_mb / duration
 
 
+DATA_LINE_PATTERN = re.compile(
+    r'^[ \t]*(\d+,\d+)[ \t]+(\d+)[ \t]+(\d+)[ \t]+(\S+)[ \t]+(\d+)'
+    r'[ \t]+(\S+)[ \t]+(\S+)[ \t]+(\d+)[ \t]+\+[ \t]+(\d+)',
+    re.MULTILINE)
+# fields captured by the groups of DATA_LINE_PATTERN
+DATA_LINE_FIELDS = ['devid', 'cpuid', 'seqid', 'timestamp', 'pid', 'action',
+        'RWBS', 'sector_start', 'sector_count']
+OPERATION_NAMES = ['read', 'write', 'discard']
+
+
+class BlktraceResultChunked(object):
+    """
+    Parse blkparse output in chunks with NumPy
+
+    It produces the same event file as BlktraceResultInMem (do_sort=True)
+    or BlktraceResult (do_sort=False). Data lines of a chunk are matched
+    in bulk and the per-row computations are done on arrays. Memory is
+    bounded by the chunk size: to sort, every chunk is sorted into a
+    temporary run file next to the output and the runs are merged.
+    """
+    def __init__(self, sector_size, event_file_column_names,
+            raw_blkparse_file_path, parsed_output_path,
+            padding_bytes=0, do_sort=True, chunk_bytes=16*MB):
+        self.raw_blkparse_file_path = raw_blkparse_file_path
+        self.parsed_output_path = parsed_output_path
+        self.sector_size = sector_size
+        self.event_file_column_names = event_file_column_names
+        self.do_sort = do_sort
+        self.chunk_bytes = chunk_bytes
+
+        # event offset + padding_bytes = blktrace addr
+        self.padding_bytes = padding_bytes
+
+        # timestamp, sector_count and operation are always kept for
+        # get_duration() and count_sectors()
+        self._kept_fields = set(['timestamp', 'sector_count'])
+        for name in self.event_file_column_names:
+            if name == 'offset':
+                self._kept_fields.add('sector_start')
+            elif name == 'sync':
+                self._kept_fields.add('sync')
+            elif name in DATA_LINE_FIELDS:
+                self._kept_fields.add(name)
+
+        self.__stats = None
+
+    def _iter_chunks(self):
+        """
+        Yield a dict of arrays for each chunk of data lines
+        """
+        with open(self.raw_blkparse_file_path, 'r') as f:
+            while True:
+                lines = f.readlines(self.chunk_bytes)
+                if len(lines) == 0:
+                    break
+                rows = DATA_LINE_PATTERN.findall(''.join(lines))
+                if len(rows) == 0:
+                    continue
+                yield self._rows_to_arrays(rows)
+
+    def _rows_to_arrays(self, rows):
+        fields = dict(zip(DATA_LINE_FIELDS, zip(*rows)))
+        chunk = {}
+
+        rwbs = np.array(fields['RWBS'])
+        is_discard = np.char.find(rwbs, 'D') >= 0
+        is_write = np.char.find(rwbs, 'W') >= 0
+        is_read = np.char.find(rwbs, 'R') >= 0
+        unknown = ~(is_discard | is_write | is_read)
+        if unknown.any():
+            raise RuntimeError('unknow operation ' + rwbs[unknown][0])
+        operation = np.zeros(len(rows), dtype=np.uint8)
+        operation[is_write] = OPERATION_NAMES.index('write')
+        operation[is_discard] = OPERATION_NAMES.index('discard')
+        chunk['operation'] = operation
+
+        for name in self._kept_fields:
+            if name == 'sync':
+                chunk['sync'] = np.char.find(rwbs, 'S') >= 0
+            elif name in ('sector_start', 'sector_count'):
+                chunk[name] = np.array(fields[name], dtype=np.int64)
+            elif name == 'timestamp':
+                # keep the text too, so the event file has exactly the
+                # timestamps printed by blkparse
+                chunk['timestamp_str'] = np.array(fields[name])
+                chunk['timestamp'] = chunk['timestamp_str'].astype(
+                        np.float64)
+            else:
+                chunk[name] = np.array(fields[name])
+
+        return chunk
+
+    def _column_strings(self, table, name, pre_wait_time):
+        n = len(table['operation'])
+        if name == 'operation':
+            return np.array(OPERATION_NAMES)[table['operation']]
+        elif name == 'sync':
+            return np.array(['False', 'True'])[
+                    table['sync'].astype(np.uint8)]
+        elif name == 'offset':
+            return (table['sector_start'] * self.sector_size
+                    - self.padding_bytes).astype(str)
+        elif name == 'size':
+            return (table['sector_count'] * self.sector_size).astype(str)
+        elif name == 'timestamp':
+            return table['timestamp_str']
+        elif name == 'pre_wait_time' and pre_wait_time is not None:
+            return pre_wait_time
+        elif name == 'type':
+            return ['blkparse'] * n
+        elif name in table:
+            return table[name].astype(str)
+        else:
+            return ['NA'] * n
+
+    def _write_table(self, out, table, pre_wait_time=None):
+        columns = [self._column_strings(table, name, pre_wait_time)
+                for name in self.event_file_column_names]
+        lines = [' '.join(row) for row in zip(*columns)]
+        if len(lines) > 0:
+            out.write('\n'.join(lines) + '\n')
+
+    def _write_run(self, run_path, chunk):
+        """
+        Sort a chunk by timestamp and write it to a run file. A line of
+        the run has the timestamp, and the event line before and after
+        the pre_wait_time column, separated by tabs.
+        """
+        # stable, like list.sort() in BlktraceResultInMem
+        order = np.argsort(chunk['timestamp'], kind='mergesort')
+        chunk = {name: array[order] for name, array in chunk.items()}
+
+        names = self.event_file_column_names
+        if 'pre_wait_time' in names:
+            pos = names.index('pre_wait_time')
+            before_names, after_names = names[:pos], names[pos + 1:]
+        else:
+            before_names, after_names = names, []
+
+        def joined(column_names):
+            columns = [self._column_strings(chunk, name, None)
+                    for name in column_names]
+            if len(columns) == 0:
+                return [''] * len(order)
+            return [' '.join(row) for row in zip(*columns)]
+
+        with open(run_path, 'w') as f:
+            lines = ['\t'.join(row) for row in zip(chunk['timestamp_str'],
+                joined(before_names), joined(after_names))]
+            f.write('\n'.join(lines) + '\n')
+
+    def _iter_run(self, run_id, run_path):
+        with open(run_path, 'r') as f:
+            for line_no, line in enumerate(f):
+                timestamp_str, before, after = line.rstrip('\n').split('\t')
+                # run_id and line_no keep the merge stable
+                yield float(timestamp_str), run_id, line_no, before, after
+
+    def _write_merged_runs(self, out, run_paths):
+        names = self.event_file_column_names
+        has_wait = 'pre_wait_time' in names
+        if has_wait is True:
+            pos = names.index('pre_wait_time')
+            sep_before = ' ' if pos > 0 else ''
+            sep_after = ' ' if pos < len(names) - 1 else ''
+        runs = [self._iter_run(i, path) for i, path in enumerate(run_paths)]
+        prev_timestamp = None
+        lines = []
+        for timestamp, _, _, before, after in heapq.merge(*runs):
+            if has_wait is True:
+                # str() of Python floats gives the same text as the float
+                # arithmetic in BlktraceResultInMem
+                if prev_timestamp is None:
+                    wait = '0'
+                else:
+                    wait = str(timestamp - prev_timestamp)
+                prev_timestamp = timestamp
+                line = before + sep_before + wait + sep_after + after
+            else:
+                line = before
+            lines.append(line)
+            if len(lines) == 65536:
+                out.write('\n'.join(lines) + '\n')
+                lines = []
+        if len(lines) > 0:
+            out.write('\n'.join(lines) + '\n')
+
+    def _write_sorted(self, out):
+        run_dir = tempfile.mkdtemp(prefix='blkparse-runs-',
+                dir=os.path.dirname(os.path.abspath(self.parsed_output_path)))
+        try:
+            run_paths = []
+            for chunk in self._iter_chunks():
+                run_path = os.path.join(run_dir, str(len(run_paths)))
+                self._write_run(run_path, chunk)
+                run_paths.append(run_path)
+            self._write_merged_runs(out, run_paths)
+        finally:
+            shutil.rmtree(run_dir)
+
+    def create_event_file(self):
+        prepare_dir_for_path(self.parsed_output_path)
+
+        with open(self.parsed_output_path, 'w') as out:
+            if self.do_sort is True:
+                self._write_sorted(out)
+            else:
+                for chunk in self._iter_chunks():
+                    self._write_table(out, chunk)
+
+            out.flush()
+            os.fsync(out)
+
+    def _get_stats(self):
+        """
+        Return (min timestamp, max timestamp, sectors of each operation),
+        computed chunk by chunk. Timestamps are None if there is no data.
+        """
+        if self.__stats is not None:
+            return self.__stats
+
+        min_ts, max_ts = None, None
+        sectors = [0] * len(OPERATION_NAMES)
+        for chunk in self._iter_chunks():
+            ts = chunk['timestamp']
+            min_ts = ts.min() if min_ts is None else min(min_ts, ts.min())
+            max_ts = ts.max() if max_ts is None else max(max_ts, ts.max())
+            counts = np.bincount(chunk['operation'],
+                    weights=chunk['sector_count'],
+                    minlength=len(OPERATION_NAMES))
+            for i in range(len(OPERATION_NAMES)):
+                sectors[i] += int(counts[i])
+
+        self.__stats = (min_ts, max_ts, sectors)
+        return self.__stats
+
+    def get_duration(self):
+        min_ts, max_ts, _ = self._get_stats()
+        if min_ts is None:
+            return 0.0
+        return max_ts - min_ts
+
+    def count_sectors(self, operation):
+        _, _, sectors = self._get_stats()
+        return sectors[OPERATION_NAMES.index(operation)]
+
+    def get_bandwidth_mb(self, operation):
+        sec_cnt = self.count_sectors(operation)
+        size_mb = sec_cnt * self.sector_size / float(MB)
+        duration = self.get_duration()
+        if duration == 0:
+            return 0.0
+
+        return size_mb / duration
+
+
 class BlockTraceManager(object):
     "This class provides interfaces to interact with blktrace"
     def __init__(self, dev, event_file_column_names,
@@ -264,23 +525,13 @@ class BlockTraceManager(object):
         stop_blktrace_on_bg()
 
     def create_event_file_from_blkparse(self):
-        if self.do_sort is True:
-            rawparser = BlktraceResultInMem(self.sector_size,
-                    self.event_file_column_names,
-                    self.resultpath, self.to_ftlsim_path,
-                    padding_bytes=self.padding_bytes,
-                    do_sort=self.do_sort
-                    )
-            rawparser.create_event_file()
-
-        else:
-            rawparser = BlktraceResult(self.sector_size,
-                    self.event_file_column_names,
-                    self.resultpath, self.to_ftlsim_path,
-                    padding_bytes=self.padding_bytes,
-                    do_sort=self.do_sort
-                    )
-            rawparser.create_event_file()
+        rawparser = BlktraceResultChunked(self.sector_size,
+                self.event_file_column_names,
+                self.resultpath, self.to_ftlsim_path,
+                padding_bytes=self.padding_bytes,
+                do_sort=self.do_sort
+                )
+        rawparser.create_event_file()
 
 
 def start_blktrace_on_bg(dev, resultpath, trace_filter=None):
@@ -321,3 +572,26 @@ def is_data_line(line):
         return True
 
 
+
+def parse_data_line(line):
+    """
+    Return a dict of DATA_LINE_FIELDS of a blkparse line, or None if the
+    line is not a data line
+    """
+    mo = DATA_LINE_PATTERN.match(line)
+    if mo is None:
+        return None
+    return dict(zip(DATA_LINE_FIELDS, mo.groups()))
+
+def rwbs_to_operation(rwbs):
+    "return (operation, sync) of the RWBS field"
+    if 'D' in rwbs:
+        operation = 'discard'
+    elif 'W' in rwbs:
+        operation = 'write'
+    elif 'R' in rwbs:
+        operation = 'read'
+    else:
+        raise RuntimeError('unknow operation ' + rwbs)
+
+    return operation, 'S' in rwbs
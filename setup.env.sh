@@ -9,6 +9,7 @@ sudo apt-get install -y python-pip
 
 sudo pip install bidict
 sudo pip install simpy
+sudo pip install numpy
 
 make f2fsgc
 
@@ -0,0 +1,103 @@
+"""
+Microbenchmarks of the LRU containers in wiscsim.lrulist
+
+Each container is filled with n_entries keys and then accessed n_ops times
+like a mapping cache: a hit reads the key, a miss evicts the victim and
+inserts the key. Throughput is in operations per second, memory is the
+bytes used by the container itself (keys and values excluded) per entry.
+
+Usage:
+    python -m tests.lrulist_bench [n_entries] [n_ops]
+"""
+import gc
+import random
+import sys
+import time
+
+from wiscsim.lrulist import LruCache, LruDict, SegmentedLruCache, \
+        CompactLruCache, CompactLruDict, CompactSegmentedLruCache
+
+
+def create_containers(n_entries):
+    """
+    Return [(name, original, compact), ...]
+    """
+    return [
+        ('LruCache', LruCache(), CompactLruCache()),
+        ('LruDict', LruDict(), CompactLruDict()),
+        ('SegmentedLruCache', SegmentedLruCache(n_entries, 0.5),
+            CompactSegmentedLruCache(n_entries, 0.5)),
+        ]
+
+
+def access_keys(n_entries, n_ops, seed=1):
+    rand = random.Random(seed)
+    # about 2/3 of the accesses hit
+    return [rand.randint(0, n_entries * 3 / 2) for i in range(n_ops)]
+
+
+def run_accesses(container, n_entries, keys):
+    for key in range(n_entries):
+        container[key] = key
+    for key in keys:
+        if container.has_key(key):
+            container[key]
+        else:
+            del container[container.victim_key()]
+            container[key] = key
+
+
+def container_bytes(container):
+    """
+    Bytes of all objects reachable from container, except keys, values,
+    classes and shared constants
+    """
+    skipped_types = (int, long, bool, float, str, type(None), type)
+    seen = set()
+    total = 0
+    pending = [container]
+    while len(pending) > 0:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, skipped_types):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return total
+
+
+def benchmark(n_entries=4096, n_ops=200000):
+    """
+    Return {name: {'original': (ops per sec, bytes per entry),
+                   'compact': (ops per sec, bytes per entry)}}
+    """
+    keys = access_keys(n_entries, n_ops)
+    result = {}
+    for name, original, compact in create_containers(n_entries):
+        result[name] = {}
+        for kind, container in (('original', original),
+                ('compact', compact)):
+            start = time.time()
+            run_accesses(container, n_entries, keys)
+            duration = max(time.time() - start, 1e-9)
+            result[name][kind] = (
+                (n_entries + n_ops) / duration,
+                container_bytes(container) / float(n_entries))
+    return result
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:]]
+    result = benchmark(*args)
+    print '{:<20}{:>14}{:>14}{:>10}{:>14}{:>14}'.format('container',
+            'ops/s', 'compact ops/s', 'speedup', 'B/entry',
+            'compact B/ent')
+    for name, kinds in sorted(result.items()):
+        ops, size = kinds['original']
+        compact_ops, compact_size = kinds['compact']
+        print '{:<20}{:>14.0f}{:>14.0f}{:>10.2f}{:>14.1f}{:>14.1f}'.format(
+            name, ops, compact_ops, compact_ops / ops, size, compact_size)
+
+
+if __name__ == '__main__':
+    main()
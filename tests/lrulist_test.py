@@ -1,8 +1,12 @@
+import random
 import unittest
 
 import wiscsim
-from wiscsim.lrulist import LinkedList, Node, LruDict, LruCache
+from wiscsim.lrulist import LinkedList, Node, LruDict, LruCache, \
+        SegmentedLruCache, CompactLruCache, CompactLruDict, \
+        CompactSegmentedLruCache
 import profile
+import lrulist_bench
 
 
 class Test_lrucache(unittest.TestCase):
@@ -28,17 +32,19 @@ class Test_lrucache(unittest.TestCase):
         self.assertEqual(lrucache.has_key(1), False)
 
 class Test_LruCache(unittest.TestCase):
+    cache_class = LruCache
+
     def get_lrucache(self):
-        d = LruCache()
+        d = self.cache_class()
         for i in range(10):
             d[i] = i*10
         return d
 
     def test_init(self):
-        d = LruCache()
-        d = LruCache({1:2})
-        d = LruCache(((1, 2), (2, 3)))
-        d = LruCache(a = 1, b = 2)
+        d = self.cache_class()
+        d = self.cache_class({1:2})
+        d = self.cache_class(((1, 2), (2, 3)))
+        d = self.cache_class(a = 1, b = 2)
 
     def test1(self):
         d = self.get_lrucache()
@@ -118,6 +124,15 @@ class Test_LruCache(unittest.TestCase):
         self.assertEqual(d.victim_key(), 10)
         self.assertEqual(d.most_recently_used_key(), 9)
 
+    def test_add_to_least_used_when_empty(self):
+        d = self.cache_class()
+
+        d.add_as_least_used(1, 10)
+        d[2] = 20
+        self.assertEqual(d.victim_key(), 1)
+        self.assertEqual(d.most_recently_used_key(), 2)
+        self.assertListEqual(list(d), [2, 1])
+
     def _test_performance(self):
         d = LruDict()
         for i in range(2048):
@@ -132,17 +147,19 @@ class Test_LruCache(unittest.TestCase):
 
 
 class Test_LruDict(unittest.TestCase):
+    dict_class = LruDict
+
     def get_lrudict(self):
-        d = LruDict()
+        d = self.dict_class()
         for i in range(10):
             d[i] = i*10
         return d
 
     def test_init(self):
-        d = LruDict()
-        d = LruDict({1:2})
-        d = LruDict(((1, 2), (2, 3)))
-        d = LruDict(a = 1, b = 2)
+        d = self.dict_class()
+        d = self.dict_class({1:2})
+        d = self.dict_class(((1, 2), (2, 3)))
+        d = self.dict_class(a = 1, b = 2)
 
     def test1(self):
         d = self.get_lrudict()
@@ -177,7 +194,7 @@ class Test_LruDict(unittest.TestCase):
         self.assertListEqual(lv, list(range(0, 100, 10)))
 
     def test_recency_iter(self):
-        d = LruDict()
+        d = self.dict_class()
         d[1] = 11
         d[2] = 22
 
@@ -226,6 +243,95 @@ class Test_LruDict(unittest.TestCase):
             v != 1
 
 
+class Test_CompactLruCache(Test_LruCache):
+    cache_class = CompactLruCache
+
+
+class Test_CompactLruDict(Test_LruDict):
+    dict_class = CompactLruDict
+
+
+class Test_CompactSameAsOriginal(unittest.TestCase):
+    """
+    Random operations give the same order in the original and compact
+    containers
+    """
+    def run_ops(self, original, compact, ops):
+        rand = random.Random(1)
+        for i in range(3000):
+            key = rand.randint(0, 40)
+            op = rand.choice(ops)
+            if op == 'set':
+                original[key] = i
+                compact[key] = i
+            elif not original.has_key(key):
+                self.assertFalse(compact.has_key(key))
+                if op == 'least':
+                    original.add_as_least_used(key, i)
+                    compact.add_as_least_used(key, i)
+            elif op == 'get':
+                self.assertEqual(original[key], compact[key])
+            elif op == 'peek':
+                self.assertEqual(original.peek(key), compact.peek(key))
+            elif op == 'orderless':
+                original.orderless_update(key, -i)
+                compact.orderless_update(key, -i)
+            elif op == 'del':
+                del original[key]
+                del compact[key]
+            elif op == 'evict':
+                victim = original.victim_key()
+                self.assertEqual(victim, compact.victim_key())
+                del original[victim]
+                del compact[victim]
+
+            self.assertEqual(len(original), len(compact))
+            if len(original) > 0:
+                self.assertEqual(original.victim_key(),
+                        compact.victim_key())
+
+    def test_lrucache(self):
+        original = LruCache()
+        compact = CompactLruCache()
+        self.run_ops(original, compact, ['set', 'least', 'get', 'peek',
+            'orderless', 'del', 'evict'])
+        self.assertListEqual(list(original.least_to_most_items()),
+                list(compact.least_to_most_items()))
+        self.assertListEqual(list(original), list(compact))
+
+    def test_lrudict(self):
+        original = LruDict()
+        compact = CompactLruDict()
+        self.run_ops(original, compact, ['set', 'get', 'peek', 'del',
+            'evict'])
+        self.assertListEqual(original.least_to_most_items(),
+                compact.least_to_most_items())
+        self.assertListEqual(list(original), list(compact))
+
+    def test_segmented(self):
+        original = SegmentedLruCache(32, 0.5)
+        compact = CompactSegmentedLruCache(32, 0.5)
+        self.run_ops(original, compact, ['set', 'get', 'peek', 'del',
+            'evict'])
+        # eviction order covers both segments
+        while len(original) > 0:
+            victim = original.victim_key()
+            self.assertEqual(victim, compact.victim_key())
+            del original[victim]
+            del compact[victim]
+        self.assertEqual(compact.victim_key(), None)
+
+
+class Test_LruBench(unittest.TestCase):
+    def test_benchmark(self):
+        result = lrulist_bench.benchmark(n_entries = 64, n_ops = 1000)
+        for name, kinds in result.items():
+            ops, size = kinds['original']
+            compact_ops, compact_size = kinds['compact']
+            self.assertTrue(ops > 0 and compact_ops > 0)
+            self.assertTrue(compact_size < size, name)
+
+
 def has_key(d, key):
     return d.has_key(key)
 
@@ -16,6 +16,29 @@ class TestNCQSingleQueue(unittest.TestCase):
         ncq.release_all_slots(held_slot_reqs)
 
 
+class TestHostBarrier(unittest.TestCase):
+    def test_wait(self):
+        env = simpy.Environment()
+        barrier = HostBarrier(3, env)
+        self.passed = []
+
+        for i in range(3):
+            env.process(self.host(env, barrier, i))
+        env.run()
+
+        # everyone waits for the slowest host, twice
+        self.assertListEqual(self.passed, [(2, 2), (2, 2), (2, 2),
+            (4, 4), (4, 4), (4, 4)])
+
+    def host(self, env, barrier, i):
+        yield env.timeout(i)
+        yield env.process(barrier.wait())
+        self.passed.append((env.now, 2))
+        yield env.timeout(2 - i)
+        yield env.process(barrier.wait())
+        self.passed.append((env.now, 4))
+
+
 class TestNCQSingleQueueWithWaitTime(unittest.TestCase):
     def test_holding_slots(self):
         env = simpy.Environment()
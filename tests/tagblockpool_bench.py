@@ -0,0 +1,66 @@
+"""
+Benchmark of block allocation in wiscsim.tagblockpool
+
+A MultiChannelBlockPool of n_blocks blocks is aged by moving a third of
+the blocks to TDATA. Then each step erases a random TDATA block (moves it
+back to TFREE) and allocates the least erased free block of a channel,
+like the FTL does when a current block fills up. Every 100th allocation
+picks the most erased block instead, as wear leveling does.
+
+Usage:
+    python -m tests.tagblockpool_bench [n_blocks] [n_steps] [n_channels]
+"""
+import random
+import resource
+import sys
+import time
+
+from wiscsim.devblockpool import MultiChannelBlockPool
+from wiscsim.tagblockpool import TFREE, LEAST_ERASED, MOST_ERASED
+
+TDATA = 'TDATA'
+
+
+def benchmark(n_blocks=2**20, n_steps=20000, n_channels=16):
+    """
+    Return {'build_secs', 'steps_per_sec', 'max_rss_mb'}
+    """
+    rand = random.Random(1)
+
+    start = time.time()
+    pool = MultiChannelBlockPool(n_channels=n_channels,
+            n_blocks_per_channel=n_blocks / n_channels,
+            n_pages_per_block=64, tags=[TDATA])
+    used = []
+    for i in range(n_blocks / 3):
+        used.append(pool.pick_and_move(TFREE, TDATA))
+    build_secs = time.time() - start
+
+    start = time.time()
+    for i in range(n_steps):
+        victim = used.pop(rand.randint(0, len(used) - 1))
+        pool.change_tag(victim, TDATA, TFREE)
+        if i % 100 == 0:
+            choice = MOST_ERASED
+        else:
+            choice = LEAST_ERASED
+        used.append(pool.pick_and_move(TFREE, TDATA, choice=choice))
+    steps_secs = max(time.time() - start, 1e-9)
+
+    return {
+        'build_secs': build_secs,
+        'steps_per_sec': n_steps / steps_secs,
+        'max_rss_mb': resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        }
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:]]
+    result = benchmark(*args)
+    for key in sorted(result):
+        print '{:<16}{:>14.2f}'.format(key, result[key])
+
+
+if __name__ == '__main__':
+    main()
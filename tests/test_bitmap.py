@@ -1,8 +1,9 @@
+import random
 import unittest
 
 import wiscsim
 from utilities import utils
-from wiscsim.bitmap import FlashBitmap2
+from wiscsim.bitmap import FlashBitmap2, BucketedFlashBitmap
 
 def create_config():
     conf = wiscsim.dftldes.Config()
@@ -27,8 +28,8 @@ def create_config():
 
     return conf
 
-def create_bitmap(conf):
-    bitmap = FlashBitmap2(conf)
+def create_bitmap(conf, bitmap_class=FlashBitmap2):
+    bitmap = bitmap_class(conf)
     return bitmap
 
 
@@ -67,6 +68,129 @@ class TestBitmap(unittest.TestCase):
         self.assertEqual(bitmap.block_valid_ratio(0),
                 1 - 1.0/conf.n_pages_per_block)
 
+    def test_invalidate_block(self):
+        conf = create_config()
+        bitmap = create_bitmap(conf)
+
+        bitmap.validate_block(1)
+        bitmap.invalidate_block(1)
+        self.assertEqual(bitmap.block_invalid_count(1),
+                conf.n_pages_per_block)
+        self.assertEqual(bitmap.block_valid_ratio(1), 0)
+        self.assertEqual(bitmap.block_erased_ratio(1), 0)
+
+
+class TestBlockCounters(unittest.TestCase):
+    bitmap_class = FlashBitmap2
+
+    def assert_counters(self, conf, bitmap, blocknum):
+        start, end = conf.block_to_page_range(blocknum)
+        states = [bitmap.page_state_human(ppn) for ppn in range(start, end)]
+        n_pages = float(conf.n_pages_per_block)
+
+        self.assertEqual(bitmap.block_valid_count(blocknum),
+                states.count('VALID'))
+        self.assertEqual(bitmap.block_invalid_count(blocknum),
+                states.count('INVALID'))
+        self.assertEqual(bitmap.block_erased_count(blocknum),
+                states.count('ERASED'))
+        self.assertEqual(bitmap.block_valid_ratio(blocknum),
+                states.count('VALID') / n_pages)
+        self.assertEqual(bitmap.block_invalid_ratio(blocknum),
+                (n_pages - states.count('VALID')) / n_pages)
+        self.assertEqual(bitmap.block_erased_ratio(blocknum),
+                states.count('ERASED') / n_pages)
+
+    def test_random_ops(self):
+        conf = create_config()
+        bitmap = create_bitmap(conf, self.bitmap_class)
+        rand = random.Random(1)
+        n_blocks = 4
+        n_pages = n_blocks * conf.n_pages_per_block
+
+        for i in range(2000):
+            op = rand.random()
+            ppn = rand.randint(0, n_pages - 1)
+            if op < 0.4:
+                bitmap.validate_page(ppn)
+            elif op < 0.8:
+                bitmap.invalidate_page(ppn)
+            elif op < 0.9:
+                end = min(ppn + rand.randint(1, 100), n_pages)
+                if rand.random() < 0.5:
+                    bitmap.validate_page_range(ppn, end)
+                else:
+                    bitmap.invalidate_page_range(ppn, end)
+            else:
+                bitmap.erase_block(rand.randint(0, n_blocks - 1))
+
+            if i % 100 == 0:
+                for blocknum in range(n_blocks):
+                    self.assert_counters(conf, bitmap, blocknum)
+
+        for blocknum in range(n_blocks):
+            self.assert_counters(conf, bitmap, blocknum)
+
+        bitmap.initialize()
+        for blocknum in range(n_blocks):
+            self.assertEqual(bitmap.block_erased_ratio(blocknum), 1)
+
+    def test_range_across_blocks(self):
+        conf = create_config()
+        bitmap = create_bitmap(conf, self.bitmap_class)
+        n = conf.n_pages_per_block
+
+        bitmap.validate_page_range(n - 2, 2 * n + 3)
+        self.assertEqual(bitmap.block_valid_count(0), 2)
+        self.assertEqual(bitmap.block_valid_count(1), n)
+        self.assertEqual(bitmap.block_valid_count(2), 3)
+
+        bitmap.invalidate_page_range(n - 1, n + 1)
+        self.assertEqual(bitmap.block_valid_count(0), 1)
+        self.assertEqual(bitmap.block_invalid_count(0), 1)
+        self.assertEqual(bitmap.block_valid_count(1), n - 1)
+        self.assertEqual(bitmap.block_invalid_count(1), 1)
+        self.assertTrue(bitmap.is_page_invalid(n))
+        self.assertTrue(bitmap.is_page_valid(n + 1))
+        self.assertTrue(bitmap.is_page_erased(2 * n + 3))
+
+
+class TestBucketedBlockCounters(TestBlockCounters):
+    bitmap_class = BucketedFlashBitmap
+
+    def assert_counters(self, conf, bitmap, blocknum):
+        super(TestBucketedBlockCounters, self).assert_counters(
+                conf, bitmap, blocknum)
+
+        n_pages = conf.n_pages_per_block
+        programmed = bitmap.block_erased_count(blocknum) < n_pages
+        for n_valid in range(n_pages + 1):
+            self.assertEqual(
+                    blocknum in bitmap.blocks_of_valid_count(n_valid),
+                    programmed and
+                    n_valid == bitmap.block_valid_count(blocknum))
+
+    def test_buckets(self):
+        conf = create_config()
+        bitmap = create_bitmap(conf, self.bitmap_class)
+        n = conf.n_pages_per_block
+
+        bitmap.validate_page_range(0, n)
+        bitmap.validate_page(n)
+        bitmap.invalidate_page(n)
+        bitmap.invalidate_page(2 * n)
+        self.assertEqual(bitmap.blocks_of_valid_count(n), set([0]))
+        self.assertEqual(bitmap.blocks_of_valid_count(0), set([1, 2]))
+        self.assertDictEqual(bitmap.valid_count_dist(), {0: 2, n: 1})
+
+        bitmap.invalidate_page(0)
+        bitmap.erase_block(2)
+        self.assertDictEqual(bitmap.valid_count_dist(),
+                {0: 1, n - 1: 1})
+
+        bitmap.initialize()
+        self.assertDictEqual(bitmap.valid_count_dist(), {})
+
 
 def main():
     unittest.main()
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyreuse.sysutils import blocktrace
+from commons import *
+
+
+RAW_PATH = "tests/testdata/blkparse-output.txt"
+COLUMNS = ['pid', 'action', 'operation', 'offset', 'size', 'timestamp',
+        'pre_wait_time', 'sync']
+
+
+class TestBlktraceResultChunked(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def parse(self, parser_class, do_sort, padding_bytes=0, columns=COLUMNS,
+            **kwargs):
+        out_path = os.path.join(self.tmpdir,
+                '{}-{}.txt'.format(parser_class.__name__, do_sort))
+        parser = parser_class(512, columns, RAW_PATH, out_path,
+                padding_bytes=padding_bytes, do_sort=do_sort, **kwargs)
+        parser.create_event_file()
+        with open(out_path) as f:
+            return parser, f.read()
+
+    def test_sorted_same_as_inmem(self):
+        for chunk_bytes in (1024, 16*MB):
+            _, expected = self.parse(blocktrace.BlktraceResultInMem, True,
+                    padding_bytes=8*MB)
+            _, result = self.parse(blocktrace.BlktraceResultChunked, True,
+                    padding_bytes=8*MB, chunk_bytes=chunk_bytes)
+            self.assertTrue(len(expected) > 0)
+            self.assertEqual(expected, result)
+
+    def test_unsorted_same_as_streaming(self):
+        _, expected = self.parse(blocktrace.BlktraceResult, False)
+        _, result = self.parse(blocktrace.BlktraceResultChunked, False,
+                chunk_bytes=1024)
+        self.assertEqual(expected, result)
+
+    def test_other_columns(self):
+        columns = ['devid', 'seqid', 'RWBS', 'sector_start', 'sector_count',
+                'type', 'unknown_column']
+        _, expected = self.parse(blocktrace.BlktraceResult, False,
+                columns=columns)
+        _, result = self.parse(blocktrace.BlktraceResultChunked, False,
+                columns=columns)
+        self.assertEqual(expected, result)
+
+    def test_bandwidth(self):
+        inmem, _ = self.parse(blocktrace.BlktraceResultInMem, True)
+        chunked, _ = self.parse(blocktrace.BlktraceResultChunked, True)
+
+        self.assertAlmostEqual(inmem.get_duration(), chunked.get_duration())
+        for op in ('read', 'write', 'discard'):
+            self.assertEqual(inmem.count_sectors(op),
+                    chunked.count_sectors(op))
+        self.assertAlmostEqual(inmem.get_bandwidth_mb('write'),
+                chunked.get_bandwidth_mb('write'))
+
+    def test_bandwidth_unsorted(self):
+        inmem, _ = self.parse(blocktrace.BlktraceResultInMem, True)
+        chunked, _ = self.parse(blocktrace.BlktraceResultChunked, False,
+                chunk_bytes=1024)
+
+        self.assertAlmostEqual(inmem.get_duration(), chunked.get_duration())
+        for op in ('read', 'write', 'discard'):
+            self.assertEqual(inmem.count_sectors(op),
+                    chunked.count_sectors(op))
+
+    def test_empty_trace(self):
+        raw_path = os.path.join(self.tmpdir, 'empty-blkparse.txt')
+        with open(raw_path, 'w') as f:
+            f.write('CPU0 (loop0):\n')
+        out_path = os.path.join(self.tmpdir, 'empty-events.txt')
+        parser = blocktrace.BlktraceResultChunked(512, COLUMNS, raw_path,
+                out_path)
+        parser.create_event_file()
+
+        self.assertEqual(os.path.getsize(out_path), 0)
+        self.assertEqual(parser.get_duration(), 0)
+        self.assertEqual(parser.count_sectors('write'), 0)
+        self.assertEqual(parser.get_bandwidth_mb('write'), 0)
+        # no run files are left
+        self.assertListEqual(sorted(os.listdir(self.tmpdir)),
+                ['empty-blkparse.txt', 'empty-events.txt'])
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
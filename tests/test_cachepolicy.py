@@ -0,0 +1,292 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from wiscsim import cachepolicy
+import wiscsim
+from utilities import utils
+from config import LBAGENERATOR
+from commons import *
+
+from test_dftldes import create_config, create_obj_set, create_mapping_cache
+from test_hostevent import create_text_event_file
+
+
+class TestKeyList(unittest.TestCase):
+    def test_ops(self):
+        keys = cachepolicy.KeyList()
+        self.assertEqual(len(keys), 0)
+        self.assertEqual(keys.front(), None)
+
+        keys.append(1)
+        keys.append(2)
+        keys.appendleft(0)
+        keys.insert_before(5, 2)
+        self.assertListEqual(list(keys), [0, 1, 5, 2])
+        self.assertTrue(5 in keys)
+        self.assertFalse(None in keys)
+
+        keys.move_to_back(1)
+        self.assertListEqual(list(keys), [0, 5, 2, 1])
+        self.assertEqual(keys.popleft(), 0)
+        self.assertEqual(keys.front(), 5)
+        self.assertEqual(keys.back(), 1)
+
+        for key in keys:
+            keys.remove(key)
+        self.assertEqual(len(keys), 0)
+
+
+class TestPolicies(unittest.TestCase):
+    n_entries_per_page = 4
+
+    def create_policy(self, name, n_rows):
+        conf = {'cache_replacement_policy': name}
+        return cachepolicy.create_policy(conf, n_rows)
+
+    def add(self, policy, rowid, lpn, as_least_recent = False):
+        policy.add(rowid, lpn, lpn / self.n_entries_per_page,
+                as_least_recent)
+
+    def evict(self, policy, avoid_m_vpns = ()):
+        rowid, _ = policy.victim(list(avoid_m_vpns))
+        policy.delete(rowid)
+        return rowid
+
+    def test_contract(self):
+        """
+        Victims are evictable rows outside avoid_m_vpns
+        """
+        for name in cachepolicy.POLICIES:
+            rand = random.Random(1)
+            n_rows = 32
+            policy = self.create_policy(name, n_rows)
+            free = range(n_rows)
+            cached = {}
+            discarded = set()
+            next_lpn = 0
+
+            for i in range(3000):
+                op = rand.random()
+                if op < 0.3 and len(free) > 0:
+                    rowid = free.pop()
+                    lpn = rand.choice([next_lpn, rand.randint(0, 200)])
+                    next_lpn += 1
+                    if lpn in cached.values():
+                        free.append(rowid)
+                        continue
+                    self.add(policy, rowid, lpn, rand.random() < 0.3)
+                    cached[rowid] = lpn
+                elif op < 0.5 and len(cached) > 0:
+                    policy.touch(rand.choice(cached.keys()))
+                elif op < 0.6 and len(cached) > len(discarded):
+                    rowid = rand.choice(cached.keys())
+                    if rowid not in discarded:
+                        policy.discard(rowid)
+                        discarded.add(rowid)
+                elif op < 0.7 and len(discarded) > 0:
+                    rowid = discarded.pop()
+                    policy.restore(rowid)
+                elif op < 0.8:
+                    m_vpn = rand.randint(0, 50)
+                    if rand.random() < 0.5:
+                        policy.page_dirtied(m_vpn)
+                    else:
+                        policy.page_cleaned(m_vpn)
+                else:
+                    avoid = rand.sample(range(51), 3)
+                    rowid, n_scanned = policy.victim(avoid)
+                    candidates = [r for r, lpn in cached.items()
+                            if r not in discarded and
+                            lpn / self.n_entries_per_page not in avoid]
+                    if rowid is None:
+                        self.assertListEqual(candidates, [], name)
+                    else:
+                        self.assertIn(rowid, candidates, name)
+                        self.assertTrue(n_scanned >= 1)
+                        policy.delete(rowid)
+                        del cached[rowid]
+                        free.append(rowid)
+
+    def test_lru(self):
+        policy = self.create_policy('lru', 8)
+        for rowid in range(4):
+            self.add(policy, rowid, rowid * 4)
+        policy.touch(0)
+        self.assertEqual(self.evict(policy), 1)
+        self.assertEqual(self.evict(policy, avoid_m_vpns = [2]), 3)
+
+    def test_slru(self):
+        policy = self.create_policy('slru', 8)
+        self.add(policy, 0, 0)
+        policy.touch(0)
+        # a scan of new rows does not evict the protected row
+        for rowid in range(1, 8):
+            self.add(policy, rowid, rowid * 4)
+        for rowid in range(1, 8):
+            self.assertEqual(self.evict(policy), rowid)
+        self.assertEqual(self.evict(policy), 0)
+
+    def test_clock(self):
+        policy = self.create_policy('clock', 8)
+        for rowid in range(3):
+            self.add(policy, rowid, rowid * 4)
+        # all referenced, the hand clears 0, 1, 2 and takes 0
+        self.assertEqual(self.evict(policy), 0)
+        policy.touch(1)
+        self.assertEqual(self.evict(policy), 2)
+        # the hand has cleared 1 again
+        self.add(policy, 3, 12)
+        self.assertEqual(self.evict(policy), 1)
+        # loaded, not asked for
+        self.add(policy, 4, 16, as_least_recent = True)
+        self.assertEqual(self.evict(policy), 4)
+
+    def test_2q(self):
+        policy = self.create_policy('2q', 8)
+        # kin = 2
+        for rowid in range(4):
+            self.add(policy, rowid, rowid * 4)
+        # A1in is too long, FIFO eviction even if 0 is hit
+        policy.touch(0)
+        self.assertEqual(self.evict(policy), 0)
+        # lpn 0 is in A1out, it goes to Am when cached again
+        self.add(policy, 0, 0)
+        self.assertEqual(self.evict(policy), 1)
+        # A1in is not longer than kin, Am is used
+        self.assertEqual(self.evict(policy), 0)
+        self.assertEqual(self.evict(policy), 2)
+
+    def test_arc(self):
+        policy = self.create_policy('arc', 4)
+        for rowid in range(4):
+            self.add(policy, rowid, rowid * 4)
+        policy.touch(3)
+        self.assertEqual(policy._p, 0)
+        # T1 is larger than p
+        self.assertEqual(self.evict(policy), 0)
+        # a ghost hit in B1 grows T1's target
+        self.add(policy, 0, 0)
+        self.assertEqual(policy._p, 1)
+        self.assertTrue(0 in policy._t2)
+
+    def test_tpage(self):
+        policy = self.create_policy('tpage', 16)
+        # pages 0, 1, 2 in recency order, page 0 is dirty
+        for rowid in range(12):
+            self.add(policy, rowid, rowid)
+        policy.page_dirtied(0)
+        policy.touch(4)
+
+        # clean pages first, least recent page first
+        self.assertEqual(self.evict(policy), 8)
+        self.assertEqual(self.evict(policy), 9)
+        self.assertEqual(self.evict(policy, avoid_m_vpns = [2]), 5)
+
+        # page 0 is written back, the rest of it is evicted next
+        policy.page_cleaned(0)
+        self.assertEqual(self.evict(policy), 0)
+
+
+class TestPoliciesInMappingCache(unittest.TestCase):
+    def run_random_accesses(self, policy, table_class):
+        # channels of new blocks are picked by the global random
+        random.seed(1)
+        conf = create_config()
+        conf['cache_replacement_policy'] = policy
+        conf['lpn_table_class'] = table_class
+        conf.n_cache_entries = conf.n_mapping_entries_per_page * 2
+        objs = create_obj_set(conf)
+        objs['rec'].enable()
+        mapping_cache = create_mapping_cache(objs)
+        env = objs['env']
+
+        def accesses():
+            rand = random.Random(7)
+            n_lpns = conf.n_mapping_entries_per_page * 6
+            for i in range(200):
+                lpn = rand.randint(0, n_lpns - 1)
+                if rand.random() < 0.5:
+                    yield env.process(mapping_cache.update(lpn, i))
+                else:
+                    yield env.process(mapping_cache.lpn_to_ppn(lpn))
+            yield env.process(mapping_cache.flush())
+
+        env.process(accesses())
+        env.run()
+        return env.now, objs['rec'].general_accumulator
+
+    def test_tables_agree(self):
+        for policy in ('slru', 'clock', '2q', 'arc', 'tpage'):
+            self.assertEqual(
+                    self.run_random_accesses(policy, 'LpnTableMvpn'),
+                    self.run_random_accesses(policy, 'ArrayLpnTable'),
+                    policy)
+
+
+class TestComparePolicies(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def create_config(self):
+        conf = wiscsim.dftldes.Config()
+        conf['SSDFramework']['ncq_depth'] = 2
+
+        conf['flash_config']['n_pages_per_block'] = 16
+        conf['flash_config']['n_blocks_per_plane'] = 2
+        conf['flash_config']['n_planes_per_chip'] = 1
+        conf['flash_config']['n_chips_per_package'] = 1
+        conf['flash_config']['n_packages_per_channel'] = 1
+        conf['flash_config']['n_channels_per_dev'] = 4
+
+        conf['do_not_check_gc_setting'] = True
+        conf.GC_high_threshold_ratio = 0.96
+        conf.GC_low_threshold_ratio = 0
+
+        utils.set_exp_metadata(conf, save_data = False,
+                expname = 'test_expname',
+                subexpname = 'test_subexpname')
+
+        conf['ftl_type'] = 'dftldes'
+        conf['simulator_class'] = 'SimulatorDESNew'
+
+        conf.n_cache_entries = conf.n_mapping_entries_per_page * 2
+        conf.set_flash_num_blocks_by_bytes(16 * MB)
+
+        utils.runtime_update(conf)
+
+        mkfs_path = os.path.join(self.tmpdir, 'events-mkfs.txt')
+        event_path = os.path.join(self.tmpdir, 'events.txt')
+        create_text_event_file(mkfs_path, 20)
+        create_text_event_file(event_path, 500)
+
+        conf["workload_src"] = LBAGENERATOR
+        conf["lba_workload_class"] = "BlktraceEvents"
+        conf['lba_workload_configs']['mkfs_event_path'] = mkfs_path
+        conf['lba_workload_configs']['ftlsim_event_path'] = event_path
+        conf['stop_sim_on_bytes'] = 'inf'
+        conf['do_gc_after_workload'] = False
+
+        return conf
+
+    def test_compare(self):
+        conf = self.create_config()
+        summaries = cachepolicy.compare_policies(conf, ['lru', 'tpage'])
+
+        self.assertEqual(set(summaries.keys()), set(['lru', 'tpage']))
+        for summary in summaries.values():
+            self.assertTrue(0 <= summary['hit_ratio'] <= 1)
+            self.assertEqual(summary['write_backs'],
+                    sum(summary['write_backs_by_reason'].values()))
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
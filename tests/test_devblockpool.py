@@ -44,7 +44,7 @@ class TestMultiChannelBlockPool(unittest.TestCase):
 
         pool.change_tag(0, src=TFREE, dst=TDATA)
         blocks = pool.get_blocks_of_tag(tag=TDATA)
-        self.assertListEqual(blocks, [0])
+        self.assertListEqual(list(blocks), [0])
 
     def test_change_tag_2(self):
         pool = MultiChannelBlockPool(
@@ -75,7 +75,7 @@ class TestMultiChannelBlockPool(unittest.TestCase):
         self.assertEqual(pool.count_blocks(tag=TDATA), 1)
 
         datablocks = pool.get_blocks_of_tag(TDATA)
-        self.assertListEqual(datablocks, [blocknum])
+        self.assertListEqual(list(datablocks), [blocknum])
 
     def test_pick(self):
         pool = MultiChannelBlockPool(
@@ -226,6 +226,74 @@ class TestMultiChannelBlockPool(unittest.TestCase):
 
         pool.remove_full_cur_blocks()
         self.assertEqual(len(pool.current_blocks()), 0)
+        for ppn in ppns:
+            self.assertFalse(pool.is_current_block(ppn / 32))
+
+    def test_is_current_block(self):
+        pool = MultiChannelBlockPool(
+                n_channels=8,
+                n_blocks_per_channel=64,
+                n_pages_per_block=32,
+                tags=[TDATA, TTRANS])
+
+        # fill the current block of channel 0 and start a new one
+        pool._next_channel = 0
+        ppns = pool.next_ppns(n=32+1, tag=TDATA, block_index=0,
+                stripe_size='infinity')
+        full_block = ppns[0] / 32
+        cur_block = ppns[-1] / 32
+        self.assertNotEqual(full_block, cur_block)
+
+        self.assertFalse(pool.is_current_block(full_block))
+        self.assertTrue(pool.is_current_block(cur_block))
+        self.assertListEqual(pool.current_blocks(), [cur_block])
+
+        ppns = pool.next_ppns(n=1, tag=TTRANS, block_index=0, stripe_size=1)
+        self.assertTrue(pool.is_current_block(ppns[0] / 32))
+        self.assertEqual(len(pool.current_blocks()), 2)
+
+    def test_blocks_of_tag_view(self):
+        pool = MultiChannelBlockPool(
+                n_channels=8,
+                n_blocks_per_channel=64,
+                n_pages_per_block=32,
+                tags=[TDATA, TTRANS])
+
+        datablocks = pool.get_blocks_of_tag(TDATA)
+        usedblocks = pool.get_blocks_of_tags((TDATA, TTRANS))
+        self.assertEqual(len(datablocks), 0)
+
+        blocks = [pool.pick_and_move(src=TFREE, dst=TDATA) for i in range(10)]
+        trans_block = pool.pick_and_move(src=TFREE, dst=TTRANS)
+
+        # the views are live
+        self.assertEqual(len(datablocks), 10)
+        self.assertEqual(len(usedblocks), 11)
+        self.assertItemsEqual(list(datablocks), blocks)
+        self.assertItemsEqual(list(usedblocks), blocks + [trans_block])
+        for block in blocks:
+            self.assertIn(block, datablocks)
+            self.assertNotIn(block, pool.get_blocks_of_tag(TFREE))
+        self.assertNotIn(trans_block, datablocks)
+        self.assertIn(trans_block, usedblocks)
+        self.assertNotIn(-1, datablocks)
+        self.assertNotIn(8*64, datablocks)
+        self.assertEqual(pool.get_tag(trans_block), TTRANS)
+
+        channel_id, _ = pool._global_to_channel(blocks[0])
+        channel_blocks = pool.get_blocks_of_tag(TDATA, channel_id=channel_id)
+        self.assertIn(blocks[0], channel_blocks)
+        self.assertTrue(all(block / 64 == channel_id
+            for block in channel_blocks))
+        other_blocks = pool.get_blocks_of_tag(TDATA,
+                channel_id=(channel_id + 1) % 8)
+        self.assertNotIn(blocks[0], other_blocks)
+
+        # tags can be changed while iterating
+        for block in datablocks:
+            pool.change_tag(block, src=TDATA, dst=TFREE)
+        self.assertEqual(len(datablocks), 0)
+        self.assertEqual(len(pool.get_blocks_of_tag(TFREE)), 8*64-1)
 
     def test_next_ppns_wrap_around(self):
         pool = MultiChannelBlockPool(
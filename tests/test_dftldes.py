@@ -1,3 +1,4 @@
+import os
 import unittest
 import random
 import simpy
@@ -8,7 +9,7 @@ from utilities import utils
 import wiscsim
 from wiscsim.ftlsim_commons import Extent
 from wiscsim.dftldes import LpnTable, LpnTableMvpn, UNINITIATED, \
-        split_ext_by_segment
+        split_ext_by_segment, ArrayLpnTable, FREE, USED
 from config import WLRUNNER, LBAGENERATOR, LBAMULTIPROC
 from commons import *
 from utilities.utils import get_expname
@@ -659,6 +660,174 @@ class TestMappingCacheSameLpnUpdate(unittest.TestCase):
         env.run()
 
 
+class TestMappingCacheBatch(unittest.TestCase):
+    def batch(self, conf, env, mapping_cache):
+        recorder = mapping_cache.recorder
+        recorder.enable()
+        n = conf.n_mapping_entries_per_page
+        lpns = range(n / 2, n * 2)
+
+        ppns = yield env.process(mapping_cache.lpns_to_ppns(lpns))
+        self.assertListEqual(ppns, [UNINITIATED] * len(lpns))
+        # one load per translation page
+        self.assertEqual(recorder.get_count_me('translation',
+            'read-trans-for-load'), 2)
+        self.assertEqual(recorder.get_count_me('Mapping_Cache', 'miss'), 2)
+        self.assertEqual(recorder.get_count_me('Mapping_Cache', 'hit'),
+                len(lpns) - 2)
+
+        mapping_dict = {lpn: lpn * 1000 for lpn in lpns}
+        yield env.process(mapping_cache.update_batch(mapping_dict))
+        self.assertEqual(recorder.get_count_me('translation',
+            'overwrite-in-cache'), len(lpns))
+
+        ppns = yield env.process(mapping_cache.lpns_to_ppns(lpns))
+        self.assertListEqual(ppns, [lpn * 1000 for lpn in lpns])
+        # the pages are loaded one after another
+        time_read_page = mapping_cache.flash.channels[0].read_time
+        self.assertEqual(env.now, 2 * time_read_page)
+
+    def test_batch(self):
+        conf = create_config()
+        conf.n_cache_entries = conf.n_mapping_entries_per_page * 4
+        objs = create_obj_set(conf)
+
+        mapping_cache = create_mapping_cache(objs)
+
+        env = objs['env']
+        env.process(self.batch(conf, env, mapping_cache))
+        env.run()
+
+    def test_group_by_m_vpn(self):
+        conf = create_config()
+        n = conf.n_mapping_entries_per_page
+        groups = wiscsim.dftldes.group_by_m_vpn(conf,
+                [(n - 1, 'a'), (n, 'b'), (n + 1, 'c'), (0, 'd')])
+        self.assertListEqual(groups, [(0, [(n - 1, 'a')]),
+            (1, [(n, 'b'), (n + 1, 'c')]), (0, [(0, 'd')])])
+
+
+class TestMappingCachePrefetch(unittest.TestCase):
+    def scan(self, conf, env, mapping_cache, m_vpns):
+        recorder = mapping_cache.recorder
+        recorder.enable()
+        for m_vpn in m_vpns:
+            ppns = yield env.process(
+                    mapping_cache.lpns_to_ppns(conf.m_vpn_to_lpns(m_vpn)))
+            self.assertListEqual(ppns,
+                    [UNINITIATED] * conf.n_mapping_entries_per_page)
+
+    def run_scan(self, m_vpns):
+        conf = create_config()
+        conf.n_cache_entries = conf.n_mapping_entries_per_page * 8
+        conf['trans_prefetch_pages'] = 2
+        objs = create_obj_set(conf)
+
+        mapping_cache = create_mapping_cache(objs)
+
+        env = objs['env']
+        env.process(self.scan(conf, env, mapping_cache, m_vpns))
+        env.run()
+
+        return objs['rec']
+
+    def test_sequential(self):
+        rec = self.run_scan(range(6))
+
+        # pages 0 and 1 start the stream
+        self.assertEqual(rec.get_count_me('Mapping_Cache', 'miss'), 2)
+        self.assertEqual(rec.get_count_me('prefetch', 'hit'), 4)
+        # pages 2 to 7 are prefetched
+        self.assertEqual(rec.get_count_me('prefetch', 'pages'), 6)
+        self.assertEqual(rec.get_count_me('translation',
+            'read-trans-for-prefetch'), 6)
+        self.assertEqual(rec.get_count_me('prefetch', 'wasted'), 0)
+
+    def test_random(self):
+        rec = self.run_scan([0, 5, 3, 9, 7])
+
+        self.assertEqual(rec.get_count_me('Mapping_Cache', 'miss'), 5)
+        self.assertEqual(rec.get_count_me('prefetch', 'pages'), 0)
+
+    def test_wasted(self):
+        # the stream stops, the cache is refilled by other pages
+        rec = self.run_scan([0, 1] + range(20, 40, 2))
+
+        self.assertEqual(rec.get_count_me('prefetch', 'pages'), 2)
+        self.assertEqual(rec.get_count_me('prefetch', 'hit'), 0)
+        self.assertEqual(rec.get_count_me('prefetch', 'wasted'), 2)
+
+
+class TestMappingCacheWriteBackDirtiest(unittest.TestCase):
+    def write_back(self, conf, env, mapping_cache):
+        recorder = mapping_cache.recorder
+        recorder.enable()
+        n = conf.n_mapping_entries_per_page
+        lpntable = mapping_cache._lpn_table
+
+        for lpn in [0, 1, 2, n]:
+            yield env.process(mapping_cache.update(lpn, lpn + 1))
+        self.assertEqual(mapping_cache.dirty_ratio(),
+                4.0 / conf.n_cache_entries)
+
+        yield env.process(mapping_cache.write_back_dirtiest(1))
+        self.assertEqual(recorder.get_count_me('translation',
+            'write-back-dirty-for-background'), 1)
+        self.assertEqual(lpntable.n_dirty_of_m_vpn(0), 0)
+        self.assertEqual(lpntable.n_dirty_of_m_vpn(1), 1)
+        self.assertEqual(lpntable.n_dirty_rows(), 1)
+
+        ppn = yield env.process(mapping_cache.lpn_to_ppn(2))
+        self.assertEqual(ppn, 3)
+
+    def test_write_back(self):
+        conf = create_config()
+        conf.n_cache_entries = conf.n_mapping_entries_per_page * 4
+        objs = create_obj_set(conf)
+
+        mapping_cache = create_mapping_cache(objs)
+
+        env = objs['env']
+        env.process(self.write_back(conf, env, mapping_cache))
+        env.run()
+
+    def write_back_no_quota(self, conf, env, mapping_cache):
+        recorder = mapping_cache.recorder
+        recorder.enable()
+        n = conf.n_mapping_entries_per_page
+        quota = mapping_cache._concurrent_trans_quota
+
+        for lpn in [0, n]:
+            yield env.process(mapping_cache.update(lpn, lpn + 1))
+
+        # foreground work holds all of the quota
+        level = quota.level
+        yield quota.get(level)
+        yield env.process(mapping_cache.write_back_dirtiest(2))
+        self.assertEqual(recorder.get_count_me('translation',
+            'write-back-dirty-for-background'), 0)
+        self.assertEqual(recorder.get_count_me('translation',
+            'background-write-back-no-quota'), 1)
+        self.assertEqual(mapping_cache._lpn_table.n_dirty_rows(), 2)
+        yield quota.put(level)
+
+        yield env.process(mapping_cache.write_back_dirtiest(2))
+        self.assertEqual(recorder.get_count_me('translation',
+            'write-back-dirty-for-background'), 2)
+        self.assertEqual(quota.level, level)
+
+    def test_no_quota(self):
+        conf = create_config()
+        conf.n_cache_entries = conf.n_mapping_entries_per_page * 4
+        objs = create_obj_set(conf)
+
+        mapping_cache = create_mapping_cache(objs)
+
+        env = objs['env']
+        env.process(self.write_back_no_quota(conf, env, mapping_cache))
+        env.run()
+
+
 @unittest.skipUnless(TESTALL == True, "Skip unless we want to test all")
 class TestMappingCacheSameLpnUpdateWEvict(unittest.TestCase):
     def translate(self, conf, env, mapping_cache):
@@ -976,6 +1145,11 @@ class TestSplit(unittest.TestCase):
         self.assertEqual(result[1].lpn_start, n)
         self.assertEqual(result[1].end_lpn(), n + 1)
 
+    def test_ppn_ranges(self):
+        ranges = wiscsim.dftldes.ppn_ranges([3, 4, 5, 9, 1, 2, 10])
+        self.assertListEqual(list(ranges), [(3, 6), (9, 10), (1, 3), (10, 11)])
+        self.assertListEqual(list(wiscsim.dftldes.ppn_ranges([])), [])
+
 
 class TestDiscard(unittest.TestCase):
     def test_discard(self):
@@ -1017,9 +1191,48 @@ class TestDiscard(unittest.TestCase):
         self.assertEqual(env.now, 2 * time_read_page + time_program_page)
 
 
+class TestOutOfBandAreas(unittest.TestCase):
+    def test_relocate_data_pages(self):
+        conf = create_config()
+        oob = create_oob(conf)
+        n = conf.n_pages_per_block
+
+        lpns = range(5)
+        oob.relocate_data_pages(lpns, [UNINITIATED] * 5,
+                [n - 2, n - 1, n, 7, 8])
+        self.assertListEqual([oob.ppn_to_lpn_or_mvpn(ppn)
+            for ppn in [n - 2, n - 1, n, 7, 8]], lpns)
+        self.assertListEqual([oob.timestamp_table[ppn]
+            for ppn in [n - 2, n - 1, n, 7, 8]], range(5))
+        self.assertEqual(oob.states.block_valid_count(0), 4)
+        self.assertEqual(oob.states.block_valid_count(1), 1)
+
+        # the new copies of lpns 0 and 1 are in block 1
+        oob.relocate_data_pages([0, 1], [n - 2, n - 1], [n + 1, n + 2])
+        self.assertEqual(oob.states.block_valid_count(0), 2)
+        self.assertEqual(oob.states.block_invalid_count(0), 2)
+        self.assertTrue(oob.last_inv_time_of_block.has_key(0))
+        self.assertFalse(oob.last_inv_time_of_block.has_key(1))
+
+        lpns_of_block = oob.lpns_of_block(0)
+        self.assertListEqual(lpns_of_block[7:9], [3, 4])
+        self.assertListEqual(lpns_of_block[n - 2:], [0, 1])
+        self.assertEqual(lpns_of_block[0], 'NA')
+
+        oob.erase_block(0)
+        self.assertListEqual(oob.lpns_of_block(0), ['NA'] * n)
+        self.assertFalse(oob.last_inv_time_of_block.has_key(0))
+        with self.assertRaises(KeyError):
+            oob.timestamp_table[7]
+        self.assertEqual(oob.states.block_erased_ratio(0), 1)
+
+
 class TestLpnTable(unittest.TestCase):
+    def create_table(self, n_rows):
+        return LpnTable(n_rows)
+
     def test_init(self):
-        table = LpnTable(8)
+        table = self.create_table(8)
         self.assertEqual(table.n_free_rows(), 8)
         self.assertEqual(table.n_locked_free_rows(), 0)
         self.assertEqual(table.n_used_rows(), 0)
@@ -1028,7 +1241,7 @@ class TestLpnTable(unittest.TestCase):
         """
         lock before adding, also you need to tell it which row you add to
         """
-        table = LpnTable(8)
+        table = self.create_table(8)
 
         rowid = table.lock_free_row()
         self.assertEqual(table.n_free_rows(), 7)
@@ -1062,7 +1275,7 @@ class TestLpnTable(unittest.TestCase):
         self.assertEqual(table.n_used_rows(), 0)
 
     def test_boundaries(self):
-        table = LpnTable(8)
+        table = self.create_table(8)
 
         for i in range(8):
             table.lock_free_row()
@@ -1070,7 +1283,7 @@ class TestLpnTable(unittest.TestCase):
         self.assertEqual(table.lock_free_row(), None)
 
     def test_multiple_adds(self):
-        table = LpnTable(8)
+        table = self.create_table(8)
 
         locked_rows = table.lock_free_rows(3)
         self.assertEqual(len(locked_rows), 3)
@@ -1086,7 +1299,7 @@ class TestLpnTable(unittest.TestCase):
         self.assertEqual(table.lpn_to_ppn(3), 33)
 
     def test_locking_lpn(self):
-        table = LpnTable(8)
+        table = self.create_table(8)
 
         locked_rows = table.lock_free_rows(3)
         self.assertEqual(len(locked_rows), 3)
@@ -1101,6 +1314,205 @@ class TestLpnTable(unittest.TestCase):
         self.assertEqual(table.n_locked_used_rows(), 1)
 
 
+class TestArrayLpnTable(TestLpnTable):
+    def create_table(self, n_rows):
+        conf = create_config()
+        conf.n_cache_entries = n_rows
+        return ArrayLpnTable(conf)
+
+    def test_recency(self):
+        table = self.create_table(8)
+        rows = table.lock_free_rows(4)
+        table.add_lpns(rows[:3], {1:11, 2:22, 3:33}, False)
+        table.add_lpn(rows[3], 4, UNINITIATED, True, as_least_recent=True)
+        table.lpn_to_ppn(1)
+
+        lpns = [lpn for lpn, _ in table.least_to_most_lpn_items()]
+        self.assertEqual(lpns[0], 4)
+        self.assertEqual(lpns[-1], 1)
+        self.assertEqual(table.lpn_to_ppn(4), UNINITIATED)
+
+        # deleting while iterating, like MappingCache.drop()
+        for lpn, row in table.least_to_most_lpn_items():
+            table.delete_lpn_and_lock(lpn)
+            row.state = FREE
+        self.assertEqual(table.n_free_rows(), 8)
+        self.assertListEqual(table.lock_free_rows(2), [0, 1])
+
+    def test_same_as_lpntable(self):
+        """
+        Both tables give the same results for the same workload
+        """
+        results = []
+        for table_class in ('LpnTableMvpn', 'ArrayLpnTable'):
+            # the block pool picks its first channel with the global random
+            random.seed(1)
+            conf = create_config()
+            conf['lpn_table_class'] = table_class
+            conf.n_cache_entries = conf.n_mapping_entries_per_page * 2
+            objs = create_obj_set(conf)
+            objs['rec'].enable()
+            mapping_cache = create_mapping_cache(objs)
+            env = objs['env']
+            env.process(self.random_accesses(conf, env, mapping_cache))
+            env.run()
+            results.append((env.now, objs['rec'].general_accumulator))
+        self.assertEqual(results[0], results[1])
+
+    def random_accesses(self, conf, env, mapping_cache):
+        rand = random.Random(7)
+        n_lpns = conf.n_mapping_entries_per_page * 6
+        for i in range(1000):
+            lpn = rand.randint(0, n_lpns - 1)
+            if rand.random() < 0.5:
+                yield env.process(mapping_cache.update(lpn, i))
+            else:
+                yield env.process(mapping_cache.lpn_to_ppn(lpn))
+        yield env.process(mapping_cache.flush())
+        mapping_cache.drop()
+
+
+class TestLpnTableMvpn(unittest.TestCase):
+    def create_table(self, conf):
+        return LpnTableMvpn(conf)
+
+    def test_m_vpn_index(self):
+        conf = create_config()
+        conf.n_cache_entries = conf.n_mapping_entries_per_page * 2
+        n_entries = conf.n_mapping_entries_per_page
+        table = self.create_table(conf)
+
+        self.assertEqual(table.needed_space_for_m_vpn(1), n_entries)
+        self.assertEqual(table.n_dirty_of_m_vpn(1), 0)
+
+        lpn1, lpn2, lpn3 = n_entries, n_entries + 1, 3 * n_entries
+        rows = table.lock_free_rows(3)
+        table.add_lpn(rows[0], lpn1, 11, dirty = True)
+        table.add_lpn(rows[1], lpn2, 22, dirty = False)
+        table.add_lpn(rows[2], lpn3, 33, dirty = True)
+
+        self.assertEqual(table.needed_space_for_m_vpn(1), n_entries - 2)
+        self.assertEqual(table.n_dirty_of_m_vpn(1), 1)
+        self.assertEqual(table.n_dirty_of_m_vpn(3), 1)
+        self.assertDictEqual(table.get_m_vpn_mappings(1),
+                {lpn1: 11, lpn2: 22})
+        self.assertListEqual(table.row_ids_of_m_vpn(1), rows[:2])
+
+        table.overwrite_lpn(lpn2, 23, dirty = True)
+        self.assertEqual(table.n_dirty_of_m_vpn(1), 2)
+        table.mark_clean_multiple([lpn1, lpn2])
+        self.assertEqual(table.n_dirty_of_m_vpn(1), 0)
+        table.overwrite_lpn(lpn1, 12, dirty = True)
+        self.assertEqual(table.n_dirty_of_m_vpn(1), 1)
+
+        table.delete_lpn_and_lock(lpn1)
+        self.assertEqual(table.n_dirty_of_m_vpn(1), 0)
+        self.assertDictEqual(table.get_m_vpn_mappings(1), {lpn2: 23})
+        table.delete_lpn_and_lock(lpn2)
+        self.assertEqual(table.needed_space_for_m_vpn(1), n_entries)
+        self.assertDictEqual(table.get_m_vpn_mappings(1), {})
+        self.assertEqual(table.n_dirty_of_m_vpn(3), 1)
+
+
+    def test_victim_row(self):
+        """
+        victim_row() finds what a scan from the least recent row finds
+        """
+        conf = create_config()
+        n_entries = conf.n_mapping_entries_per_page
+        conf.n_cache_entries = 64
+        table = self.create_table(conf)
+        rand = random.Random(3)
+        held = set()
+
+        for i in range(2000):
+            op = rand.random()
+            cached = [lpn for lpn, _ in table.least_to_most_lpn_items()]
+            if op < 0.3 and table.n_free_rows() > 0:
+                lpn = rand.randint(0, 8 * n_entries - 1)
+                if not table.has_lpn(lpn):
+                    rowid = table.lock_free_row()
+                    table.add_lpn(rowid, lpn, i, dirty = False,
+                            as_least_recent = rand.random() < 0.5)
+            elif op < 0.6 and len(cached) > 0:
+                table.lpn_to_ppn(rand.choice(cached))
+            elif op < 0.7 and len(cached) > 0:
+                table.overwrite_lpn(rand.choice(cached), i, dirty = True)
+            elif op < 0.8:
+                row, _ = table.victim_row([])
+                if row is not None:
+                    table.hold_used_row(row.rowid)
+                    held.add(row.rowid)
+            elif op < 0.9 and len(held) > 0:
+                rowid = held.pop()
+                table.unhold_used_row(rowid)
+            else:
+                row, _ = table.victim_row([])
+                if row is not None:
+                    rowid = table.delete_lpn_and_lock(row.lpn)
+                    table.unlock_free_row(rowid)
+
+            avoid_m_vpns = rand.sample(range(8), rand.randint(0, 3))
+            expected = None
+            for lpn, row in table.least_to_most_lpn_items():
+                if row.state == USED and \
+                        conf.lpn_to_m_vpn(lpn) not in avoid_m_vpns:
+                    expected = row.rowid
+                    break
+            row, _ = table.victim_row(avoid_m_vpns)
+            self.assertEqual(None if row is None else row.rowid, expected)
+
+
+class TestArrayLpnTableMvpn(TestLpnTableMvpn):
+    def create_table(self, conf):
+        return ArrayLpnTable(conf)
+
+
+class TestMappingOnFlash(unittest.TestCase):
+    def test_pages(self):
+        conf = create_config()
+        n = conf.n_mapping_entries_per_page
+        gmt = create_mapping_on_flash(conf)
+
+        self.assertEqual(gmt.lpn_to_ppn(n + 1), UNINITIATED)
+        gmt.update(n + 1, 7)
+        gmt.batch_update({n + 2: 8, 0: 9})
+        self.assertEqual(gmt.lpns_to_ppns([0, n + 1]), {0: 9, n + 1: 7})
+
+        page = gmt.read_page(1)
+        self.assertEqual(len(page), n)
+        self.assertListEqual(
+                [wiscsim.dftldes.decode_ppn(v) for v in page[:4]],
+                [UNINITIATED, 7, 8, UNINITIATED])
+
+        # the page is a copy
+        page[0] = 10
+        self.assertEqual(gmt.lpn_to_ppn(n), UNINITIATED)
+        gmt.write_page(1, page)
+        self.assertEqual(gmt.lpn_to_ppn(n), 10)
+        self.assertEqual(gmt.lpn_to_ppn(n + 2), 8)
+
+    def test_directory(self):
+        conf = create_config()
+        oob = create_oob(conf)
+        block_pool = create_blockpool(conf)
+        directory = create_translation_directory(conf, oob, block_pool)
+
+        m_ppn = directory.m_vpn_to_m_ppn(3)
+        self.assertEqual(directory.mapping[3], m_ppn)
+        self.assertEqual(len(directory.mapping),
+                conf.total_translation_pages())
+        with self.assertRaises(RuntimeError):
+            directory.add_mapping(3, 100)
+
+        directory.remove_mapping(3)
+        with self.assertRaises(KeyError):
+            directory.m_vpn_to_m_ppn(3)
+        directory.add_mapping(3, 100)
+        self.assertEqual(directory.lpn_to_m_ppn(
+            3 * conf.n_mapping_entries_per_page), 100)
+
+
 class TestLockPool(unittest.TestCase):
     def access_vpn(self, env, respool, vpn):
         req = respool.get_request(vpn)
@@ -1241,6 +1653,23 @@ class TestFTLwithMoreData(unittest.TestCase):
         self.my_run()
 
 
+class TestBackgroundTransFlush(TestFTLwithMoreData):
+    def setup_ftl(self):
+        super(TestBackgroundTransFlush, self).setup_ftl()
+        self.conf['trans_flush_interval'] = 100 * MICROSEC
+        self.conf['trans_flush_dirty_ratio'] = 0.1
+
+    def test_main(self):
+        super(TestBackgroundTransFlush, self).test_main()
+
+        result = utils.load_json(os.path.join(self.conf['result_dir'],
+            'recorder.json'))
+        summary = wiscsim.cachepolicy.translation_summary(
+                result['general_accumulator'])
+        self.assertTrue(summary['background_write_backs'] > 0)
+        self.assertTrue(summary['mean_latency']['write'] > 0)
+
+
 class TestTranslationWithWrite(unittest.TestCase):
     def test(self):
         conf = create_config()
@@ -1576,6 +2005,42 @@ class TestVictimBlocks(unittest.TestCase):
 
         self.assertListEqual(victims, [block1, block0, block2])
 
+    def test_pick_and_count(self):
+        conf = create_config()
+        conf['flash_config']['n_channels_per_dev'] = 1
+        conf['stripe_size'] = 'infinity'
+        conf['max_victim_valid_ratio'] = 0.5
+        block_pool = create_blockpool(conf)
+        oob = create_oob(conf)
+        vbs = wiscsim.dftldes.VictimBlocks(conf, block_pool, oob)
+
+        # blocks with 3, 1, n-1 and 1 valid pages
+        n = conf.n_pages_per_block
+        blocks = []
+        for n_valid in (3, 1, n - 1, 1):
+            ppns = block_pool.next_n_data_pages_to_program_striped(n)
+            oob.validate_ppns(ppns)
+            oob.invalidate_ppns(ppns[n_valid:])
+            blocks.append(conf.page_to_block_off(ppns[0])[0])
+
+        # the current block is not a candidate
+        ppns = block_pool.next_n_data_pages_to_program_striped(1)
+        oob.validate_ppns(ppns)
+
+        self.assertEqual(vbs.count_candidates(), 3)
+        victims = vbs.pick(2)
+        self.assertListEqual(victims, [
+            (1.0 / n, vbs.TYPE_DATA, min(blocks[1], blocks[3])),
+            (1.0 / n, vbs.TYPE_DATA, max(blocks[1], blocks[3]))])
+
+        # picks follow the changes of valid pages
+        oob.invalidate_ppns([conf.block_off_to_page(blocks[0], 0)])
+        oob.erase_block(blocks[1])
+        block_pool.move_used_data_block_to_free(blocks[1])
+        self.assertEqual(vbs.count_candidates(), 2)
+        self.assertListEqual([block for _, _, block in vbs.pick(3)],
+                [blocks[3], blocks[0]])
+
     def test_valid_ratio_stats(self):
         vbs = create_victimblocks()
         conf = vbs._conf
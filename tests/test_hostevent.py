@@ -0,0 +1,452 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import wiscsim
+from wiscsim import hostevent, tracecompress
+from wiscsim.simulator import as_event_iter
+from pyreuse.sysutils import blocktrace
+from workrunner.nonblockingreader import FollowFileIterator
+from config import ConfigNCQFTL, LBAGENERATOR
+from utilities import utils
+from workflow import Workflow
+from commons import *
+
+
+def create_text_event_file(path, n_events):
+    ops = ['read', 'write', 'discard']
+    with open(path, 'w') as f:
+        timestamp = 0.0
+        for i in range(n_events):
+            pre_wait_time = 0.000125 * (i % 7)
+            timestamp += pre_wait_time
+            action = 'D' if i % 5 != 0 else 'C'
+            line = ' '.join([str(100 + i % 3), action, ops[i % 3],
+                str((i * 8192) % (4 * MB)), str(4096 * (1 + i % 4)),
+                repr(timestamp), repr(pre_wait_time), str(i % 2 == 0)])
+            f.write(line + '\n')
+
+
+class TestEvent(unittest.TestCase):
+    def test_no_dict(self):
+        event = hostevent.Event(512, 0, OP_WRITE, 4096, 8192)
+        self.assertFalse(hasattr(event, '__dict__'))
+        self.assertFalse(hasattr(
+            hostevent.ControlEvent(OP_ENABLE_RECORDER), '__dict__'))
+
+        # SimulatorDESSync attaches tokens
+        event.token = 'token'
+        event.token_req = 'req'
+        with self.assertRaises(AttributeError):
+            event.foo = 1
+
+    def test_lpn_extent(self):
+        conf = ConfigNCQFTL()
+        event = hostevent.Event(512, 0, OP_WRITE, 3072, 2048)
+        extent = event.get_lpn_extent(conf)
+        self.assertEqual((extent.lpn_start, extent.lpn_count), (1, 1))
+        self.assertIs(event.get_lpn_extent(conf), extent)
+
+        conf['flash_config']['page_size'] = 1024
+        extent = event.get_lpn_extent(conf)
+        self.assertEqual((extent.lpn_start, extent.lpn_count), (3, 2))
+
+        event.offset += 1024
+        extent = event.get_lpn_extent(conf)
+        self.assertEqual((extent.lpn_start, extent.lpn_count), (4, 2))
+
+    def test_from_row(self):
+        event = hostevent.Event(512, 3, OP_READ, 4096, 1024,
+                timestamp = 0.5, pre_wait_time = 0.1, sync = False)
+        fast = hostevent.Event.from_row(512, 3, OP_READ, 4096, 1024, 0.5,
+                0.1, False, 'D')
+        for name in hostevent.Event.__slots__:
+            if not name.startswith('token'):
+                self.assertEqual(getattr(event, name), getattr(fast, name))
+
+
+class TestBinaryEventFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.conf = ConfigNCQFTL()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assert_same_events(self, text_events, bin_events):
+        self.assertEqual(len(text_events), len(bin_events))
+        for t, b in zip(text_events, bin_events):
+            self.assertEqual(t.pid, b.pid)
+            self.assertEqual(t.action, b.action)
+            self.assertEqual(t.operation, b.operation)
+            self.assertEqual(t.offset, b.offset)
+            self.assertEqual(t.size, b.size)
+            self.assertEqual(t.sector, b.sector)
+            self.assertEqual(t.sector_count, b.sector_count)
+            self.assertEqual(float(t.timestamp), float(b.timestamp))
+            self.assertEqual(t.pre_wait_time, b.pre_wait_time)
+            self.assertEqual(t.sync, b.sync)
+
+    def test_convert(self):
+        text_path = os.path.join(self.tmpdir, 'events.txt')
+        bin_path = os.path.join(self.tmpdir, 'events.bin')
+        create_text_event_file(text_path, 1000)
+
+        n = hostevent.convert_event_file_to_binary(self.conf, text_path,
+                bin_path)
+        self.assertEqual(n, 1000)
+        self.assertTrue(hostevent.is_binary_event_file(bin_path))
+        self.assertFalse(hostevent.is_binary_event_file(text_path))
+
+        text_events = list(hostevent.EventIterator(self.conf,
+            hostevent.FileLineIterator(text_path)))
+        bin_iter = hostevent.MmapEventIterator(self.conf, bin_path,
+                chunk_events=64)
+        self.assertEqual(len(bin_iter), 1000)
+        self.assert_same_events(text_events, list(bin_iter))
+
+    def test_testdata_with_na(self):
+        text_path = "tests/testdata/blkparse-events-for-ftlsim.txt"
+        bin_path = os.path.join(self.tmpdir, 'events.bin')
+        hostevent.convert_event_file_to_binary(self.conf, text_path, bin_path)
+
+        text_events = list(hostevent.create_event_iterator(self.conf,
+            text_path))
+        bin_events = list(hostevent.create_event_iterator(self.conf,
+            bin_path))
+        self.assert_same_events(text_events, bin_events)
+        # blkparse timestamps come back as the same text
+        self.assertListEqual([e.timestamp for e in text_events],
+                [hostevent.timestamp_to_str(e.timestamp)
+                    for e in bin_events])
+
+    def test_na_timestamp(self):
+        text_path = os.path.join(self.tmpdir, 'events.txt')
+        bin_path = os.path.join(self.tmpdir, 'events.bin')
+        with open(text_path, 'w') as f:
+            f.write('100 D write 4096 4096 NA NA True\n')
+            f.write('100 D read 0 4096 0.1 NA False\n')
+        hostevent.convert_event_file_to_binary(self.conf, text_path, bin_path)
+
+        events = list(hostevent.create_event_iterator(self.conf, bin_path))
+        self.assertListEqual([(e.timestamp, e.pre_wait_time, e.sync)
+            for e in events],
+            [('NA', 'NA', 'True'), (0.1, 'NA', 'False')])
+        self.assertEqual(hostevent.timestamp_to_str(events[1].timestamp),
+                '0.100000000')
+        self.assertEqual(hostevent.timestamp_to_str(0.1 + 1e-12),
+                repr(0.1 + 1e-12))
+
+    def test_empty(self):
+        text_path = os.path.join(self.tmpdir, 'events.txt')
+        bin_path = os.path.join(self.tmpdir, 'events.bin')
+        create_text_event_file(text_path, 0)
+
+        hostevent.convert_event_file_to_binary(self.conf, text_path, bin_path)
+        self.assertListEqual(
+            list(hostevent.create_event_iterator(self.conf, bin_path)), [])
+        # the per-column spill files are cleaned up
+        self.assertListEqual(sorted(os.listdir(self.tmpdir)),
+                ['events.bin', 'events.txt'])
+
+    def test_simulator_accepts_path(self):
+        text_path = os.path.join(self.tmpdir, 'events.txt')
+        bin_path = os.path.join(self.tmpdir, 'events.bin')
+        create_text_event_file(text_path, 10)
+        hostevent.convert_event_file_to_binary(self.conf, text_path, bin_path)
+
+        self.assertIsInstance(as_event_iter(self.conf, bin_path),
+                hostevent.MmapEventIterator)
+        self.assertIsInstance(as_event_iter(self.conf, text_path),
+                hostevent.EventIterator)
+
+
+class TestSimulateBinaryEventFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def create_config(self):
+        conf = wiscsim.dftldes.Config()
+        conf['SSDFramework']['ncq_depth'] = 2
+
+        conf['flash_config']['n_pages_per_block'] = 64
+        conf['flash_config']['n_blocks_per_plane'] = 2
+        conf['flash_config']['n_planes_per_chip'] = 1
+        conf['flash_config']['n_chips_per_package'] = 1
+        conf['flash_config']['n_packages_per_channel'] = 1
+        conf['flash_config']['n_channels_per_dev'] = 4
+
+        conf['do_not_check_gc_setting'] = True
+        conf.GC_high_threshold_ratio = 0.96
+        conf.GC_low_threshold_ratio = 0
+
+        utils.set_exp_metadata(conf, save_data = False,
+                expname = 'test_expname',
+                subexpname = 'test_subexpname')
+
+        conf['ftl_type'] = 'dftldes'
+        conf['simulator_class'] = 'SimulatorDESNew'
+
+        logicsize_mb = 16
+        conf.n_cache_entries = conf.n_mapping_entries_per_page * 16
+        conf.set_flash_num_blocks_by_bytes(int(logicsize_mb * 2**20 * 1.28))
+
+        utils.runtime_update(conf)
+
+        return conf
+
+    def run_events(self, conf, mkfs_path, event_path):
+        conf["workload_src"] = LBAGENERATOR
+        conf["lba_workload_class"] = "BlktraceEvents"
+        conf['lba_workload_configs']['mkfs_event_path'] = mkfs_path
+        conf['lba_workload_configs']['ftlsim_event_path'] = event_path
+        conf['stop_sim_on_bytes'] = 'inf'
+        conf['do_gc_after_workload'] = False
+
+        wf = Workflow(conf)
+        wf.run()
+
+        return wf
+
+    def test_text_and_binary(self):
+        conf = self.create_config()
+        text_path = os.path.join(self.tmpdir, 'events.txt')
+        mkfs_path = os.path.join(self.tmpdir, 'events-mkfs.txt')
+        bin_path = os.path.join(self.tmpdir, 'events.bin')
+        mkfs_bin_path = os.path.join(self.tmpdir, 'events-mkfs.bin')
+        create_text_event_file(text_path, 200)
+        create_text_event_file(mkfs_path, 20)
+        hostevent.convert_event_file_to_binary(conf, text_path, bin_path)
+        hostevent.convert_event_file_to_binary(conf, mkfs_path, mkfs_bin_path)
+
+        self.run_events(conf, mkfs_path, text_path)
+        text_result = utils.load_json(
+                os.path.join(conf['result_dir'], 'recorder.json'))
+
+        conf = self.create_config()
+        self.run_events(conf, mkfs_bin_path, bin_path)
+        bin_result = utils.load_json(
+                os.path.join(conf['result_dir'], 'recorder.json'))
+
+        self.assertEqual(text_result['general_accumulator']['traffic'],
+                bin_result['general_accumulator']['traffic'])
+        self.assertEqual(text_result['general_accumulator']['flash_ops'],
+                bin_result['general_accumulator']['flash_ops'])
+
+
+def replay_blkparse_output(src_path, dst_path, done_event, lines_per_write=50):
+    """
+    Stand-in for blkparse: append the lines of src_path to dst_path bit by
+    bit, then set done_event.
+    """
+    with open(src_path) as f:
+        lines = f.readlines()
+    with open(dst_path, 'w') as out:
+        for i in range(0, len(lines), lines_per_write):
+            data = ''.join(lines[i:i+lines_per_write])
+            # leave a partial line behind sometimes
+            out.write(data[:-3])
+            out.flush()
+            time.sleep(0.001)
+            out.write(data[-3:])
+            out.flush()
+    done_event.set()
+
+
+class TestBlkparseEventIterator(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.conf = ConfigNCQFTL()
+        self.raw_path = "tests/testdata/blkparse-output.txt"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def expected_events(self, padding_bytes):
+        event_path = os.path.join(self.tmpdir, 'events.txt')
+        parser = blocktrace.BlktraceResult(self.conf['sector_size'],
+                self.conf['event_file_column_names'],
+                self.raw_path, event_path, padding_bytes=padding_bytes,
+                do_sort=False)
+        parser.create_event_file()
+        return list(hostevent.create_event_iterator(self.conf, event_path))
+
+    def assert_same_events(self, expected, events):
+        self.assertTrue(len(expected) > 0)
+        self.assertEqual(len(expected), len(events))
+        for e, b in zip(expected, events):
+            self.assertEqual(
+                    (e.pid, e.action, e.operation, e.offset, e.size,
+                        e.timestamp, e.sync),
+                    (b.pid, b.action, b.operation, b.offset, b.size,
+                        b.timestamp, b.sync))
+            self.assertTrue(b.pre_wait_time >= 0)
+
+    def test_file(self):
+        events = list(hostevent.BlkparseEventIterator(self.conf,
+            hostevent.FileLineIterator(self.raw_path), padding_bytes=8*MB))
+        self.assert_same_events(self.expected_events(8*MB), events)
+        self.assertEqual(events[0].pre_wait_time, 0)
+
+    def test_growing_file(self):
+        growing_path = os.path.join(self.tmpdir, 'blkparse-output.txt')
+        done = threading.Event()
+        t = threading.Thread(target=replay_blkparse_output,
+                args=(self.raw_path, growing_path, done))
+        t.start()
+
+        events = list(hostevent.BlkparseEventIterator(self.conf,
+            FollowFileIterator(growing_path, done, poll_interval=0.001)))
+        t.join()
+        self.assert_same_events(self.expected_events(0), events)
+
+
+class TestEventIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.conf = ConfigNCQFTL()
+
+        self.text_path = os.path.join(self.tmpdir, 'events.txt')
+        blocktrace.BlktraceResultChunked(self.conf['sector_size'],
+                self.conf['event_file_column_names'],
+                "tests/testdata/blkparse-output.txt",
+                self.text_path).create_event_file()
+        self.bin_path = os.path.join(self.tmpdir, 'events.bin')
+        hostevent.convert_event_file_to_binary(self.conf, self.text_path,
+                self.bin_path)
+        self.gz_path = os.path.join(self.tmpdir, 'events.gz')
+        tracecompress.compress_file(self.text_path, self.gz_path,
+                lines_per_block=30)
+
+        self.all_events = [self.event_key(e) for e in
+                hostevent.create_event_iterator(self.conf, self.text_path)]
+        self.timestamps = [float(e.timestamp) for e in
+                hostevent.create_event_iterator(self.conf, self.text_path)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def event_key(self, e):
+        return (e.pid, e.action, e.operation, e.offset, e.size,
+                float(e.timestamp))
+
+    def event_range(self, path, **kwargs):
+        return [self.event_key(e) for e in
+                hostevent.create_event_iterator(self.conf, path, **kwargs)]
+
+    def test_build(self):
+        index = hostevent.build_event_index(self.conf, self.text_path,
+                interval=100)
+        self.assertEqual(index['n_events'], len(self.all_events))
+        self.assertEqual(len(index['checkpoints']),
+                (len(self.all_events) + 99) / 100)
+        self.assertEqual(sum(index['op_counts'].values()),
+                len(self.all_events))
+        self.assertEqual(hostevent.load_event_index(self.text_path),
+                utils.load_json(
+                    hostevent.event_index_path_of(self.text_path)))
+
+        # offsets point to the lines of the checkpoints
+        lines = list(hostevent.FileLineIterator(self.text_path))
+        for checkpoint in index['checkpoints']:
+            event_no, offset = checkpoint[:2]
+            line = next(iter(hostevent.FileLineIterator(self.text_path,
+                start_offset = offset)))
+            self.assertEqual(line, lines[event_no])
+
+    def test_stale_index(self):
+        hostevent.build_event_index(self.conf, self.text_path, interval=100)
+        with open(self.text_path, 'a') as f:
+            f.write(open(self.text_path).readline())
+
+        self.assertEqual(hostevent.load_event_index(self.text_path), None)
+        self.assertListEqual(self.event_range(self.text_path,
+            start_event=150), self.all_events[150:] + self.all_events[:1])
+
+    def check_ranges(self, path):
+        n = len(self.all_events)
+        for start, stop in [(0, n), (1, 2), (49, 151), (100, None),
+                (n - 1, None), (n + 5, None), (None, 77)]:
+            self.assertListEqual(
+                    self.event_range(path, start_event=start,
+                        stop_event=stop),
+                    self.all_events[start:stop])
+
+        ts = self.timestamps
+        for start, stop in [(ts[10], ts[400]), (ts[333], None),
+                (None, ts[5])]:
+            expected = [e for e, t in zip(self.all_events, ts)
+                    if (start is None or t >= start) and
+                       (stop is None or t < stop)]
+            self.assertTrue(len(expected) > 0)
+            self.assertListEqual(
+                    self.event_range(path, start_time=start, stop_time=stop),
+                    expected)
+
+        self.assertListEqual(
+                self.event_range(path, start_event=20, start_time=ts[100],
+                    stop_event=300),
+                self.all_events[100:300])
+
+    def test_ranges_without_index(self):
+        for path in (self.text_path, self.bin_path, self.gz_path):
+            self.check_ranges(path)
+
+    def test_ranges_with_index(self):
+        for path in (self.text_path, self.bin_path, self.gz_path):
+            hostevent.build_event_index(self.conf, path, interval=50)
+            self.check_ranges(path)
+
+
+class TestMergedEventIterator(unittest.TestCase):
+    def event(self, pid, timestamp):
+        return hostevent.Event(sector_size=512, pid=pid, operation=OP_WRITE,
+                offset=0, size=4096, timestamp=timestamp)
+
+    def test_merge(self):
+        streams = [
+            [self.event(0, 0.1), self.event(0, 0.5),
+                hostevent.ControlEvent(operation=OP_BARRIER),
+                self.event(0, 0.6)],
+            [hostevent.ControlEvent(operation=OP_ENABLE_RECORDER),
+                self.event(1, 0.2), self.event(1, 0.5), self.event(1, 0.9)],
+            [],
+            [self.event(3, 'NA'), self.event(3, '0.3')],
+            ]
+        merged = list(hostevent.MergedEventIterator(streams))
+
+        self.assertEqual(len(merged), 10)
+        self.assertEqual(merged[0].operation, OP_ENABLE_RECORDER)
+        self.assertEqual([(e.pid, e.timestamp) for e in merged[1:5]],
+            [(3, 'NA'), (0, 0.1), (1, 0.2), (3, '0.3')])
+        # ties go to the first stream; the barrier stays after its event
+        self.assertEqual(merged[5].pid, 0)
+        self.assertEqual(merged[6].operation, OP_BARRIER)
+        self.assertEqual([e.pid for e in merged[7:]], [1, 0, 1])
+
+    def test_lazy(self):
+        opened = []
+        def stream(i):
+            opened.append(i)
+            for j in range(3):
+                yield self.event(i, i + j * 10)
+
+        merged = hostevent.MergedEventIterator(
+                [stream(i) for i in range(1000)])
+        self.assertEqual(opened, [])
+        timestamps = [e.timestamp for e in merged]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(len(timestamps), 3000)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
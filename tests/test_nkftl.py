@@ -756,6 +756,33 @@ class TestWearLevelingVictimBlocks(AssertFinishTestCase):
 
         self.set_finished()
 
+    def test_used_blocks_snapshot(self):
+        conf = create_config()
+        block_pool = NKBlockPool(
+                n_channels=conf.n_channels_per_dev,
+                n_blocks_per_channel=conf.n_blocks_per_channel,
+                n_pages_per_block=conf.n_pages_per_block,
+                tags=[TDATA, TLOG])
+        rec = create_recorder(conf)
+        oob = OutOfBandAreas(conf)
+        helper = create_global_helper(conf)
+        logmaptable = LogMappingTable(conf, block_pool, rec, helper)
+        datablocktable = DataBlockMappingTable(conf, rec, helper)
+
+        datablock = self.use_a_data_block(conf, block_pool, oob, datablocktable)
+
+        vblocks = WearLevelingVictimBlocks(conf, block_pool, oob, 10,
+                logmaptable, datablocktable)
+        victims = vblocks.iterator_verbose()
+        self.assertEqual(next(victims)[2], datablock)
+
+        # blocks that become data blocks while iterating are not victims
+        new_block = block_pool.pop_a_free_block_to_data_blocks()
+        datablocktable.add_data_block_mapping(lbn=4, pbn=new_block)
+        self.assertListEqual(list(victims), [])
+
+        self.set_finished()
+
     def test_log_block(self):
         conf = create_config()
         block_pool = NKBlockPool(
@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+
+from wiscsim.oobstore import ArrayMap
+
+
+class TestArrayMap(unittest.TestCase):
+    def test_dict_interface(self):
+        m = ArrayMap(16)
+        self.assertEqual(len(m), 0)
+        with self.assertRaises(KeyError):
+            m[3]
+        self.assertEqual(m.get(3, 'NA'), 'NA')
+
+        m[3] = 30
+        m[4] = 0
+        self.assertEqual(m[3], 30)
+        self.assertEqual(type(m[3]), int)
+        self.assertTrue(4 in m)
+        self.assertFalse(5 in m)
+        self.assertEqual(len(m), 2)
+        self.assertListEqual(m.keys(), [3, 4])
+
+        del m[3]
+        self.assertFalse(m.has_key(3))
+        with self.assertRaises(KeyError):
+            del m[3]
+
+    def test_ranges(self):
+        m = ArrayMap(16)
+        m.set_range(2, [20, 30, 40])
+        m[8] = 80
+        self.assertListEqual(m.get_range(0, 6, 'NA'),
+                ['NA', 'NA', 20, 30, 40, 'NA'])
+
+        m.clear_range(3, 10)
+        self.assertListEqual(m.keys(), [2])
+
+    def test_float(self):
+        m = ArrayMap(4, dtype=np.float64, none_value=-1.0)
+        m[1] = 2.5
+        self.assertEqual(m[1], 2.5)
+        self.assertEqual(m.get(0), None)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
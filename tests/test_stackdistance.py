@@ -0,0 +1,121 @@
+import random
+import unittest
+from collections import Counter, OrderedDict
+
+from wiscsim import hostevent, stackdistance
+from config import ConfigNCQFTL
+from commons import *
+
+
+def naive_lru_counter(keys_and_recording, capacity):
+    cache = OrderedDict()
+    counter = Counter()
+    for key, recording in keys_and_recording:
+        if key in cache:
+            del cache[key]
+            hit = True
+        else:
+            hit = False
+            if capacity > 0 and len(cache) >= capacity:
+                cache.popitem(last=False)
+        if capacity > 0:
+            cache[key] = True
+        if recording:
+            counter['hit' if hit else 'miss'] += 1
+    return counter
+
+
+class TestMappingCacheStackDistance(unittest.TestCase):
+    def setUp(self):
+        self.conf = ConfigNCQFTL()
+        self.conf['flash_config']['page_size'] = 4096
+        # 4096 / 4 = 1024 entries per translation page
+
+    def event(self, op, lpn, n_pages):
+        return hostevent.Event(sector_size=512, pid=0, operation=op,
+                offset=lpn * 4096, size=n_pages * 4096)
+
+    def random_events(self, n_events):
+        rand = random.Random(5)
+        events = [hostevent.ControlEvent(operation=OP_DISABLE_RECORDER)]
+        for i in range(n_events):
+            if i == n_events / 4:
+                events.append(
+                    hostevent.ControlEvent(operation=OP_ENABLE_RECORDER))
+            op = rand.choice([OP_READ, OP_WRITE, OP_DISCARD])
+            lpn = rand.randint(0, 20 * 1024)
+            if rand.random() < 0.5:
+                # make reuses likely
+                lpn = lpn % 3000
+            events.append(self.event(op, lpn, rand.randint(1, 40)))
+        return events
+
+    def accesses_of(self, events, granularity):
+        recording = True
+        accesses = []
+        for event in events:
+            if event.get_type() == 'ControlEvent':
+                recording = event.operation == OP_ENABLE_RECORDER
+                continue
+            extent = event.get_lpn_extent(self.conf)
+            for lpn in extent.lpn_iter():
+                if granularity == 'lpn':
+                    accesses.append((lpn, recording))
+                else:
+                    accesses.append((lpn / 1024, recording))
+        return accesses
+
+    def test_lpn_against_naive(self):
+        events = self.random_events(400)
+        sd = stackdistance.MappingCacheStackDistance(self.conf)
+        sd.process(events)
+
+        accesses = self.accesses_of(events, 'lpn')
+        sizes = [0, 1, 16, 100, 1000, 3000, 5000, 100000]
+        counters = sd.mapping_cache_counters(sizes, 'lpn')
+        for size in sizes:
+            self.assertEqual(counters[size],
+                    naive_lru_counter(accesses, size))
+
+    def test_mvpn_against_naive(self):
+        events = self.random_events(400)
+        sd = stackdistance.MappingCacheStackDistance(self.conf)
+        sd.process(events)
+
+        accesses = self.accesses_of(events, 'mvpn')
+        for n_tpages in [0, 1, 2, 5, 10, 30]:
+            self.assertEqual(
+                sd.mapping_cache_counter(n_tpages * 1024, 'mvpn'),
+                naive_lru_counter(accesses, n_tpages))
+
+    def test_recorder_disabled(self):
+        events = [
+            hostevent.ControlEvent(operation=OP_DISABLE_RECORDER),
+            self.event(OP_WRITE, 0, 8),
+            hostevent.ControlEvent(operation=OP_ENABLE_RECORDER),
+            self.event(OP_READ, 4, 8),
+            ]
+        sd = stackdistance.MappingCacheStackDistance(self.conf)
+        sd.process(events)
+        self.assertEqual(sd.mapping_cache_counter(1024, 'lpn'),
+                Counter({'hit': 4, 'miss': 4}))
+        self.assertEqual(sd.mapping_cache_counter(1024, 'mvpn'),
+                Counter({'hit': 8}))
+        self.assertEqual(sd.mapping_cache_counter(0, 'lpn'),
+                Counter({'miss': 8}))
+
+    def test_sampling(self):
+        events = [self.event(OP_READ, lpn, 1)
+                for _ in range(5) for lpn in range(20000)]
+        counter = stackdistance.sweep_mapping_cache(self.conf, events,
+                [10000, 30000], sample_rate=0.1)
+        self.assertEqual(counter[10000]['hit'], 0)
+        self.assertTrue(counter[30000]['hit'] > 0.9 * 80000)
+        self.assertTrue(counter[30000]['hit'] < 1.1 * 80000)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
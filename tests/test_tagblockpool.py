@@ -1,3 +1,5 @@
+from collections import Counter
+import random
 import unittest
 from wiscsim.tagblockpool import *
 
@@ -157,6 +159,73 @@ class TestTagBlockPool(unittest.TestCase):
         self.assertEqual(dist[3], 2)
         print dist
 
+    def sorted_pick(self, pool, tag, choice, nblocks):
+        """
+        picks by sorting all blocks by erasure count
+        """
+        counter = pool.get_erasure_count()
+        if choice == LEAST_ERASED:
+            blocks_by_cnt = reversed(counter.most_common())
+        else:
+            blocks_by_cnt = counter.most_common()
+        tag_blocks = pool.get_blocks_of_tag(tag)
+        return [blocknum for blocknum, _ in blocks_by_cnt
+                if blocknum in tag_blocks][:nblocks]
+
+    def test_same_as_sorting(self):
+        rand = random.Random(1)
+        tags = [TFREE, TDATA, TTRANS]
+        pool = TagBlockPool(50, [TDATA, TTRANS])
+        blocks_of_tag = {TFREE: range(50), TDATA: [], TTRANS: []}
+
+        for i in range(3000):
+            src = rand.choice(tags)
+            if len(blocks_of_tag[src]) == 0:
+                continue
+            dst = rand.choice([tag for tag in tags if tag != src])
+            if rand.random() < 0.5:
+                choice = rand.choice([LEAST_ERASED, MOST_ERASED])
+                nblocks = rand.randint(1, 3)
+                blocks = pool.get_least_or_most_erased_blocks(src, choice,
+                        nblocks)
+                self.assertListEqual(blocks,
+                        self.sorted_pick(pool, src, choice, nblocks))
+                block = pool.pick_and_move(src, dst, choice)
+                self.assertEqual(block, blocks[0])
+            else:
+                block = rand.choice(blocks_of_tag[src])
+                pool.change_tag(block, src, dst)
+            blocks_of_tag[src].remove(block)
+            blocks_of_tag[dst].append(block)
+
+            for tag in tags:
+                self.assertListEqual(pool.get_blocks_of_tag(tag),
+                        blocks_of_tag[tag])
+                self.assertEqual(pool.count_blocks(tag),
+                        len(blocks_of_tag[tag]))
+            self.assertEqual(pool.get_erasure_count_dist(),
+                    Counter(pool.get_erasure_count().values()))
+
+    def test_erasure_counter(self):
+        counter = ErasureCounter(4)
+        self.assertEqual(counter.dist, Counter({0: 4}))
+
+        counter[1] += 1
+        counter[2] = 5
+        counter[1] += 1
+        self.assertEqual(counter.dist, Counter({0: 2, 2: 1, 5: 1}))
+
+        del counter[3]
+        counter[9] = 0
+        self.assertEqual(counter.dist, Counter({0: 2, 2: 1, 5: 1}))
+        self.assertEqual(counter.dist, Counter(counter.values()))
+        self.assertEqual(type(counter.copy()), Counter)
+
+    def test_change_tag_of_block_not_in_src(self):
+        pool = TagBlockPool(10, [TDATA])
+        with self.assertRaises(ValueError):
+            pool.change_tag(3, TDATA, TFREE)
+
 
 class TestBlockPoolWithCurBlocks(unittest.TestCase):
     def test_init(self):
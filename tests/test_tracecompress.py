@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from wiscsim import hostevent, tracecompress
+from pyreuse.sysutils import blocktrace
+from config import ConfigNCQFTL
+from utilities import utils
+
+
+def read_lines(path):
+    return list(hostevent.FileLineIterator(path))
+
+
+class TestCompressedLineIterator(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.conf = ConfigNCQFTL()
+
+        self.event_path = os.path.join(self.tmpdir, 'events.txt')
+        blocktrace.BlktraceResultChunked(self.conf['sector_size'],
+                self.conf['event_file_column_names'],
+                "tests/testdata/blkparse-output.txt",
+                self.event_path).create_event_file()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def compress(self, codec_name, lines_per_block=7):
+        path = os.path.join(self.tmpdir, 'events.' + codec_name)
+        tracecompress.compress_file(self.event_path, path, codec_name,
+                lines_per_block=lines_per_block)
+        return path
+
+    def test_codecs(self):
+        expected = read_lines(self.event_path)
+        for codec_name in tracecompress.CODECS.keys():
+            path = self.compress(codec_name)
+            self.assertEqual(tracecompress.detect_codec(path).name,
+                    codec_name)
+            self.assertListEqual(
+                list(tracecompress.CompressedLineIterator(path,
+                    n_prefetch_blocks=1)),
+                expected)
+
+    def test_without_index(self):
+        expected = read_lines(self.event_path)
+        for codec_name in tracecompress.CODECS.keys():
+            path = self.compress(codec_name)
+            os.remove(tracecompress.index_path_of(path))
+            self.assertListEqual(
+                list(tracecompress.CompressedLineIterator(path)), expected)
+
+    def test_stream_ends_at_read_boundary(self):
+        expected = read_lines(self.event_path)
+        for codec_name in tracecompress.CODECS.keys():
+            path = self.compress(codec_name)
+            first_len = utils.load_json(
+                    tracecompress.index_path_of(path))['blocks'][0][1]
+            os.remove(tracecompress.index_path_of(path))
+
+            itr = tracecompress.CompressedLineIterator(path)
+            self.assertEqual(itr.n_blocks(), None)
+            data = ''.join(itr._iter_sequential_chunks(read_size=first_len))
+            self.assertListEqual(
+                    [line.strip() for line in data.split('\n')[:-1]],
+                    expected)
+
+    def test_start_block(self):
+        expected = read_lines(self.event_path)
+        path = self.compress('gz', lines_per_block=5)
+        itr = tracecompress.CompressedLineIterator(path, start_block=3)
+        self.assertEqual(itr.n_blocks(), (len(expected) + 4) / 5)
+        self.assertListEqual(list(itr), expected[15:])
+
+    def test_stop_early(self):
+        path = self.compress('bz2', lines_per_block=1)
+        itr = tracecompress.CompressedLineIterator(path, n_prefetch_blocks=1)
+        for i, line in enumerate(itr):
+            if i == 2:
+                break
+        self.assertEqual(line, read_lines(self.event_path)[2])
+
+    def test_event_iterator(self):
+        conf = self.conf
+        path = self.compress('gz')
+        self.assertFalse(hostevent.is_binary_event_file(path))
+
+        expected = [str(e) for e in
+                hostevent.create_event_iterator(conf, self.event_path)]
+        self.assertListEqual(expected,
+            [str(e) for e in hostevent.create_event_iterator(conf, path)])
+        self.assertListEqual(expected,
+            [str(e) for e in hostevent.EventIterator(conf, path)])
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
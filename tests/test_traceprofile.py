@@ -0,0 +1,185 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+
+import numpy as np
+
+from wiscsim import hostevent, traceprofile
+from pyreuse.sysutils import blocktrace
+from config import ConfigNCQFTL
+from commons import *
+
+
+def naive_reuse_distances(keys):
+    stack = []
+    distances = []
+    for key in keys:
+        if key in stack:
+            pos = stack.index(key)
+            distances.append(len(stack) - 1 - pos)
+            del stack[pos]
+        else:
+            distances.append(None)
+        stack.append(key)
+    return distances
+
+
+class TestFenwickTree(unittest.TestCase):
+    def test_from_ones(self):
+        for size in (1, 7, 16, 33):
+            for n_ones in range(size + 1):
+                tree = traceprofile.FenwickTree.from_ones(size, n_ones)
+                for pos in range(size):
+                    self.assertEqual(tree.prefix_sum(pos),
+                            min(pos + 1, n_ones))
+
+    def test_add(self):
+        tree = traceprofile.FenwickTree(10)
+        tree.add(3, 2)
+        tree.add(7, 5)
+        tree.add(3, -1)
+        self.assertEqual(tree.prefix_sum(2), 0)
+        self.assertEqual(tree.prefix_sum(3), 1)
+        self.assertEqual(tree.prefix_sum(9), 6)
+
+
+class TestReuseDistanceCounter(unittest.TestCase):
+    def test_against_naive(self):
+        rand = random.Random(1)
+        keys = [rand.randint(0, 50) for _ in range(2000)]
+
+        # small capacity to exercise compaction
+        counter = traceprofile.ReuseDistanceCounter(capacity=8)
+        distances = [counter.access(key) for key in keys]
+        self.assertListEqual(distances, naive_reuse_distances(keys))
+
+        report = counter.report()
+        self.assertEqual(report['cold'], len(set(keys)))
+        self.assertEqual(sum(report['histogram'].values()),
+                len(keys) - len(set(keys)))
+
+    def test_sampling(self):
+        keys = np.arange(10000) % 1000
+        counter = traceprofile.ReuseDistanceCounter(sample_rate=0.1)
+        counter.access_many(keys)
+        report = counter.report()
+        # every reuse has distance ~999, about 1000 cold misses
+        self.assertTrue(800 < report['cold'] < 1200)
+        self.assertListEqual(report['histogram'].keys(), [1024])
+
+
+class TestBitmapAndCounter(unittest.TestCase):
+    def test_bitmap(self):
+        bitmap = traceprofile.Bitmap()
+        keys = set()
+        rand = random.Random(2)
+        for _ in range(20):
+            chunk = [rand.randint(0, 5000) for _ in range(100)]
+            keys.update(chunk)
+            bitmap.add(np.array(chunk))
+        self.assertEqual(bitmap.count(), len(keys))
+
+        other = traceprofile.Bitmap()
+        other.add(np.array([10**6]))
+        self.assertEqual((bitmap | other).count(), len(keys) + 1)
+
+    def test_access_counter(self):
+        rand = random.Random(3)
+        keys = [rand.randint(0, 3000) for _ in range(5000)]
+        expected = Counter(keys)
+
+        counter = traceprofile.AccessCounter(dense_limit=2000,
+                sample_rate=0.5, sketch_width=1024)
+        counter.add(np.array([k for k in keys if k < 1000]))
+        self.assertTrue(counter.exact)
+        self.assertEqual(counter.estimate(5), expected[5])
+
+        counter.add(np.array([k for k in keys if k >= 1000]))
+        self.assertFalse(counter.exact)
+        for key in expected:
+            self.assertTrue(counter.estimate(key) >= expected[key])
+        self.assertEqual(counter.hotness()['accesses'], len(keys))
+
+
+class TestTraceProfiler(unittest.TestCase):
+    def setUp(self):
+        self.conf = ConfigNCQFTL()
+        self.conf['flash_config']['page_size'] = 4096
+
+    def event(self, op, offset, size):
+        return hostevent.Event(sector_size=512, pid=0, operation=op,
+                offset=offset, size=size)
+
+    def test_small(self):
+        events = [
+            hostevent.ControlEvent(operation=OP_ENABLE_RECORDER),
+            self.event(OP_WRITE, 0, 8192),
+            self.event(OP_WRITE, 8192, 4096),
+            self.event(OP_READ, 0, 4096),
+            self.event(OP_WRITE, 0, 4096),
+            self.event(OP_DISCARD, 4 * MB, 8 * KB),
+            ]
+        report = traceprofile.profile_trace(self.conf, events,
+                reuse_sample_rate=1)
+
+        self.assertEqual(report['bytes'],
+                {'read': 4096, 'write': 16384, 'discard': 8192})
+        self.assertEqual(report['n_requests'],
+                {'read': 1, 'write': 3, 'discard': 1})
+        self.assertEqual(report['request_size_histogram']['write'],
+                {8192: 1, 4096: 2})
+        self.assertEqual(report['sequential_ratio']['write'], 1 / 3.0)
+        self.assertEqual(report['footprint']['lpns'], 5)
+        self.assertEqual(report['footprint']['write_lpns'], 3)
+        # 4MB / 4KB = 1024 entries per translation page
+        self.assertEqual(report['footprint']['mvpns'], 2)
+
+        # lpn stream: 0 1 2 0 0 1024 1025
+        self.assertEqual(report['lpn_reuse_distance']['cold'], 5)
+        self.assertEqual(report['lpn_reuse_distance']['histogram'],
+                {2: 1, 0: 1})
+        self.assertEqual(report['lpn_hotness']['accesses'], 7)
+        # m_vpn stream: 0 0 0 0 1
+        self.assertEqual(report['mvpn_reuse_distance']['histogram'], {0: 3})
+
+    def test_blkparse_trace(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'events.txt')
+            blocktrace.BlktraceResultChunked(512,
+                    self.conf['event_file_column_names'],
+                    "tests/testdata/blkparse-output.txt",
+                    path).create_event_file()
+            events = list(hostevent.create_event_iterator(self.conf, path,
+                stop_event=200))
+
+            report = traceprofile.profile_trace(self.conf, events,
+                    reuse_sample_rate=1, chunk_events=30)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        lpns = []
+        for e in events:
+            if e.action == 'D':
+                start, count = self.conf.off_size_to_page_range(e.offset,
+                        e.size, force_alignment=False)
+                lpns.extend(range(start, start + count))
+        self.assertEqual(report['footprint']['lpns'], len(set(lpns)))
+        self.assertEqual(report['lpn_hotness']['accesses'], len(lpns))
+        distances = naive_reuse_distances(lpns)
+        self.assertEqual(report['lpn_reuse_distance']['cold'],
+                distances.count(None))
+        self.assertEqual(
+                report['lpn_reuse_distance']['histogram'],
+                traceprofile.log2_buckets(
+                    [d for d in distances if d is not None]))
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
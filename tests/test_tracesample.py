@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from wiscsim import hostevent, tracesample
+import wiscsim
+from utilities import utils
+from config import LBAGENERATOR, ConfigNCQFTL
+from commons import *
+
+from test_hostevent import create_text_event_file
+
+
+class TestSpatialSampler(unittest.TestCase):
+    def setUp(self):
+        self.conf = ConfigNCQFTL()
+        # 2KB pages, 2 pages per block
+        self.conf.set_flash_num_blocks_by_bytes(64 * MB)
+
+    def event(self, op, offset, size):
+        return hostevent.Event(sector_size=512, pid=0, operation=op,
+                offset=offset, size=size)
+
+    def test_split_and_remap(self):
+        sampler = tracesample.SpatialSampler(self.conf, 0.5,
+                group_bytes=16 * KB)
+        kept = [g for g, new in enumerate(sampler.new_group_ids)
+                if new != -1]
+        self.assertEqual(len(kept), sampler.n_sampled_groups)
+        self.assertTrue(0.3 < sampler.effective_rate < 0.7)
+
+        # a request covering groups 0..9
+        events = sampler.sample_event(self.event(OP_WRITE, 0, 160 * KB))
+        expected_groups = [g for g in kept if g < 10]
+        self.assertEqual(len(events), len(expected_groups))
+        for event, group in zip(events, expected_groups):
+            self.assertEqual(event.offset,
+                    sampler.new_group_ids[group] * 16 * KB)
+            self.assertEqual(event.size, 16 * KB)
+
+        # pieces keep their offset in the group
+        group = kept[3]
+        events = sampler.sample_event(
+                self.event(OP_READ, group * 16 * KB + 2 * KB, 4 * KB))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].offset, 3 * 16 * KB + 2 * KB)
+        self.assertEqual(events[0].operation, OP_READ)
+
+        control = hostevent.ControlEvent(operation=OP_ENABLE_RECORDER)
+        self.assertEqual(sampler.sample_event(control), [control])
+
+    def test_scaled_config(self):
+        self.conf['mapping_cache_bytes'] = 4 * MB
+        self.conf['cache_entry_bytes'] = 8
+        sampler = tracesample.SpatialSampler(self.conf, 0.25)
+        conf = sampler.scaled_config()
+
+        self.assertEqual(self.conf.total_flash_bytes(), 64 * MB)
+        self.assertTrue(conf.total_flash_bytes() >=
+                sampler.n_sampled_groups * sampler.group_bytes)
+        self.assertTrue(conf.total_flash_bytes() < 20 * MB)
+        self.assertTrue(conf['mapping_cache_bytes'] < 2 * MB)
+
+    def test_rescale_counters(self):
+        counters = {'traffic': {'write': 100}, 'ftl_func': {'foo': 3}}
+        rescaled = tracesample.rescale_counters(counters, 0.25)
+        self.assertEqual(rescaled['traffic']['write'], 400)
+        self.assertEqual(rescaled['ftl_func']['foo'], 3)
+
+
+class TestValidateSampling(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def create_config(self):
+        conf = wiscsim.dftldes.Config()
+        conf['SSDFramework']['ncq_depth'] = 2
+
+        conf['flash_config']['n_pages_per_block'] = 16
+        conf['flash_config']['n_blocks_per_plane'] = 2
+        conf['flash_config']['n_planes_per_chip'] = 1
+        conf['flash_config']['n_chips_per_package'] = 1
+        conf['flash_config']['n_packages_per_channel'] = 1
+        conf['flash_config']['n_channels_per_dev'] = 4
+
+        conf['do_not_check_gc_setting'] = True
+        conf.GC_high_threshold_ratio = 0.96
+        conf.GC_low_threshold_ratio = 0
+
+        utils.set_exp_metadata(conf, save_data = False,
+                expname = 'test_expname',
+                subexpname = 'test_subexpname')
+
+        conf['ftl_type'] = 'dftldes'
+        conf['simulator_class'] = 'SimulatorDESNew'
+
+        conf.n_cache_entries = conf.n_mapping_entries_per_page * 4
+        conf.set_flash_num_blocks_by_bytes(16 * MB)
+
+        utils.runtime_update(conf)
+
+        mkfs_path = os.path.join(self.tmpdir, 'events-mkfs.txt')
+        event_path = os.path.join(self.tmpdir, 'events.txt')
+        create_text_event_file(mkfs_path, 20)
+        create_text_event_file(event_path, 2000)
+
+        conf["workload_src"] = LBAGENERATOR
+        conf["lba_workload_class"] = "BlktraceEvents"
+        conf['lba_workload_configs']['mkfs_event_path'] = mkfs_path
+        conf['lba_workload_configs']['ftlsim_event_path'] = event_path
+        conf['stop_sim_on_bytes'] = 'inf'
+        conf['do_gc_after_workload'] = False
+
+        return conf
+
+    def test_validate(self):
+        conf = self.create_config()
+        comparisons = tracesample.validate_sampling(conf, [0.5])
+
+        traffic = comparisons[0.5]['traffic']
+        full, estimated, error = traffic['write']
+        self.assertTrue(full > 0)
+        self.assertTrue(error < 0.5)
+        self.assertTrue(os.path.exists(os.path.join(conf['result_dir'],
+            'sampled-0.5', tracesample.RESCALED_RESULT_NAME)))
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ import unittest
 import collections
 import shutil
 import os
+import tempfile
 
 import config
 from workflow import *
@@ -12,6 +13,8 @@ from config_helper import rule_parameter
 from pyreuse.helpers import shcmd
 from config_helper import experiment
 
+from test_hostevent import create_text_event_file
+
 
 def create_config():
     conf = wiscsim.dftldes.Config()
@@ -100,6 +103,88 @@ class TestWorkflow(unittest.TestCase):
         wf = Workflow(conf)
         wf.run_simulator([ctrl_event, event])
 
+    def test_multiproc_merged(self):
+        conf = create_config()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(tmpdir, 'events-{}.txt'.format(i))
+                    for i in range(3)]
+            for path in paths:
+                create_text_event_file(path, 30)
+            mkfs_path = os.path.join(tmpdir, 'events-mkfs.txt')
+            create_text_event_file(mkfs_path, 5)
+
+            conf['workload_src'] = LBAMULTIPROC
+            conf['lba_workload_class'] = 'MultiStreamBlktraceEvents'
+            conf['lba_workload_configs']['mkfs_event_path'] = mkfs_path
+            conf['lba_workload_configs']['ftlsim_event_paths'] = paths
+            conf['lba_workload_configs']['stream_offset_stride_bytes'] = \
+                    4 * MB
+            conf['stop_sim_on_bytes'] = 'inf'
+            conf['do_gc_after_workload'] = False
+            conf['merge_multiproc_streams'] = True
+
+            wf = Workflow(conf)
+            wf.run()
+        finally:
+            shutil.rmtree(tmpdir)
+
+        traffic = utils.load_json(os.path.join(conf['result_dir'],
+            'recorder.json'))['general_accumulator']['traffic']
+        # 3 streams of create_text_event_file(path, 30)
+        self.assertEqual(traffic['write'], 3 * 4096 * sum(
+            1 + i % 4 for i in range(30) if i % 5 != 0 and i % 3 == 1))
+
+    def test_multiproc_stream_barriers(self):
+        conf = create_config()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(tmpdir, 'events-{}.txt'.format(i))
+                    for i in range(3)]
+            for path in paths:
+                create_text_event_file(path, 30)
+            mkfs_path = os.path.join(tmpdir, 'events-mkfs.txt')
+            create_text_event_file(mkfs_path, 5)
+
+            conf['lba_workload_configs']['mkfs_event_path'] = mkfs_path
+            conf['lba_workload_configs']['ftlsim_event_paths'] = paths
+            conf['stop_sim_on_bytes'] = 'inf'
+            conf['do_gc_after_workload'] = True
+
+            lbagen = workrunner.lbaworkloadgenerator.\
+                    MultiStreamBlktraceEvents(conf)
+            streams = []
+            for event_iter in lbagen.get_iter_list():
+                # split events of a stream at the host barriers
+                parts = [[]]
+                for event in event_iter:
+                    if event.get_operation() == OP_HOST_BARRIER:
+                        parts.append([])
+                    else:
+                        parts[-1].append(event.get_operation())
+                streams.append(parts)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        for parts in streams:
+            self.assertEqual(len(parts), 4)
+
+        prep, workload, end, _ = streams[0]
+        self.assertEqual(prep[0], OP_DISABLE_RECORDER)
+        self.assertIn(OP_ENABLE_RECORDER, prep)
+        self.assertEqual(prep[-1], OP_REC_TIMESTAMP)
+        self.assertIn(OP_WRITE, workload)
+        self.assertIn(OP_BARRIER, end)
+        self.assertIn(OP_CLEAN, end)
+        self.assertEqual(end[-1], OP_REC_BW)
+
+        # the other streams start after prep and end before the control
+        # events of the first stream
+        for prep, workload, end, _ in streams[1:]:
+            self.assertListEqual(prep, [])
+            self.assertIn(OP_WRITE, workload)
+            self.assertListEqual(end, [])
+
     def test_on_fs_run_and_sim(self):
         conf = create_config()
         on_fs_config(conf)
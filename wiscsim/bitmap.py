@@ -1,3 +1,5 @@
+import array
+
 import bitarray
 import config
 
@@ -18,6 +20,14 @@ class FlashBitmap2(object):
         self.bitmap = bitarray.bitarray(2 * conf.total_num_pages())
         self.bitmap.setall(0)
 
+        # Number of valid and invalid pages of each block, so the ratios
+        # of a block do not need to look at its pages. The rest of the
+        # pages of a block are erased.
+        self.n_pages_per_block = conf.n_pages_per_block
+        self.n_blocks = conf.total_num_pages() / self.n_pages_per_block
+        self._n_valid = array.array('i', [0]) * self.n_blocks
+        self._n_invalid = array.array('i', [0]) * self.n_blocks
+
     def pagenum_to_slice_range(self, pagenum):
         "2 is the number of bits representing the state of a page"
         return 2 * pagenum, 2 * (pagenum + 1)
@@ -33,55 +43,94 @@ class FlashBitmap2(object):
         return s, e
 
     def validate_page(self, pagenum):
-        s, e = self.pagenum_to_slice_range(pagenum)
-        self.bitmap[s:e] = self.VALID
+        # the first bit is set iff INVALID, the second iff VALID
+        s = 2 * pagenum
+        bitmap = self.bitmap
+        if not bitmap[s + 1]:
+            blocknum = pagenum / self.n_pages_per_block
+            self._n_valid[blocknum] += 1
+            if bitmap[s]:
+                self._n_invalid[blocknum] -= 1
+            bitmap[s:s + 2] = self.VALID
 
     def invalidate_page(self, pagenum):
-        s, e = self.pagenum_to_slice_range(pagenum)
-        self.bitmap[s:e] = self.INVALID
+        s = 2 * pagenum
+        bitmap = self.bitmap
+        if not bitmap[s]:
+            blocknum = pagenum / self.n_pages_per_block
+            self._n_invalid[blocknum] += 1
+            if bitmap[s + 1]:
+                self._n_valid[blocknum] -= 1
+            bitmap[s:s + 2] = self.INVALID
+
+    def _set_page_range(self, start, end, state):
+        """
+        Set pages [start, end) to state, block by block
+        """
+        bitmap = self.bitmap
+        while start < end:
+            blocknum = start / self.n_pages_per_block
+            run_end = min((blocknum + 1) * self.n_pages_per_block, end)
+            s, e = 2 * start, 2 * run_end
+            n_valid = bitmap[s + 1:e:2].count(1)
+            n_invalid = bitmap[s:e:2].count(1)
+            n_pages = run_end - start
+
+            bitmap[s:e] = state * n_pages
+            if state == self.VALID:
+                self._n_valid[blocknum] += n_pages - n_valid
+                self._n_invalid[blocknum] -= n_invalid
+            elif state == self.INVALID:
+                self._n_valid[blocknum] -= n_valid
+                self._n_invalid[blocknum] += n_pages - n_invalid
+            else:
+                self._n_valid[blocknum] -= n_valid
+                self._n_invalid[blocknum] -= n_invalid
+            start = run_end
+
+    def validate_page_range(self, start, end):
+        "validate pages [start, end), which may span blocks"
+        self._set_page_range(start, end, self.VALID)
+
+    def invalidate_page_range(self, start, end):
+        "invalidate pages [start, end), which may span blocks"
+        self._set_page_range(start, end, self.INVALID)
 
     def validate_block(self, blocknum):
         start, end = self.conf.block_to_page_range(blocknum)
-        for pg in range(start, end):
-            self.validate_page(pg)
+        self.validate_page_range(start, end)
 
     def invalidate_block(self, blocknum):
         start, end = self.conf.block_to_page_range(blocknum)
-        for pg in range(start, end):
-            self.validate_page(pg)
+        self.invalidate_page_range(start, end)
 
     def erase_block(self, blocknum):
         s, e = self.blocknum_to_slice_range(blocknum)
         self.bitmap[s:e] = 0
+        self._n_valid[blocknum] = 0
+        self._n_invalid[blocknum] = 0
 
-    def block_invalid_ratio(self, blocknum):
-        start, end = self.conf.block_to_page_range(blocknum)
-        cnt = 0
-        for pg in range(start, end):
-            if not self.is_page_valid(pg):
-                cnt += 1
+    def block_valid_count(self, blocknum):
+        return self._n_valid[blocknum]
 
-        return cnt / float(self.conf.n_pages_per_block)
+    def block_invalid_count(self, blocknum):
+        return self._n_invalid[blocknum]
 
-    def block_valid_ratio(self, blocknum):
-        start, end = self.conf.block_to_page_range(blocknum)
-        cnt = 0
-        for pg in range(start, end):
-            if self.is_page_valid(pg):
-                cnt += 1
+    def block_erased_count(self, blocknum):
+        return self.n_pages_per_block - self._n_valid[blocknum] - \
+                self._n_invalid[blocknum]
 
-        ret = cnt / float(self.conf.n_pages_per_block)
-        return ret
+    def block_invalid_ratio(self, blocknum):
+        "Note that erased pages are counted, as they are not valid"
+        return (self.n_pages_per_block - self._n_valid[blocknum]) / \
+                float(self.n_pages_per_block)
 
-    def block_erased_ratio(self, blocknum):
-        start, end = self.conf.block_to_page_range(blocknum)
-        cnt = 0
-        for pg in range(start, end):
-            if self.is_page_erased(pg):
-                cnt += 1
+    def block_valid_ratio(self, blocknum):
+        return self._n_valid[blocknum] / float(self.n_pages_per_block)
 
-        ret = cnt / float(self.conf.n_pages_per_block)
-        return ret
+    def block_erased_ratio(self, blocknum):
+        return self.block_erased_count(blocknum) / \
+                float(self.n_pages_per_block)
 
     def is_page_valid(self, pagenum):
         s, e = self.pagenum_to_slice_range(pagenum)
@@ -128,5 +177,73 @@ class FlashBitmap2(object):
         """ this method should be called in FTL """
         # set the state of all pages to ERASED
         self.bitmap.setall(0)
+        self._n_valid = array.array('i', [0]) * self.n_blocks
+        self._n_invalid = array.array('i', [0]) * self.n_blocks
 
 
+
+class BucketedFlashBitmap(FlashBitmap2):
+    """
+    FlashBitmap2 that also keeps programmed blocks in buckets by number of
+    valid pages, so a greedy garbage collector can find the blocks with
+    the fewest valid pages without looking at every block. A block is
+    programmed if it has any valid or invalid page; erased blocks are in
+    no bucket.
+    """
+    def __init__(self, conf):
+        super(BucketedFlashBitmap, self).__init__(conf)
+        self._init_buckets()
+
+    def _init_buckets(self):
+        # _blocks_of_valid_count[i] is the set of blocks with i valid pages
+        self._blocks_of_valid_count = [
+                set() for _ in range(self.n_pages_per_block + 1)]
+        # bucket of each block, -1 if the block is not programmed
+        self._bucket_of_block = array.array('i', [-1]) * self.n_blocks
+
+    def _reindex_block(self, blocknum):
+        n_valid = self._n_valid[blocknum]
+        if n_valid == 0 and self._n_invalid[blocknum] == 0:
+            bucket = -1
+        else:
+            bucket = n_valid
+
+        old_bucket = self._bucket_of_block[blocknum]
+        if bucket != old_bucket:
+            if old_bucket != -1:
+                self._blocks_of_valid_count[old_bucket].discard(blocknum)
+            if bucket != -1:
+                self._blocks_of_valid_count[bucket].add(blocknum)
+            self._bucket_of_block[blocknum] = bucket
+
+    def validate_page(self, pagenum):
+        FlashBitmap2.validate_page(self, pagenum)
+        self._reindex_block(pagenum / self.n_pages_per_block)
+
+    def invalidate_page(self, pagenum):
+        FlashBitmap2.invalidate_page(self, pagenum)
+        self._reindex_block(pagenum / self.n_pages_per_block)
+
+    def _set_page_range(self, start, end, state):
+        FlashBitmap2._set_page_range(self, start, end, state)
+        if start < end:
+            for blocknum in xrange(start / self.n_pages_per_block,
+                    (end - 1) / self.n_pages_per_block + 1):
+                self._reindex_block(blocknum)
+
+    def erase_block(self, blocknum):
+        FlashBitmap2.erase_block(self, blocknum)
+        self._reindex_block(blocknum)
+
+    def blocks_of_valid_count(self, n_valid):
+        "Return the live set of programmed blocks, do not modify it"
+        return self._blocks_of_valid_count[n_valid]
+
+    def valid_count_dist(self):
+        "Return {number of valid pages: number of programmed blocks}"
+        return {n_valid: len(blocks) for n_valid, blocks
+                in enumerate(self._blocks_of_valid_count) if len(blocks) > 0}
+
+    def initialize(self):
+        super(BucketedFlashBitmap, self).initialize()
+        self._init_buckets()
@@ -41,10 +41,8 @@ class BlockPool(object):
 
     @property
     def used_blocks(self):
-        blocks1 = self.pool.get_blocks_of_tag(tag=TDATA)
-        blocks2 = self.pool.get_blocks_of_tag(tag=TTRANS)
-
-        return blocks1 + blocks2
+        blocks = self.pool.get_blocks_of_tags(tags=(TDATA, TTRANS))
+        return blocks
 
     def get_wear_status(self):
         return self.pool.get_wear_status()
@@ -117,6 +115,12 @@ class BlockPool(object):
     def current_blocks(self):
         return self.pool.current_blocks()
 
+    def is_current_block(self, blocknum):
+        return self.pool.is_current_block(blocknum)
+
+    def get_tag(self, blocknum):
+        return self.pool.get_tag(blocknum)
+
     def used_ratio(self):
         nfree = self.pool.count_blocks(tag=TFREE)
         return (self.conf.n_blocks_per_dev - nfree) / float(self.conf.n_blocks_per_dev)
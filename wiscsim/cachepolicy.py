@@ -0,0 +1,766 @@
+"""
+Replacement policies of the dftldes mapping cache
+
+An LPN table (LpnTableMvpn or ArrayLpnTable) tells its policy what
+happens to its rows, and MappingCache asks the policy for eviction
+victims. Only USED rows can be evicted; rows being locked or held are
+taken out of the policy and put back when they are USED again.
+
+The table calls:
+    add(rowid, lpn, m_vpn, as_least_recent): a mapping is cached in rowid
+    touch(rowid): the mapping in rowid is used (hit or overwrite)
+    discard(rowid): rowid is locked or held
+    restore(rowid): rowid is USED again
+    delete(rowid): the mapping in rowid is removed from the cache
+    page_dirtied(m_vpn): the first cached entry of m_vpn becomes dirty
+    page_cleaned(m_vpn): no cached entry of m_vpn is dirty any more
+MappingCache calls:
+    victim(avoid_m_vpns): return (row id or None, number of candidates
+        examined), skipping rows of the translation pages in avoid_m_vpns
+
+Policies (config key "cache_replacement_policy"):
+    lru: least recently used, avoided translation pages are skipped as
+        a whole
+    slru: segmented LRU, rows hit again are protected
+    clock: second chance
+    2q: 2Q of Johnson and Shasha, rows accessed once stay in a FIFO
+    arc: adaptive replacement cache of Megiddo and Modha
+    tpage: translation page aware, like TPFTL. Translation pages are
+        ordered by their last access and clean pages are evicted first.
+        Rows of a page that has just been written back are evicted next,
+        so one write-back is shared by all the dirty entries of a page.
+
+All operations except victim() are O(1). victim() is O(1) plus the
+number of candidates skipped because they are in avoid_m_vpns (or have
+their reference bit set, for clock).
+"""
+import array
+import copy
+import heapq
+import os
+
+from utilities import utils
+
+
+POLICIES = ('lru', 'slru', 'clock', '2q', 'arc', 'tpage')
+
+# null row id
+NIL = -1
+
+
+def create_policy(conf, n_rows):
+    name = conf.get('cache_replacement_policy', 'lru')
+    if name == 'lru':
+        return LruPolicy(conf, n_rows)
+    elif name == 'slru':
+        return SlruPolicy(conf, n_rows)
+    elif name == 'clock':
+        return ClockPolicy(conf, n_rows)
+    elif name == '2q':
+        return TwoQPolicy(conf, n_rows)
+    elif name == 'arc':
+        return ArcPolicy(conf, n_rows)
+    elif name == 'tpage':
+        return TranslationPagePolicy(conf, n_rows)
+    else:
+        raise RuntimeError("cache_replacement_policy {} is not supported. "
+            "Choose from {}".format(name, POLICIES))
+
+
+class KeyList(object):
+    """
+    Doubly linked list of distinct keys, from the front (least recent)
+    to the back (most recent). Keys cannot be None. All operations except
+    iteration are O(1).
+    """
+    def __init__(self):
+        # None is the sentinel
+        self._prev = {None: None}
+        self._next = {None: None}
+
+    def __len__(self):
+        return len(self._next) - 1
+
+    def __contains__(self, key):
+        return key is not None and key in self._next
+
+    def front(self):
+        return self._next[None]
+
+    def back(self):
+        return self._prev[None]
+
+    def next_of(self, key):
+        return self._next[key]
+
+    def _link(self, key, prev, after):
+        assert key is not None and key not in self._next
+        self._prev[key] = prev
+        self._next[key] = after
+        self._next[prev] = key
+        self._prev[after] = key
+
+    def append(self, key):
+        self._link(key, self._prev[None], None)
+
+    def appendleft(self, key):
+        self._link(key, None, self._next[None])
+
+    def insert_before(self, key, at):
+        self._link(key, self._prev[at], at)
+
+    def remove(self, key):
+        prev = self._prev.pop(key)
+        after = self._next.pop(key)
+        self._next[prev] = after
+        self._prev[after] = prev
+
+    def move_to_back(self, key):
+        self.remove(key)
+        self.append(key)
+
+    def popleft(self):
+        key = self._next[None]
+        self.remove(key)
+        return key
+
+    def __iter__(self):
+        # the current key can be removed while iterating
+        key = self._next[None]
+        while key is not None:
+            after = self._next[key]
+            yield key
+            key = after
+
+
+class ReplacementPolicy(object):
+    """
+    Base of replacement policies, see the module docstring for the
+    interface
+    """
+    def __init__(self, conf, n_rows):
+        self.conf = conf
+        self.n_rows = n_rows
+        self._lpns = array.array('l', [NIL]) * n_rows
+        self._m_vpns = array.array('l', [NIL]) * n_rows
+
+    def _set_row(self, rowid, lpn, m_vpn):
+        self._lpns[rowid] = lpn
+        self._m_vpns[rowid] = m_vpn
+
+    def _first_candidate(self, row_ids, avoid_m_vpns):
+        """
+        Return (the first of row_ids not in avoid_m_vpns or None,
+        number of rows examined)
+        """
+        n_scanned = 0
+        for rowid in row_ids:
+            n_scanned += 1
+            if self._m_vpns[rowid] not in avoid_m_vpns:
+                return rowid, n_scanned
+        return None, n_scanned
+
+    def page_dirtied(self, m_vpn):
+        pass
+
+    def page_cleaned(self, m_vpn):
+        pass
+
+
+class SegmentedPolicy(ReplacementPolicy):
+    """
+    Base of policies that keep rows in a few lists (segments). A row
+    taken out by discard() goes back to the back of its segment.
+    """
+    def __init__(self, conf, n_rows):
+        super(SegmentedPolicy, self).__init__(conf, n_rows)
+        # row id -> segment, of discarded rows
+        self._parked = {}
+
+    def _segments(self):
+        raise NotImplementedError
+
+    def _segment_of(self, rowid):
+        for segment in self._segments():
+            if rowid in segment:
+                return segment
+        return None
+
+    def discard(self, rowid):
+        segment = self._segment_of(rowid)
+        if segment is not None:
+            segment.remove(rowid)
+            self._parked[rowid] = segment
+
+    def restore(self, rowid):
+        self._parked.pop(rowid).append(rowid)
+
+    def delete(self, rowid):
+        segment = self._segment_of(rowid)
+        if segment is None:
+            segment = self._parked.pop(rowid, None)
+        else:
+            segment.remove(rowid)
+        self._deleted(rowid, segment)
+
+    def _deleted(self, rowid, segment):
+        pass
+
+
+class LruPolicy(ReplacementPolicy):
+    """
+    Evictable rows grouped by m_vpn.
+
+    A row gets a larger stamp when it becomes the most recently used and a
+    smaller one when it is added as the least recently used, so stamps
+    follow the recency order of the table. Rows of an m_vpn are in a
+    doubly linked list sorted by stamp. A heap of (stamp, m_vpn) finds the
+    least recently used row while skipping avoided m_vpns as a whole.
+
+    The heap has an entry of each m_vpn with evictable rows whose stamp
+    is no larger than the stamp of the least recent row of the m_vpn.
+    Entries are re-keyed or dropped when they reach the top, so a row
+    leaving the head of its list usually costs no heap operation.
+    """
+    def __init__(self, conf, n_rows):
+        super(LruPolicy, self).__init__(conf, n_rows)
+        self._stamps = array.array('l', [0]) * n_rows
+        self._prev = array.array('l', [NIL]) * n_rows
+        self._next = array.array('l', [NIL]) * n_rows
+        self._evictable = bytearray(n_rows)
+
+        # m_vpn -> its least/most recent evictable row
+        self._heads = {}
+        self._tails = {}
+        self._heap = []
+
+        self._most_recent_stamp = 0
+        self._least_recent_stamp = 0
+
+    def _new_stamp(self, as_least_recent):
+        if as_least_recent:
+            self._least_recent_stamp -= 1
+            return self._least_recent_stamp
+        else:
+            self._most_recent_stamp += 1
+            return self._most_recent_stamp
+
+    def _new_head(self, m_vpn, old_head):
+        heap = self._heap
+        entry = (self._stamps[self._heads[m_vpn]], m_vpn)
+        if old_head != NIL and len(heap) > 0 and \
+                heap[0] == (self._stamps[old_head], m_vpn):
+            # decreasing the key of the top keeps the heap property
+            heap[0] = entry
+        elif len(heap) > 2 * len(self._heads) + 64:
+            # too many outdated entries
+            self._heap = [(self._stamps[head], vpn)
+                    for vpn, head in self._heads.items()]
+            heapq.heapify(self._heap)
+        else:
+            heapq.heappush(heap, entry)
+
+    def _insert(self, rowid):
+        m_vpn = self._m_vpns[rowid]
+        stamp = self._stamps[rowid]
+        head = self._heads.get(m_vpn, NIL)
+
+        # find the row to insert after, usually the tail or none
+        if head == NIL or stamp < self._stamps[head]:
+            prev = NIL
+        else:
+            prev = self._tails[m_vpn]
+            while self._stamps[prev] > stamp:
+                prev = self._prev[prev]
+
+        if prev == NIL:
+            after = head
+            self._heads[m_vpn] = rowid
+        else:
+            after = self._next[prev]
+            self._next[prev] = rowid
+        if after == NIL:
+            self._tails[m_vpn] = rowid
+        else:
+            self._prev[after] = rowid
+        self._prev[rowid] = prev
+        self._next[rowid] = after
+        self._evictable[rowid] = 1
+
+        if prev == NIL:
+            # the stamp of the head decreases, the entry has to be updated
+            self._new_head(m_vpn, head)
+
+    def _remove(self, rowid):
+        m_vpn = self._m_vpns[rowid]
+        prev = self._prev[rowid]
+        after = self._next[rowid]
+        self._evictable[rowid] = 0
+
+        if after == NIL:
+            if prev == NIL:
+                del self._tails[m_vpn]
+            else:
+                self._tails[m_vpn] = prev
+        else:
+            self._prev[after] = prev
+
+        if prev == NIL:
+            # the stamp of the head increases, the entry is still a lower
+            # bound, but keep the top of the heap exact as it is usually
+            # the one being evicted
+            if after == NIL:
+                del self._heads[m_vpn]
+            else:
+                self._heads[m_vpn] = after
+            heap = self._heap
+            if len(heap) > 0 and heap[0] == (self._stamps[rowid], m_vpn):
+                if after == NIL:
+                    heapq.heappop(heap)
+                else:
+                    heapq.heapreplace(heap, (self._stamps[after], m_vpn))
+        else:
+            self._next[prev] = after
+
+    def add(self, rowid, lpn, m_vpn, as_least_recent = False):
+        self._set_row(rowid, lpn, m_vpn)
+        self._stamps[rowid] = self._new_stamp(as_least_recent)
+        self._insert(rowid)
+
+    def touch(self, rowid):
+        if self._evictable[rowid] == 1 and self._next[rowid] != NIL:
+            self._remove(rowid)
+            self._stamps[rowid] = self._new_stamp(False)
+            self._insert(rowid)
+        else:
+            self._stamps[rowid] = self._new_stamp(False)
+
+    def discard(self, rowid):
+        if self._evictable[rowid] == 1:
+            self._remove(rowid)
+
+    def restore(self, rowid):
+        """ rowid goes back to its place in the recency order """
+        self._insert(rowid)
+
+    def delete(self, rowid):
+        self.discard(rowid)
+
+    def victim(self, avoid_m_vpns):
+        heap = self._heap
+        avoided = []
+        victim = None
+        n_scanned = 0
+        while len(heap) > 0:
+            stamp, m_vpn = heap[0]
+            n_scanned += 1
+            head = self._heads.get(m_vpn)
+            if head is None:
+                heapq.heappop(heap)
+            elif self._stamps[head] != stamp:
+                heapq.heapreplace(heap, (self._stamps[head], m_vpn))
+            elif m_vpn in avoid_m_vpns:
+                avoided.append(heapq.heappop(heap))
+            else:
+                victim = head
+                break
+
+        for entry in avoided:
+            heapq.heappush(heap, entry)
+
+        return victim, n_scanned
+
+
+class SlruPolicy(SegmentedPolicy):
+    """
+    Rows start in the probationary segment and move to the protected
+    segment when they are used again. The protected segment holds at most
+    slru_protected_ratio of the rows; its least recent rows go back to
+    the probationary segment. Victims come from the probationary segment
+    first.
+    """
+    def __init__(self, conf, n_rows):
+        super(SlruPolicy, self).__init__(conf, n_rows)
+        self._probationary = KeyList()
+        self._protected = KeyList()
+        self._max_protected = int(n_rows * conf.get('slru_protected_ratio',
+            0.5))
+
+    def _segments(self):
+        return (self._probationary, self._protected)
+
+    def add(self, rowid, lpn, m_vpn, as_least_recent = False):
+        self._set_row(rowid, lpn, m_vpn)
+        if as_least_recent:
+            self._probationary.appendleft(rowid)
+        else:
+            self._probationary.append(rowid)
+
+    def touch(self, rowid):
+        if rowid in self._protected:
+            self._protected.move_to_back(rowid)
+        elif rowid in self._probationary:
+            self._probationary.remove(rowid)
+            self._protected.append(rowid)
+        elif rowid in self._parked:
+            self._parked[rowid] = self._protected
+        self._demote()
+
+    def restore(self, rowid):
+        super(SlruPolicy, self).restore(rowid)
+        self._demote()
+
+    def _demote(self):
+        while len(self._protected) > self._max_protected:
+            self._probationary.append(self._protected.popleft())
+
+    def victim(self, avoid_m_vpns):
+        rowid, n_scanned = self._first_candidate(self._probationary,
+                avoid_m_vpns)
+        if rowid is None:
+            rowid, n = self._first_candidate(self._protected, avoid_m_vpns)
+            n_scanned += n
+        return rowid, n_scanned
+
+
+class ClockPolicy(ReplacementPolicy):
+    """
+    Rows are on a ring with a reference bit, which is set when the row is
+    used. The hand clears set bits until it finds a row whose bit is
+    clear. Rows added as the least recent (loaded with a translation
+    page but not asked for) start with the bit clear.
+    """
+    def __init__(self, conf, n_rows):
+        super(ClockPolicy, self).__init__(conf, n_rows)
+        self._ring = KeyList()
+        self._referenced = bytearray(n_rows)
+        # next row to check, None for the front of the ring
+        self._hand = None
+
+    def _put_on_ring(self, rowid):
+        if self._hand is None:
+            self._ring.append(rowid)
+        else:
+            # right behind the hand, checked last
+            self._ring.insert_before(rowid, self._hand)
+
+    def add(self, rowid, lpn, m_vpn, as_least_recent = False):
+        self._set_row(rowid, lpn, m_vpn)
+        self._referenced[rowid] = 0 if as_least_recent else 1
+        self._put_on_ring(rowid)
+
+    def touch(self, rowid):
+        self._referenced[rowid] = 1
+
+    def discard(self, rowid):
+        if rowid in self._ring:
+            if self._hand == rowid:
+                self._hand = self._ring.next_of(rowid)
+            self._ring.remove(rowid)
+
+    def restore(self, rowid):
+        self._put_on_ring(rowid)
+
+    def delete(self, rowid):
+        self.discard(rowid)
+
+    def victim(self, avoid_m_vpns):
+        ring = self._ring
+        n_scanned = 0
+        # every row is checked at most twice
+        limit = 2 * len(ring)
+        rowid = self._hand
+        while n_scanned < limit:
+            if rowid is None:
+                rowid = ring.front()
+            n_scanned += 1
+            if self._m_vpns[rowid] not in avoid_m_vpns:
+                if self._referenced[rowid] == 0:
+                    self._hand = rowid
+                    return rowid, n_scanned
+                self._referenced[rowid] = 0
+            rowid = ring.next_of(rowid)
+
+        self._hand = rowid
+        return None, n_scanned
+
+
+class TwoQPolicy(SegmentedPolicy):
+    """
+    Full 2Q. New rows go to the A1in FIFO. Rows evicted from A1in are
+    remembered (by LPN) in the A1out ghost FIFO; an LPN found in A1out is
+    cached in the Am LRU. Victims come from A1in when it has more than
+    twoq_kin_ratio of the rows, otherwise from Am.
+    """
+    def __init__(self, conf, n_rows):
+        super(TwoQPolicy, self).__init__(conf, n_rows)
+        self._a1in = KeyList()
+        self._am = KeyList()
+        self._a1out = KeyList()
+        self._kin = max(1, int(n_rows * conf.get('twoq_kin_ratio', 0.25)))
+        self._kout = max(1, int(n_rows * conf.get('twoq_kout_ratio', 0.5)))
+
+    def _segments(self):
+        return (self._a1in, self._am)
+
+    def add(self, rowid, lpn, m_vpn, as_least_recent = False):
+        self._set_row(rowid, lpn, m_vpn)
+        if lpn in self._a1out:
+            self._a1out.remove(lpn)
+            segment = self._am
+        else:
+            segment = self._a1in
+        if as_least_recent:
+            segment.appendleft(rowid)
+        else:
+            segment.append(rowid)
+
+    def touch(self, rowid):
+        # hits in A1in do not change anything
+        if rowid in self._am:
+            self._am.move_to_back(rowid)
+
+    def _deleted(self, rowid, segment):
+        if segment is self._a1in:
+            self._a1out.append(self._lpns[rowid])
+            if len(self._a1out) > self._kout:
+                self._a1out.popleft()
+
+    def victim(self, avoid_m_vpns):
+        if len(self._a1in) > self._kin:
+            first, second = self._a1in, self._am
+        else:
+            first, second = self._am, self._a1in
+        rowid, n_scanned = self._first_candidate(first, avoid_m_vpns)
+        if rowid is None:
+            rowid, n = self._first_candidate(second, avoid_m_vpns)
+            n_scanned += n
+        return rowid, n_scanned
+
+
+class ArcPolicy(SegmentedPolicy):
+    """
+    ARC. T1 has rows used once recently and T2 rows used at least twice.
+    B1 and B2 remember the LPNs evicted from T1 and T2. A miss on an LPN
+    in B1 (B2) grows (shrinks) the target size p of T1. Victims come from
+    T1 when it is larger than p, otherwise from T2.
+    """
+    def __init__(self, conf, n_rows):
+        super(ArcPolicy, self).__init__(conf, n_rows)
+        self._t1 = KeyList()
+        self._t2 = KeyList()
+        self._b1 = KeyList()
+        self._b2 = KeyList()
+        self._p = 0.0
+
+    def _segments(self):
+        return (self._t1, self._t2)
+
+    def add(self, rowid, lpn, m_vpn, as_least_recent = False):
+        self._set_row(rowid, lpn, m_vpn)
+        if lpn in self._b1:
+            self._p = min(float(self.n_rows), self._p +
+                    max(float(len(self._b2)) / len(self._b1), 1.0))
+            self._b1.remove(lpn)
+            segment = self._t2
+        elif lpn in self._b2:
+            self._p = max(0.0, self._p -
+                    max(float(len(self._b1)) / len(self._b2), 1.0))
+            self._b2.remove(lpn)
+            segment = self._t2
+        else:
+            segment = self._t1
+        if as_least_recent:
+            segment.appendleft(rowid)
+        else:
+            segment.append(rowid)
+
+    def touch(self, rowid):
+        if rowid in self._t1:
+            self._t1.remove(rowid)
+            self._t2.append(rowid)
+        elif rowid in self._t2:
+            self._t2.move_to_back(rowid)
+        elif rowid in self._parked:
+            self._parked[rowid] = self._t2
+
+    def _deleted(self, rowid, segment):
+        if segment is self._t1:
+            self._b1.append(self._lpns[rowid])
+        elif segment is self._t2:
+            self._b2.append(self._lpns[rowid])
+
+        c = self.n_rows
+        if len(self._t1) + len(self._b1) > c and len(self._b1) > 0:
+            self._b1.popleft()
+        while len(self._t1) + len(self._t2) + len(self._b1) + \
+                len(self._b2) > 2 * c:
+            if len(self._b2) > 0:
+                self._b2.popleft()
+            else:
+                self._b1.popleft()
+
+    def victim(self, avoid_m_vpns):
+        if len(self._t1) > 0 and len(self._t1) > self._p:
+            first, second = self._t1, self._t2
+        else:
+            first, second = self._t2, self._t1
+        rowid, n_scanned = self._first_candidate(first, avoid_m_vpns)
+        if rowid is None:
+            rowid, n = self._first_candidate(second, avoid_m_vpns)
+            n_scanned += n
+        return rowid, n_scanned
+
+
+class TranslationPagePolicy(ReplacementPolicy):
+    """
+    Two-level LRU like TPFTL: cached translation pages are ordered by
+    their last access, and rows of a page by their last access.
+
+    Pages with no dirty entry are in the clean list and are evicted
+    first, least recent page first. When the last dirty entry of a page
+    becomes clean, which is usually a write-back for an eviction, the
+    page goes to the front of the clean list so the rest of it is
+    evicted next without more write-backs.
+    """
+    def __init__(self, conf, n_rows):
+        super(TranslationPagePolicy, self).__init__(conf, n_rows)
+        self._clean_pages = KeyList()
+        self._dirty_pages = KeyList()
+        # m_vpn -> KeyList of its evictable rows
+        self._page_rows = {}
+        self._dirty_m_vpns = set()
+
+    def _page_list(self, m_vpn):
+        if m_vpn in self._dirty_m_vpns:
+            return self._dirty_pages
+        else:
+            return self._clean_pages
+
+    def _insert(self, rowid, as_least_recent):
+        m_vpn = self._m_vpns[rowid]
+        rows = self._page_rows.get(m_vpn)
+        pages = self._page_list(m_vpn)
+        if rows is None:
+            rows = KeyList()
+            self._page_rows[m_vpn] = rows
+            if as_least_recent:
+                pages.appendleft(m_vpn)
+            else:
+                pages.append(m_vpn)
+        elif not as_least_recent:
+            pages.move_to_back(m_vpn)
+
+        if as_least_recent:
+            rows.appendleft(rowid)
+        else:
+            rows.append(rowid)
+
+    def add(self, rowid, lpn, m_vpn, as_least_recent = False):
+        self._set_row(rowid, lpn, m_vpn)
+        self._insert(rowid, as_least_recent)
+
+    def touch(self, rowid):
+        m_vpn = self._m_vpns[rowid]
+        rows = self._page_rows.get(m_vpn)
+        if rows is not None:
+            self._page_list(m_vpn).move_to_back(m_vpn)
+            if rowid in rows:
+                rows.move_to_back(rowid)
+
+    def discard(self, rowid):
+        m_vpn = self._m_vpns[rowid]
+        rows = self._page_rows.get(m_vpn)
+        if rows is not None and rowid in rows:
+            rows.remove(rowid)
+            if len(rows) == 0:
+                del self._page_rows[m_vpn]
+                self._page_list(m_vpn).remove(m_vpn)
+
+    def restore(self, rowid):
+        self._insert(rowid, False)
+
+    def delete(self, rowid):
+        self.discard(rowid)
+
+    def page_dirtied(self, m_vpn):
+        self._dirty_m_vpns.add(m_vpn)
+        if m_vpn in self._clean_pages:
+            self._clean_pages.remove(m_vpn)
+            self._dirty_pages.append(m_vpn)
+
+    def page_cleaned(self, m_vpn):
+        self._dirty_m_vpns.discard(m_vpn)
+        if m_vpn in self._dirty_pages:
+            self._dirty_pages.remove(m_vpn)
+            self._clean_pages.appendleft(m_vpn)
+
+    def victim(self, avoid_m_vpns):
+        n_scanned = 0
+        for pages in (self._clean_pages, self._dirty_pages):
+            for m_vpn in pages:
+                n_scanned += 1
+                if m_vpn not in avoid_m_vpns:
+                    return self._page_rows[m_vpn].front(), n_scanned
+        return None, n_scanned
+
+
+def translation_summary(general_accumulator):
+    """
+    Return mapping cache hit ratio, translation page traffic and mean
+    request latency of a run
+    """
+    hitmiss = general_accumulator.get('Mapping_Cache', {})
+    translation = general_accumulator.get('translation', {})
+    n_hits = hitmiss.get('hit', 0)
+    n_misses = hitmiss.get('miss', 0)
+    n_lookups = n_hits + n_misses
+
+    write_backs = {item: count for item, count in translation.items()
+            if item.startswith('write-back-dirty-for-')}
+    latencies = general_accumulator.get('request_latency', {})
+    counts = general_accumulator.get('request_count', {})
+    return {
+        'hit': n_hits,
+        'miss': n_misses,
+        'hit_ratio': n_hits / float(n_lookups) if n_lookups > 0 else None,
+        'write_backs': sum(write_backs.values()),
+        'write_backs_by_reason': write_backs,
+        # write-backs that requests wait for, and those of the flusher
+        'foreground_write_backs':
+            write_backs.get('write-back-dirty-for-insert', 0) +
+            write_backs.get('write-back-dirty-for-load', 0),
+        'background_write_backs':
+            write_backs.get('write-back-dirty-for-background', 0),
+        'mean_latency': {name: latency / float(counts[name])
+            for name, latency in latencies.items() if counts.get(name, 0) > 0},
+        'trans_page_reads': translation.get('read-trans-for-load', 0) +
+            translation.get('read-trans-for-prefetch', 0) +
+            translation.get('read_trans_page-for-write-back', 0),
+        }
+
+
+def compare_policies(conf, policies=POLICIES):
+    """
+    Run conf's workload with each replacement policy. Results of each run
+    go to <result_dir>/policy-<policy>.
+
+    Return {policy: translation_summary(...)}
+    """
+    # avoid circular import
+    from workflow import Workflow
+
+    summaries = {}
+    for policy in policies:
+        policy_conf = copy.deepcopy(conf)
+        policy_conf['cache_replacement_policy'] = policy
+        policy_conf['result_dir'] = os.path.join(conf['result_dir'],
+                'policy-{}'.format(policy))
+        Workflow(policy_conf).run()
+
+        result = utils.load_json(os.path.join(policy_conf['result_dir'],
+            'recorder.json'))
+        summaries[policy] = translation_summary(
+                result['general_accumulator'])
+
+    return summaries
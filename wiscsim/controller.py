@@ -126,6 +126,15 @@ class Controller(object):
         self.channels = [Channel(self.env, conf, i)
                 for i in range( self.n_channels_per_dev)]
 
+    def is_idle(self):
+        """
+        No channel is busy or has operations waiting
+        """
+        for channel in self.channels:
+            if channel.resource.count > 0 or len(channel.resource.queue) > 0:
+                return False
+        return True
+
     def get_flash_requests_for_pbns(self, block_start, block_count, op):
         """
         Mapping pbn seen by FTL to hierarchical address used by flash
@@ -42,20 +42,25 @@ class MultiChannelBlockPoolBase(object):
         return total
 
     def get_blocks_of_tag(self, tag, channel_id=None):
-        ret = []
-
-        if channel_id is None:
-            channels =  self._channel_pool
-        else:
-            channels =  [self._channel_pool[channel_id]]
+        """
+        Return a live view of the global block numbers of tag. Use
+        list() on it if you need a list that does not change.
+        """
+        return BlocksOfTagsView(self, (tag,), channel_id)
 
-        for pool in channels:
-            blocks = pool.get_blocks_of_tag(tag)
-            ret.extend(self._blocks_channel_to_global(pool.channel_id, blocks))
+    def get_blocks_of_tags(self, tags, channel_id=None):
+        "live view of the blocks that have any of tags"
+        return BlocksOfTagsView(self, tags, channel_id)
 
-        return ret
+    def get_tag(self, blocknum):
+        channel_id, block_off = self._global_to_channel(blocknum)
+        return self._channel_pool[channel_id].get_tag(block_off)
 
     def get_erasure_count_dist(self):
+        """
+        Channel pools keep their distributions up to date, so it takes
+        O(channels * distinct erasure counts)
+        """
         aggregated_dist = Counter()
         for pool in self._channel_pool:
             dist = pool.get_erasure_count_dist()
@@ -63,8 +68,10 @@ class MultiChannelBlockPoolBase(object):
 
         return aggregated_dist
 
-    def get_top_or_bottom_erasure_total(self, choice, need_nblocks):
-        dist = self.get_erasure_count_dist()
+    def get_top_or_bottom_erasure_total(self, choice, need_nblocks,
+            dist=None):
+        if dist is None:
+            dist = self.get_erasure_count_dist()
         erase_cnt, block_cnt = utils.top_or_bottom_total(dist, need_nblocks, choice)
 
         return erase_cnt, block_cnt
@@ -74,12 +81,13 @@ class MultiChannelBlockPoolBase(object):
         Return wear factor and diff
         """
         nblocks = self.total_blocks * 0.1
+        dist = self.get_erasure_count_dist()
 
         top_total, top_count = self.get_top_or_bottom_erasure_total(
-                'top', nblocks)
+                'top', nblocks, dist)
         top_average = float(top_total) / top_count
         bottom_total, bottom_count = self.get_top_or_bottom_erasure_total(
-                'bottom', nblocks)
+                'bottom', nblocks, dist)
         bottom_average = float(bottom_total) / bottom_count
 
         diff = top_average - bottom_average
@@ -102,25 +110,26 @@ class MultiChannelBlockPoolBase(object):
             return False
 
     def get_least_or_most_erased_blocks(self, tag, choice, nblocks):
-        global_counter = self.get_erasure_count()
-        if choice == LEAST_ERASED:
-            blocks_by_cnt = reversed(global_counter.most_common())
-        elif choice == MOST_ERASED:
-            blocks_by_cnt = global_counter.most_common()
-        else:
+        if choice not in (LEAST_ERASED, MOST_ERASED):
             raise NotImplementedError
 
-        tag_blocks = self.get_blocks_of_tag(tag)
-
-        # iterate from least used to most used
-        blocks = []
-        for blocknum, count in blocks_by_cnt:
-            if blocknum in tag_blocks:
-                blocks.append(blocknum)
-                if len(blocks) == nblocks:
-                    break
-
-        return blocks
+        # the best nblocks of the device are among the best nblocks of
+        # each channel. Ties are broken by global block number, as in
+        # TagBlockPool.
+        candidates = []
+        for pool in self._channel_pool:
+            blocks = pool.get_least_or_most_erased_blocks(tag, choice,
+                    nblocks)
+            for block in blocks:
+                count = pool.get_erasure_count(block)
+                blocknum = self._channel_to_global(pool.channel_id, block)
+                if choice == LEAST_ERASED:
+                    candidates.append(((count, -blocknum), blocknum))
+                else:
+                    candidates.append(((-count, blocknum), blocknum))
+
+        candidates.sort()
+        return [blocknum for _, blocknum in candidates[:nblocks]]
 
     def get_erasure_count(self):
         global_counter = Counter()
@@ -189,18 +198,21 @@ class MultiChannelBlockPool(MultiChannelBlockPoolBase):
     This is for DFTL
     """
     def current_blocks(self):
-        "return all current block numbers"
+        """
+        Return all current block numbers. Use is_current_block() to test
+        membership.
+        """
         blocknums = []
         for pool in self._channel_pool:
-            for tag in self.tags:
-                cur_blk_objs = pool.get_cur_block_obj(tag)
-                for obj in cur_blk_objs:
-                    global_blk = self._channel_to_global(pool.channel_id,
-                            obj.blocknum)
-                    blocknums.append(global_blk)
+            blocknums.extend(self._blocks_channel_to_global(pool.channel_id,
+                pool.get_cur_blocknums()))
 
         return blocknums
 
+    def is_current_block(self, blocknum):
+        channel_id, block_off = divmod(blocknum, self.n_blocks_per_channel)
+        return self._channel_pool[channel_id].is_current_block(block_off)
+
     def remove_full_cur_blocks(self):
         for pool in self._channel_pool:
             pool.remove_full_cur_blocks()
@@ -265,6 +277,52 @@ class MultiChannelBlockPool(MultiChannelBlockPoolBase):
         return ret_ppns
 
 
+class BlocksOfTagsView(object):
+    """
+    Read-only live view of the global block numbers that have any of tags,
+    in channel channel_id or in all channels if channel_id is None.
+
+    Membership test and len() are O(1) (per channel for len()), nothing is
+    copied until the view is iterated. Iteration takes a snapshot of each
+    channel's blocks, so tags can be changed while iterating.
+    """
+    def __init__(self, dev_pool, tags, channel_id=None):
+        self._dev_pool = dev_pool
+        self._tags = tuple(tags)
+        if channel_id is None:
+            self._channel_ids = range(dev_pool.n_channels)
+        else:
+            self._channel_ids = [channel_id]
+
+    def __contains__(self, blocknum):
+        dev_pool = self._dev_pool
+        if not 0 <= blocknum < dev_pool.total_blocks:
+            return False
+        channel_id, block_off = divmod(blocknum,
+                dev_pool.n_blocks_per_channel)
+        if len(self._channel_ids) == 1 and channel_id != self._channel_ids[0]:
+            return False
+        return dev_pool._channel_pool[channel_id].get_tag(block_off) \
+                in self._tags
+
+    def __len__(self):
+        return sum(self._dev_pool.count_blocks(tag, self._channel_ids)
+                for tag in self._tags)
+
+    def __iter__(self):
+        dev_pool = self._dev_pool
+        for tag in self._tags:
+            for channel_id in self._channel_ids:
+                blocks = dev_pool._channel_pool[channel_id].get_blocks_of_tag(
+                        tag)[:]
+                base = channel_id * dev_pool.n_blocks_per_channel
+                for block in blocks:
+                    yield base + block
+
+    def __repr__(self):
+        return repr(list(self))
+
+
 class ChannelBlockPool(BlockPoolWithCurBlocks):
     def __init__(self, n, tags, n_pages_per_block, channel_id):
         super(ChannelBlockPool, self).__init__(n, tags, n_pages_per_block)
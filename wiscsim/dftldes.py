@@ -1,27 +1,31 @@
+import array
 import bitarray
-from collections import deque, Counter
+from collections import deque, Counter, OrderedDict
 import csv
-import datetime
 import heapq
 import itertools
+import numpy as np
 import random
 import os
 import Queue
 import sys
 import simpy
+import time
 
 import bidict
 
+import cachepolicy
 import config
 import flash
 import ftlbuilder
-from lrulist import LruDict, SegmentedLruCache, LruCache
+from lrulist import LruDict, SegmentedLruCache, LruCache, CompactLruCache
 import recorder
 from utilities import utils
 from commons import *
 from ftlsim_commons import *
-from .blkpool import BlockPool, MOST_ERASED, LEAST_ERASED
-from .bitmap import FlashBitmap2
+from .blkpool import BlockPool, MOST_ERASED, LEAST_ERASED, TDATA, TTRANS
+from .bitmap import BucketedFlashBitmap
+from .oobstore import ArrayMap
 
 
 
@@ -85,7 +89,7 @@ class Ftl(object):
         self.env = env
 
         self.block_pool = BlockPool(confobj)
-        self.oob = OutOfBandAreas(confobj)
+        self.oob = OutOfBandAreas(confobj, env)
 
         self._directory = GlobalTranslationDirectory(self.conf,
                 self.oob, self.block_pool)
@@ -161,6 +165,12 @@ class Ftl(object):
         yield self.env.process(self._mappings.flush())
         self._mappings.drop()
 
+    def trans_cache_dirty_ratio(self):
+        return self._mappings.dirty_ratio()
+
+    def write_back_trans_cache(self, n_pages):
+        yield self.env.process(self._mappings.write_back_dirtiest(n_pages))
+
     def write_ext(self, extent):
         req_size = extent.lpn_count * self.conf.page_size
         self.recorder.add_to_general_accumulater('traffic', 'write', req_size)
@@ -218,21 +228,8 @@ class Ftl(object):
 
     def _update_metadata_for_relocating_lpns(self, lpns, new_ppns, tag=None):
         """
-        This may be parallelized.
-        """
-        old_ppns = yield self.env.process(
-                self._mappings.lpns_to_ppns(lpns, tag))
-
-        for lpn, old_ppn, new_ppn in zip(lpns, old_ppns, new_ppns):
-            yield self.env.process(
-                self._update_metadata_for_relocating_lpn(
-                    lpn, old_ppn, new_ppn, tag))
-
-    def _update_metadata_for_relocating_lpn(self, lpn, old_ppn, new_ppn,
-            tag=None):
-        """
-        contents of lpn used to be in old_ppn, but now it is in new_ppn.
-        This function adjust all metadata to reflect the change.
+        contents of lpns used to be in old_ppns, but now they are in
+        new_ppns. This function adjust all metadata to reflect the change.
 
         ----- template for metadata change --------
         # mappings in cache
@@ -253,9 +250,12 @@ class Ftl(object):
         # blockpool
         raise NotImplementedError()
         """
+        old_ppns = yield self.env.process(
+                self._mappings.lpns_to_ppns(lpns, tag))
+
         # mappings in cache
         yield self.env.process(
-                self._mappings.update(lpn=lpn, ppn=new_ppn, tag=tag))
+                self._mappings.update_batch(dict(zip(lpns, new_ppns)), tag))
 
         # mappings on flash
         #   handled by _mappings
@@ -265,8 +265,7 @@ class Ftl(object):
 
         # oob state
         # oob ppn->lpn/vpn
-        self.oob.relocate_data_page(lpn=lpn, old_ppn=old_ppn, new_ppn=new_ppn,
-                update_time=True)
+        self.oob.relocate_data_pages(lpns, old_ppns, new_ppns)
 
         # blockpool
         #   should be handled when we got new_ppn
@@ -393,6 +392,21 @@ class Ftl(object):
 def remove_invalid_ppns(ppns):
     return [ppn for ppn in ppns if not ppn in (UNINITIATED, MISS)]
 
+def ppn_ranges(ppns):
+    """
+    Iterate (start, end) of runs of consecutive increasing ppns
+    """
+    start = end = None
+    for ppn in ppns:
+        if ppn == end:
+            end += 1
+        else:
+            if start is not None:
+                yield start, end
+            start, end = ppn, ppn + 1
+    if start is not None:
+        yield start, end
+
 def split_ext_to_mvpngroups(conf, extent):
     """
     return a list of extents, each belongs to one m_vpn
@@ -418,6 +432,24 @@ def split_ext_to_mvpngroups(conf, extent):
     return group_extent_list
 
 
+def group_by_m_vpn(conf, lpns):
+    """
+    Return [(m_vpn, [lpn, ...]), ...] of consecutive lpns of the same
+    m_vpn. lpns can also be (lpn, value) pairs.
+    """
+    groups = []
+    last_m_vpn = None
+    for item in lpns:
+        lpn = item[0] if isinstance(item, tuple) else item
+        m_vpn = conf.lpn_to_m_vpn(lpn)
+        if m_vpn != last_m_vpn:
+            group = []
+            groups.append((m_vpn, group))
+            last_m_vpn = m_vpn
+        group.append(item)
+    return groups
+
+
 class MappingDict(dict):
     """
     Used to map lpn->ppn
@@ -433,25 +465,31 @@ class FlashTransmitMixin(object):
 
         # We have to mark it clean before writing it back because
         # if we do it after writing flash, the cache may already changed
-        self._lpn_table.mark_clean_multiple(mapping_in_cache.keys())
+        if self._lpn_table.n_dirty_of_m_vpn(m_vpn) > 0:
+            self._lpn_table.mark_clean_multiple(mapping_in_cache.keys())
 
         if len(mapping_in_cache) < self.conf.n_mapping_entries_per_page:
             # Not all mappings are in cache
             self.recorder.count_me("translation", 'read_trans_page-for-write-back')
-            mapping_in_flash = yield self.env.process(
+            page = yield self.env.process(
                     self._read_translation_page(m_vpn, tag))
-            latest_mapping = mapping_in_flash
-            latest_mapping.update(mapping_in_cache)
         else:
-            # all mappings are in cache, no need to read the translation page
-            latest_mapping = mapping_in_cache
+            # all mappings are in cache, no need to read the translation
+            # page, all its entries are overwritten below
+            page = self.mapping_on_flash.read_page(m_vpn)
+
+        first_lpn = m_vpn * self.conf.n_mapping_entries_per_page
+        for lpn, ppn in mapping_in_cache.items():
+            page[lpn - first_lpn] = encode_ppn(ppn)
 
         yield self.env.process(
-            self.__update_mapping_on_flash(m_vpn, latest_mapping, tag))
+            self.__update_mapping_on_flash(m_vpn, page, tag))
 
     def _read_translation_page(self, m_vpn, tag=None):
-        lpns = self.conf.m_vpn_to_lpns(m_vpn)
-        mapping_dict = self.mapping_on_flash.lpns_to_ppns(lpns)
+        """
+        Return the entries of m_vpn, see MappingOnFlash.read_page()
+        """
+        page = self.mapping_on_flash.read_page(m_vpn)
 
 
         # as if we readlly read from flash
@@ -468,19 +506,13 @@ class FlashTransmitMixin(object):
             op_id = op_id, op = 'read_trans_page', arg = m_vpn,
             start_time = start_time, end_time = self.env.now)
 
-        self.env.exit(mapping_dict)
+        self.env.exit(page)
 
-    def __update_mapping_on_flash(self, m_vpn, mapping_dict, tag=None):
+    def __update_mapping_on_flash(self, m_vpn, page, tag=None):
         """
-        mapping_dict should only has lpns belonging to m_vpn
+        page has all the entries of m_vpn
         """
-        # mapping_dict has to have all and only the entries of m_vpn
-        lpn_sample = mapping_dict.keys()[0]
-        tmp_m_vpn = self.conf.lpn_to_m_vpn(lpn_sample)
-        assert tmp_m_vpn == m_vpn
-        assert len(mapping_dict) == self.conf.n_mapping_entries_per_page
-
-        self.mapping_on_flash.batch_update(mapping_dict)
+        self.mapping_on_flash.write_page(m_vpn, page)
 
         yield self.env.process(self.__program_translation_page(m_vpn, tag))
 
@@ -537,7 +569,7 @@ class InsertMixin(object):
 
     def __evict_entry_for_insert(self, tag=None):
         victim_row = self._victim_row(avoid_m_vpns=[])
-        victim_row.state = USED_AND_HOLD
+        self._lpn_table.hold_used_row(victim_row.rowid)
 
         yield self._concurrent_trans_quota.get(1)
 
@@ -559,10 +591,11 @@ class InsertMixin(object):
         # later write the new dirty one back to flash
         # assert victim_row.dirty == False, repr(victim_row)
         assert victim_row.state == USED_AND_HOLD
-        victim_row.state = USED
+        self._lpn_table.unhold_used_row(victim_row.rowid)
 
         self.recorder.count_me('translation', 'delete-lpn-in-table-for-insert')
         locked_row_id = self._lpn_table.delete_lpn_and_lock(victim_row.lpn)
+        self._entry_evicted(m_vpn)
 
         self._trans_page_locks.release_request(m_vpn, tp_req)
         self._trans_page_locks.locked_addrs.remove(m_vpn)
@@ -584,19 +617,8 @@ class LoadMixin(object):
 
         # check again before really loading
         if wanted_lpn is not None and not self._lpn_table.has_lpn(wanted_lpn):
-            n_needed = self._lpn_table.needed_space_for_m_vpn(m_vpn)
-            locked_rows = self._lpn_table.lock_free_rows(n_needed)
-            n_more = n_needed - len(locked_rows)
-
-            if n_more > 0:
-                more_locked_rows = yield self.env.process(
-                    self.__add_locked_room_for_load(n_more, loading_m_vpn=m_vpn,
-                        tag=tag))
-                locked_rows += more_locked_rows
-
-            yield self.env.process(
-                self.__load_to_locked_space(m_vpn, locked_rows, tag=tag))
-
+            self.recorder.count_me('translation', 'read-trans-for-load')
+            yield self.env.process(self._load_uncached(m_vpn, tag=tag))
             loaded = True
         else:
             loaded = False
@@ -610,6 +632,24 @@ class LoadMixin(object):
 
         self.env.exit((loaded, ppn))
 
+    def _load_uncached(self, m_vpn, tag=None):
+        """
+        Load the uncached entries of m_vpn as the least recent entries.
+        The caller holds the translation page lock of m_vpn.
+        """
+        n_needed = self._lpn_table.needed_space_for_m_vpn(m_vpn)
+        locked_rows = self._lpn_table.lock_free_rows(n_needed)
+        n_more = n_needed - len(locked_rows)
+
+        if n_more > 0:
+            more_locked_rows = yield self.env.process(
+                self.__add_locked_room_for_load(n_more, loading_m_vpn=m_vpn,
+                    tag=tag))
+            locked_rows += more_locked_rows
+
+        yield self.env.process(
+            self.__load_to_locked_space(m_vpn, locked_rows, tag=tag))
+
     def __add_locked_room_for_load(self, n_needed, loading_m_vpn, tag=None):
         locked_row_ids = []
         for i in range(n_needed):
@@ -622,7 +662,7 @@ class LoadMixin(object):
     def __evict_entry_for_load(self, loading_m_vpn, tag=None):
         victim_row = self._victim_row(
                 [loading_m_vpn] + list(self._trans_page_locks.locked_addrs))
-        victim_row.state = USED_AND_HOLD
+        self._lpn_table.hold_used_row(victim_row.rowid)
 
         m_vpn = self.conf.lpn_to_m_vpn(lpn = victim_row.lpn)
 
@@ -640,11 +680,12 @@ class LoadMixin(object):
                 "lpn_table does not has lpn {}.".format(victim_row.lpn)
         # assert victim_row.dirty == False, repr(victim_row)
         assert victim_row.state == USED_AND_HOLD
-        victim_row.state = USED
+        self._lpn_table.unhold_used_row(victim_row.rowid)
 
         # This is the only place that we delete a lpn
         self.recorder.count_me('translation', 'delete-lpn-in-table-for-load')
         locked_row_id = self._lpn_table.delete_lpn_and_lock(victim_row.lpn)
+        self._entry_evicted(m_vpn)
 
         self._trans_page_locks.release_request(m_vpn, tp_req)
         self._trans_page_locks.locked_addrs.remove(m_vpn)
@@ -656,10 +697,9 @@ class LoadMixin(object):
         It should not call _write_back() directly or indirectly as it
         will deadlock.
         """
-        self.recorder.count_me('translation', 'read-trans-for-load')
-        mapping_dict = yield self.env.process(
+        page = yield self.env.process(
                 self._read_translation_page(m_vpn, tag))
-        uncached_mapping = self.__get_uncached_mappings(mapping_dict)
+        uncached_mapping = self.__get_uncached_mappings(m_vpn, page)
 
         n_needed = len(uncached_mapping)
         needed_rows = locked_rows[:n_needed]
@@ -669,13 +709,109 @@ class LoadMixin(object):
                 as_least_recent = True)
         self._lpn_table.unlock_free_rows(unused_rows)
 
-    def __get_uncached_mappings(self, mapping_dict):
+    def __get_uncached_mappings(self, m_vpn, page):
         uncached_mapping = {}
-        for lpn, ppn in mapping_dict.items():
-            if not self._lpn_table.has_lpn(lpn):
-                uncached_mapping[lpn] = ppn
+        has_lpn = self._lpn_table.has_lpn
+        lpn = m_vpn * self.conf.n_mapping_entries_per_page
+        for value in page:
+            if not has_lpn(lpn):
+                uncached_mapping[lpn] = decode_ppn(value)
+            lpn += 1
         return uncached_mapping
 
+class PrefetchMixin(object):
+    """
+    Sequential translation page prefetching
+
+    A demand miss of m_vpn, or the first use of a prefetched m_vpn, right
+    after the same of m_vpn - 1 extends a sequential stream. Once a stream
+    has trans_prefetch_trigger pages, the next trans_prefetch_pages
+    translation pages are loaded in the background as least recent
+    entries. A prefetch only starts if _concurrent_trans_quota has room
+    for it right away, so it never waits behind demand loads.
+
+    Counters of 'prefetch': pages (extra translation page reads), hit
+    (prefetched pages used), wasted (prefetched pages evicted before use),
+    no-quota and cancelled (pages already loaded when the prefetch ran).
+    """
+    # number of streams remembered
+    max_prefetch_streams = 32
+
+    def _init_prefetch(self):
+        self._n_prefetch_pages = self.conf.get('trans_prefetch_pages', 0)
+        self._prefetch_trigger = self.conf.get('trans_prefetch_trigger', 2)
+        # next m_vpn of a stream -> number of pages in the stream
+        self._prefetch_streams = OrderedDict()
+        self._prefetching_m_vpns = set()
+        # prefetched pages not used yet
+        self._prefetched_m_vpns = set()
+
+    def _translated(self, m_vpn, missed):
+        """
+        m_vpn has been translated by a demand lookup
+        """
+        if self._n_prefetch_pages == 0:
+            return
+
+        if m_vpn in self._prefetched_m_vpns:
+            self._prefetched_m_vpns.remove(m_vpn)
+            self.recorder.count_me('prefetch', 'hit')
+        elif missed == False:
+            return
+
+        streams = self._prefetch_streams
+        n_pages = streams.pop(m_vpn, 0) + 1
+        streams[m_vpn + 1] = n_pages
+        if len(streams) > self.max_prefetch_streams:
+            streams.popitem(last = False)
+
+        if n_pages >= self._prefetch_trigger:
+            self._prefetch_after(m_vpn)
+
+    def _prefetch_after(self, m_vpn):
+        n_pages = self.conf.total_translation_pages()
+        quota = self._concurrent_trans_quota
+        for next_m_vpn in range(m_vpn + 1,
+                min(m_vpn + 1 + self._n_prefetch_pages, n_pages)):
+            if next_m_vpn in self._prefetching_m_vpns or \
+                    next_m_vpn in self._prefetched_m_vpns or \
+                    self._lpn_table.needed_space_for_m_vpn(next_m_vpn) == 0:
+                continue
+            if quota.level < 2:
+                self.recorder.count_me('prefetch', 'no-quota')
+                break
+            # the quota is taken now, before other prefetches look at it
+            quota_req = quota.get(2)
+            self._prefetching_m_vpns.add(next_m_vpn)
+            self.env.process(self._prefetch(next_m_vpn, quota_req))
+
+    def _prefetch(self, m_vpn, quota_req):
+        yield quota_req
+        tp_req = self._trans_page_locks.get_request(m_vpn)
+        yield tp_req
+        self._trans_page_locks.locked_addrs.add(m_vpn)
+
+        if self._lpn_table.needed_space_for_m_vpn(m_vpn) > 0:
+            self.recorder.count_me('translation', 'read-trans-for-prefetch')
+            self.recorder.count_me('prefetch', 'pages')
+            yield self.env.process(self._load_uncached(m_vpn))
+            self._prefetched_m_vpns.add(m_vpn)
+        else:
+            self.recorder.count_me('prefetch', 'cancelled')
+
+        self._trans_page_locks.release_request(m_vpn, tp_req)
+        self._trans_page_locks.locked_addrs.remove(m_vpn)
+        self._prefetching_m_vpns.remove(m_vpn)
+
+        yield self._concurrent_trans_quota.put(2)
+
+    def _entry_evicted(self, m_vpn):
+        if m_vpn in self._prefetched_m_vpns and \
+                self._lpn_table.n_cached_of_m_vpn(m_vpn) == 0:
+            self._prefetched_m_vpns.remove(m_vpn)
+            self.recorder.count_me('prefetch', 'wasted')
+
+
 class FlushMixin(object):
     """
     Write back all dirty entries in translation cache
@@ -700,7 +836,8 @@ class FlushMixin(object):
                 self._trans_page_locks.locked_addrs.remove(m_vpn)
 
 
-class MappingCache(FlashTransmitMixin, InsertMixin, LoadMixin, FlushMixin):
+class MappingCache(FlashTransmitMixin, InsertMixin, LoadMixin, PrefetchMixin,
+        FlushMixin):
     """
     TODO: should separate operations that do/do not change recency
     """
@@ -715,7 +852,7 @@ class MappingCache(FlashTransmitMixin, InsertMixin, LoadMixin, FlushMixin):
         self.directory = directory
         self.mapping_on_flash = mapping_on_flash
 
-        self._lpn_table = LpnTableMvpn(confobj)
+        self._lpn_table = create_lpn_table(confobj)
 
         self._trans_page_locks = trans_page_locks
 
@@ -725,40 +862,57 @@ class MappingCache(FlashTransmitMixin, InsertMixin, LoadMixin, FlushMixin):
         self._concurrent_trans_quota = simpy.Container(self.env, init=capsize,
                 capacity=capsize)
         self._m_vpn_interface_lock = LockPool(self.env)
+        self._init_prefetch()
 
     def update_batch(self, mapping_dict, tag=None):
-        for lpn, ppn in mapping_dict.items():
-            yield self.env.process(self.update(lpn, ppn, tag))
+        """
+        Entries of the same m_vpn are updated in one step, holding the
+        interface lock of the m_vpn once.
+        """
+        for m_vpn, items in group_by_m_vpn(self.conf,
+                sorted(mapping_dict.items())):
+            yield self.env.process(
+                    self._update_single_m_vpn(m_vpn, items, tag))
 
     def update(self, lpn, ppn, tag=None):
         """
         All translation and update of the same m_vpn are serialized.
         """
         m_vpn = self.conf.lpn_to_m_vpn(lpn)
+        yield self.env.process(
+                self._update_single_m_vpn(m_vpn, [(lpn, ppn)], tag))
+
+    def _update_single_m_vpn(self, m_vpn, items, tag=None):
+        """
+        items are (lpn, ppn) of m_vpn
+        """
         req = self._m_vpn_interface_lock.get_request(m_vpn)
         yield req
 
-        if self._lpn_table.has_lpn(lpn):
-            self.recorder.count_me('translation', 'overwrite-in-cache')
-            self._lpn_table.overwrite_lpn(lpn, ppn, dirty=True)
-        else:
-            if self._lpn_table.n_free_rows() > 0:
+        for lpn, ppn in items:
+            if self._lpn_table.has_lpn(lpn):
+                self.recorder.count_me('translation', 'overwrite-in-cache')
+                self._lpn_table.overwrite_lpn(lpn, ppn, dirty=True)
+            elif self._lpn_table.n_free_rows() > 0:
                 self.recorder.count_me('translation', 'insert-to-free')
                 self._add_to_free(lpn, ppn)
             else:
-                yield self.env.process(self._insert_new_mapping(lpn, ppn, tag))
+                yield self.env.process(
+                        self._insert_new_mapping(lpn, ppn, tag))
 
         self._m_vpn_interface_lock.release_request(m_vpn, req)
 
     def lpns_to_ppns(self, lpns, tag=None):
         """
-        If lpns are of the same m_vpn, this process will only
-        have one cache miss.
+        LPNs are translated by m_vpn groups. A group holds the interface
+        lock of its m_vpn once, cached entries are resolved directly and
+        a missing translation page is loaded once.
         """
         ppns = []
-        for lpn in lpns:
-            ppn = yield self.env.process(self.lpn_to_ppn(lpn, tag))
-            ppns.append(ppn)
+        for m_vpn, group_lpns in group_by_m_vpn(self.conf, lpns):
+            group_ppns = yield self.env.process(
+                    self._translate_single_m_vpn(m_vpn, group_lpns, tag))
+            ppns.extend(group_ppns)
         self.env.exit(ppns)
 
     def lpn_to_ppn(self, lpn, tag=None):
@@ -767,42 +921,94 @@ class MappingCache(FlashTransmitMixin, InsertMixin, LoadMixin, FlushMixin):
         All translation and update of the same m_vpn are serialized.
         """
         m_vpn = self.conf.lpn_to_m_vpn(lpn)
+        ppns = yield self.env.process(
+                self._translate_single_m_vpn(m_vpn, [lpn], tag))
+        self.env.exit(ppns[0])
 
+    def _translate_single_m_vpn(self, m_vpn, lpns, tag=None):
+        """
+        lpns are of m_vpn. Each LPN is counted as a hit or a miss, as if
+        they were translated one by one.
+        """
         req = self._m_vpn_interface_lock.get_request(m_vpn)
         yield req
 
-        ppn = self._lpn_table.lpn_to_ppn(lpn)
-        if ppn == MISS:
-            loaded, ppn = yield self.env.process(
-                self._load_missing(m_vpn, wanted_lpn=lpn, tag=tag))
-            assert ppn != MISS
-        else:
-            loaded = False
+        ppns = []
+        missed = False
+        for lpn in lpns:
+            ppn = self._lpn_table.lpn_to_ppn(lpn)
+            if ppn == MISS:
+                # entries of m_vpn can be evicted by others while
+                # loading, so check every LPN
+                loaded, ppn = yield self.env.process(
+                    self._load_missing(m_vpn, wanted_lpn=lpn, tag=tag))
+                assert ppn != MISS
+            else:
+                loaded = False
 
-        if loaded == True:
-            self.recorder.count_me("Mapping_Cache", "miss")
-        else:
-            self.recorder.count_me("Mapping_Cache", "hit")
+            if loaded == True:
+                self.recorder.count_me("Mapping_Cache", "miss")
+                missed = True
+            else:
+                self.recorder.count_me("Mapping_Cache", "hit")
+            ppns.append(ppn)
 
         self._m_vpn_interface_lock.release_request(m_vpn, req)
-        self.env.exit(ppn)
+        self._translated(m_vpn, missed)
+        self.env.exit(ppns)
 
     def flush(self):
         yield self.env.process(self._flush())
 
+    def dirty_ratio(self):
+        return self._lpn_table.n_dirty_rows() / float(self.conf.n_cache_entries)
+
+    def write_back_dirtiest(self, n_pages, tag=None):
+        """
+        Write back up to n_pages translation pages with the most dirty
+        entries. Unlike flush(), it can run with other processes; pages
+        being loaded or written back are skipped. It stops when the
+        translation quota has no room, foreground work goes first.
+        """
+        quota = self._concurrent_trans_quota
+        for m_vpn in self._lpn_table.dirtiest_m_vpns(n_pages):
+            if m_vpn in self._trans_page_locks.locked_addrs:
+                continue
+            if quota.level < 1:
+                self.recorder.count_me('translation',
+                        'background-write-back-no-quota')
+                break
+
+            yield quota.get(1)
+            tp_req = self._trans_page_locks.get_request(m_vpn)
+            yield tp_req
+            self._trans_page_locks.locked_addrs.add(m_vpn)
+
+            if self._lpn_table.n_dirty_of_m_vpn(m_vpn) > 0:
+                self.recorder.count_me('translation',
+                        'write-back-dirty-for-background')
+                yield self.env.process(self._write_back(m_vpn, tag))
+
+            self._trans_page_locks.release_request(m_vpn, tp_req)
+            self._trans_page_locks.locked_addrs.remove(m_vpn)
+
+            yield quota.put(1)
+
     def drop(self):
         "flush before dropping, otherwise mapping will be lost"
         for lpn, row in self._lpn_table.least_to_most_lpn_items():
             self.recorder.count_me('translation', 'delete-lpn-in-table-for-drop')
             self._lpn_table.delete_lpn_and_lock(lpn)
             row.state = FREE
+        self._prefetched_m_vpns.clear()
 
     def _victim_row(self, avoid_m_vpns):
-        for lpn, row in self._lpn_table.least_to_most_lpn_items():
-            if row.state == USED:
-                m_vpn = self.conf.lpn_to_m_vpn(lpn)
-                if not m_vpn in avoid_m_vpns:
-                    return row
+        row, n_scanned = self._lpn_table.victim_row(avoid_m_vpns)
+        self.recorder.count_me('victim_scan', 'victims')
+        self.recorder.add_to_general_accumulater('victim_scan', 'scanned',
+                n_scanned)
+        if row is not None:
+            return row
         raise RuntimeError("Cannot find a victim. Current stats: {}"\
                 ", avoid_m_vpns: {}.\n"
                 .format(str(self._lpn_table.stats()), avoid_m_vpns))
@@ -821,7 +1027,8 @@ class LpnTable(object):
         # {lpn1: row1, lpn2: row2, ...}
         # self._lpn_to_row = SegmentedLruCache(n_rows, 0.5)
         # self._lpn_to_row = LruDict()
-        self._lpn_to_row = LruCache()
+        # self._lpn_to_row = LruCache()
+        self._lpn_to_row = CompactLruCache()
 
     def _fresh_rows(self):
          return [
@@ -1004,12 +1211,130 @@ class LpnTableMvpn(LpnTable):
         super(LpnTableMvpn, self).__init__(conf.n_cache_entries)
         self.conf = conf
 
+        # m_vpn -> set of row ids of its cached entries
+        self._m_vpn_row_ids = {}
+        # m_vpn -> number of its dirty cached entries
+        self._m_vpn_n_dirty = Counter()
+        self._n_dirty_rows = 0
+
+        self._policy = cachepolicy.create_policy(conf, self._n_rows)
+
+    def _add_n_dirty(self, lpn, delta):
+        m_vpn = self.conf.lpn_to_m_vpn(lpn)
+        self._n_dirty_rows += delta
+        n_dirty = self._m_vpn_n_dirty[m_vpn] + delta
+        assert n_dirty >= 0
+        if n_dirty == 0:
+            del self._m_vpn_n_dirty[m_vpn]
+            self._policy.page_cleaned(m_vpn)
+        else:
+            if n_dirty == delta:
+                self._policy.page_dirtied(m_vpn)
+            self._m_vpn_n_dirty[m_vpn] = n_dirty
+
+    def add_lpn(self, rowid, lpn, ppn, dirty, as_least_recent = False):
+        super(LpnTableMvpn, self).add_lpn(rowid, lpn, ppn, dirty,
+                as_least_recent)
+        m_vpn = self.conf.lpn_to_m_vpn(lpn)
+        self._m_vpn_row_ids.setdefault(m_vpn, set()).add(rowid)
+        self._policy.add(rowid, lpn, m_vpn, as_least_recent)
+        if dirty:
+            self._add_n_dirty(lpn, 1)
+
+    def lpn_to_ppn(self, lpn):
+        try:
+            row = self._lpn_to_row[lpn]
+        except KeyError:
+            return MISS
+        else:
+            self._policy.touch(row.rowid)
+            return row.ppn
+
+    def mark_clean(self, lpn):
+        was_dirty = self._lpn_to_row.peek(lpn).dirty
+        super(LpnTableMvpn, self).mark_clean(lpn)
+        if was_dirty:
+            self._add_n_dirty(lpn, -1)
+
+    def overwrite_lpn(self, lpn, ppn, dirty):
+        row = self._lpn_to_row.peek(lpn)
+        was_dirty = row.dirty
+        super(LpnTableMvpn, self).overwrite_lpn(lpn, ppn, dirty)
+        if bool(dirty) != bool(was_dirty):
+            self._add_n_dirty(lpn, 1 if dirty else -1)
+        self._policy.touch(row.rowid)
+
+    def delete_lpn_and_lock(self, lpn):
+        row = self._lpn_to_row.peek(lpn)
+        was_dirty = row.dirty
+        self._policy.delete(row.rowid)
+        rowid = super(LpnTableMvpn, self).delete_lpn_and_lock(lpn)
+
+        m_vpn = self.conf.lpn_to_m_vpn(lpn)
+        row_ids = self._m_vpn_row_ids[m_vpn]
+        row_ids.remove(rowid)
+        if len(row_ids) == 0:
+            del self._m_vpn_row_ids[m_vpn]
+        if was_dirty:
+            self._add_n_dirty(lpn, -1)
+
+        return rowid
+
+    # rows leaving USED are not evictable until they are back to USED
+    def lock_used_row(self, row_id):
+        super(LpnTableMvpn, self).lock_used_row(row_id)
+        self._policy.discard(row_id)
+
+    def unlock_used_row(self, row_id):
+        super(LpnTableMvpn, self).unlock_used_row(row_id)
+        self._policy.restore(row_id)
+
+    def hold_used_row(self, rowid):
+        super(LpnTableMvpn, self).hold_used_row(rowid)
+        self._policy.discard(rowid)
+
+    def unhold_used_row(self, rowid):
+        super(LpnTableMvpn, self).unhold_used_row(rowid)
+        self._policy.restore(rowid)
+
+    def lock_lpn(self, lpn):
+        self.lock_used_row(self._lpn_to_row.peek(lpn).rowid)
+
+    def unlock_lpn(self, lpn):
+        row = self._lpn_to_row.peek(lpn)
+        assert row.state == USED_AND_LOCKED
+        self.unlock_used_row(row.rowid)
+
+    def victim_row(self, avoid_m_vpns):
+        """
+        Return (the least recently used USED row not in avoid_m_vpns or
+        None, number of candidates examined)
+        """
+        rowid, n_scanned = self._policy.victim(avoid_m_vpns)
+        row = None if rowid is None else self._rows[rowid]
+        return row, n_scanned
+
     def least_to_most_lpn_items(self):
         return self._lpn_to_row.least_to_most_items()
 
+    def n_cached_of_m_vpn(self, m_vpn):
+        return len(self._m_vpn_row_ids.get(m_vpn, ()))
+
+    def n_dirty_of_m_vpn(self, m_vpn):
+        return self._m_vpn_n_dirty[m_vpn]
+
+    def n_dirty_rows(self):
+        return self._n_dirty_rows
+
+    def dirtiest_m_vpns(self, n):
+        """
+        Return up to n m_vpns with the most dirty cached entries
+        """
+        return [m_vpn for m_vpn, _ in self._m_vpn_n_dirty.most_common(n)]
+
     def needed_space_for_m_vpn(self, m_vpn):
-        cached_mappings = self.get_m_vpn_mappings(m_vpn)
-        return self.conf.n_mapping_entries_per_page - len(cached_mappings)
+        return self.conf.n_mapping_entries_per_page - \
+                self.n_cached_of_m_vpn(m_vpn)
 
     def get_m_vpn_mappings(self, m_vpn):
         """ return all the mappings of m_vpn that are in cache
@@ -1031,16 +1356,9 @@ class LpnTableMvpn(LpnTable):
         return row_ids
 
     def _rows_of_m_vpn(self, m_vpn):
-        lpns = self.conf.m_vpn_to_lpns(m_vpn)
-        rows = []
-        for lpn in lpns:
-            try:
-                row = self._lpn_to_row.peek(lpn)
-            except KeyError:
-                pass
-            else:
-                rows.append(row)
-
+        rows = [self._rows[rowid]
+                for rowid in self._m_vpn_row_ids.get(m_vpn, ())]
+        rows.sort(key = lambda row: row.lpn)
         return rows
 
     def get_un_cached_lpn_of_m_vpn(self, m_vpn):
@@ -1050,6 +1368,416 @@ class LpnTableMvpn(LpnTable):
         return uncached_lpns
 
 
+class ArrayLpnTable(object):
+    """
+    LpnTableMvpn backed by parallel arrays instead of a Row object and an
+    LRU Node object per entry.
+
+    Row i has lpn, ppn, dirty and state at index i of the arrays. Recency
+    is a doubly linked list of row ids in the prev/next arrays, with
+    sentinel row n_rows: next of the sentinel is the most recently used
+    row, prev of the sentinel is the least recently used one. The numbers
+    of rows in each state are kept up to date, so n_free_rows() is O(1).
+
+    Rows are handed out as ArrayRow views, which are created on demand.
+    Free rows are locked in the order of row id, like LpnTable.
+    """
+    def __init__(self, conf):
+        self.conf = conf
+        self._n_rows = conf.n_cache_entries
+        n = self._n_rows
+
+        self._lpns = array.array('l', [NONE_VALUE]) * n
+        self._ppns = array.array('l', [NONE_VALUE]) * n
+        self._dirty = bytearray(n)
+        self._states = bytearray([STATE_CODES[FREE]]) * n
+        self._prev = array.array('l', [n]) * (n + 1)
+        self._next = array.array('l', [n]) * (n + 1)
+
+        self._lpn_to_rowid = {}
+        self._state_counts = [0] * len(STATES)
+        self._state_counts[STATE_CODES[FREE]] = n
+
+        # rows >= _next_fresh_row have never been used, other free rows
+        # are in _free_heap
+        self._next_fresh_row = 0
+        self._free_heap = []
+
+        # m_vpn -> set of row ids of its cached entries
+        self._m_vpn_row_ids = {}
+        # m_vpn -> number of its dirty cached entries
+        self._m_vpn_n_dirty = Counter()
+        self._n_dirty_rows = 0
+
+        self._policy = cachepolicy.create_policy(conf, n)
+
+    # recency list
+    def _link_after(self, rowid, at):
+        after = self._next[at]
+        self._prev[rowid] = at
+        self._next[rowid] = after
+        self._next[at] = rowid
+        self._prev[after] = rowid
+
+    def _unlink(self, rowid):
+        prev = self._prev[rowid]
+        after = self._next[rowid]
+        self._next[prev] = after
+        self._prev[after] = prev
+
+    def _touch(self, rowid):
+        if self._next[self._n_rows] != rowid:
+            self._unlink(rowid)
+            self._link_after(rowid, self._n_rows)
+        self._policy.touch(rowid)
+
+    # states
+    def _set_state(self, rowid, state):
+        code = STATE_CODES[state]
+        old_code = self._states[rowid]
+        assert STATES[old_code] in ALLOWED_STATE_TRANSITIONS[state], \
+                "current state {}".format(STATES[old_code])
+        self._states[rowid] = code
+        self._state_counts[old_code] -= 1
+        self._state_counts[code] += 1
+        if state == FREE:
+            heapq.heappush(self._free_heap, rowid)
+
+        # only USED rows can be evicted, add_lpn() adds new USED rows
+        if old_code == USED_CODE and code != FREE_AND_LOCKED_CODE:
+            self._policy.discard(rowid)
+        elif code == USED_CODE and old_code != FREE_AND_LOCKED_CODE:
+            self._policy.restore(rowid)
+
+    def _set_dirty(self, rowid, dirty):
+        dirty = 1 if dirty else 0
+        delta = dirty - self._dirty[rowid]
+        self._dirty[rowid] = dirty
+        if delta != 0:
+            m_vpn = self.conf.lpn_to_m_vpn(self._lpns[rowid])
+            self._n_dirty_rows += delta
+            n_dirty = self._m_vpn_n_dirty[m_vpn] + delta
+            assert n_dirty >= 0
+            if n_dirty == 0:
+                del self._m_vpn_n_dirty[m_vpn]
+                self._policy.page_cleaned(m_vpn)
+            else:
+                if n_dirty == delta:
+                    self._policy.page_dirtied(m_vpn)
+                self._m_vpn_n_dirty[m_vpn] = n_dirty
+
+    def _set_state_of_rows(self, row_ids, state):
+        for rowid in row_ids:
+            self._set_state(rowid, state)
+
+    def row_state(self, rowid):
+        return STATES[self._states[rowid]]
+
+    def rows(self):
+        return [ArrayRow(self, rowid) for rowid in range(self._n_rows)]
+
+    def n_free_rows(self):
+        return self._state_counts[STATE_CODES[FREE]]
+
+    def n_locked_free_rows(self):
+        return self._state_counts[STATE_CODES[FREE_AND_LOCKED]]
+
+    def n_used_rows(self):
+        return self._state_counts[STATE_CODES[USED]]
+
+    def n_locked_used_rows(self):
+        return self._state_counts[STATE_CODES[USED_AND_LOCKED]]
+
+    def stats(self):
+        return Counter({state: self._state_counts[code]
+            for code, state in enumerate(STATES)
+            if self._state_counts[code] > 0})
+
+    # free rows
+    def lock_free_row(self):
+        """FREE TO FREE_AND_LOCKED"""
+        if self._free_heap:
+            rowid = heapq.heappop(self._free_heap)
+        elif self._next_fresh_row < self._n_rows:
+            rowid = self._next_fresh_row
+            self._next_fresh_row += 1
+        else:
+            return None
+        self._set_state(rowid, FREE_AND_LOCKED)
+        return rowid
+
+    def lock_free_rows(self, n):
+        row_ids = []
+        for _ in range(n):
+            rowid = self.lock_free_row()
+            if rowid is None:
+                break
+            row_ids.append(rowid)
+        return row_ids
+
+    def unlock_free_row(self, rowid):
+        """FREE_AND_LOCKED -> FREE"""
+        self._set_state(rowid, FREE)
+
+    def unlock_free_rows(self, row_ids):
+        for row_id in row_ids:
+            self.unlock_free_row(row_id)
+
+    # used rows
+    def lock_used_row(self, row_id):
+        self._set_state(row_id, USED_AND_LOCKED)
+
+    def lock_used_rows(self, row_ids):
+        self._set_state_of_rows(row_ids, USED_AND_LOCKED)
+
+    def unlock_used_row(self, row_id):
+        self._set_state(row_id, USED)
+
+    def unlock_used_rows(self, row_ids):
+        self._set_state_of_rows(row_ids, USED)
+
+    def hold_used_row(self, rowid):
+        self._set_state(rowid, USED_AND_HOLD)
+
+    def hold_used_rows(self, row_ids):
+        self._set_state_of_rows(row_ids, USED_AND_HOLD)
+
+    def unhold_used_row(self, rowid):
+        self._set_state(rowid, USED)
+
+    def unhold_used_rows(self, row_ids):
+        self._set_state_of_rows(row_ids, USED)
+
+    def lock_lpn(self, lpn):
+        self._set_state(self._lpn_to_rowid[lpn], USED_AND_LOCKED)
+
+    def unlock_lpn(self, lpn):
+        rowid = self._lpn_to_rowid[lpn]
+        assert self._states[rowid] == STATE_CODES[USED_AND_LOCKED]
+        self._set_state(rowid, USED)
+
+    # mappings
+    def add_lpns(self, row_ids, mapping_dict, dirty, as_least_recent = False):
+        assert len(row_ids) == len(mapping_dict), \
+                "{} == {}".format(len(row_ids), len(mapping_dict))
+        for row_id, (lpn, ppn) in zip(row_ids, mapping_dict.items()):
+            self.add_lpn(row_id, lpn, ppn, dirty, as_least_recent)
+
+    def add_lpn(self, rowid, lpn, ppn, dirty, as_least_recent = False):
+        assert self.has_lpn(lpn) == False, "lpn is {}.".format(lpn)
+
+        self._lpns[rowid] = lpn
+        self._ppns[rowid] = encode_ppn(ppn)
+        self._set_state(rowid, USED)
+
+        self._lpn_to_rowid[lpn] = rowid
+        m_vpn = self.conf.lpn_to_m_vpn(lpn)
+        self._m_vpn_row_ids.setdefault(m_vpn, set()).add(rowid)
+        if as_least_recent:
+            self._link_after(rowid, self._prev[self._n_rows])
+        else:
+            self._link_after(rowid, self._n_rows)
+        self._policy.add(rowid, lpn, m_vpn, as_least_recent)
+        self._set_dirty(rowid, dirty)
+
+    def lpn_to_ppn(self, lpn):
+        rowid = self._lpn_to_rowid.get(lpn)
+        if rowid is None:
+            return MISS
+        self._touch(rowid)
+        return decode_ppn(self._ppns[rowid])
+
+    def overwrite_lpn(self, lpn, ppn, dirty):
+        rowid = self._lpn_to_rowid[lpn]
+        self._touch(rowid)
+        self._ppns[rowid] = encode_ppn(ppn)
+        self._set_dirty(rowid, dirty)
+
+    def mark_clean(self, lpn):
+        rowid = self._lpn_to_rowid[lpn]
+        assert STATES[self._states[rowid]] in (USED, USED_AND_HOLD)
+        self._set_dirty(rowid, False)
+
+    def mark_clean_multiple(self, lpns):
+        for lpn in lpns:
+            self.mark_clean(lpn)
+
+    def is_dirty(self, lpn):
+        return self._dirty[self._lpn_to_rowid[lpn]] == 1
+
+    def delete_lpn_and_lock(self, lpn):
+        rowid = self._lpn_to_rowid.pop(lpn)
+        assert self._states[rowid] == STATE_CODES[USED]
+        self._unlink(rowid)
+        self._policy.delete(rowid)
+        self._set_dirty(rowid, False)
+
+        m_vpn = self.conf.lpn_to_m_vpn(lpn)
+        row_ids = self._m_vpn_row_ids[m_vpn]
+        row_ids.remove(rowid)
+        if len(row_ids) == 0:
+            del self._m_vpn_row_ids[m_vpn]
+
+        self._lpns[rowid] = NONE_VALUE
+        self._ppns[rowid] = NONE_VALUE
+        self._set_state(rowid, FREE_AND_LOCKED)
+
+        return rowid
+
+    def has_lpn(self, lpn):
+        return lpn in self._lpn_to_rowid
+
+    def victim_row(self, avoid_m_vpns):
+        """
+        Return (the least recently used USED row not in avoid_m_vpns or
+        None, number of candidates examined)
+        """
+        rowid, n_scanned = self._policy.victim(avoid_m_vpns)
+        row = None if rowid is None else ArrayRow(self, rowid)
+        return row, n_scanned
+
+    def least_to_most_lpn_items(self):
+        sentinel = self._n_rows
+        rowid = self._prev[sentinel]
+        while rowid != sentinel:
+            # the row may be deleted by the consumer
+            prev = self._prev[rowid]
+            yield self._lpns[rowid], ArrayRow(self, rowid)
+            rowid = prev
+
+    # m_vpn
+    def n_cached_of_m_vpn(self, m_vpn):
+        return len(self._m_vpn_row_ids.get(m_vpn, ()))
+
+    def n_dirty_of_m_vpn(self, m_vpn):
+        return self._m_vpn_n_dirty[m_vpn]
+
+    def n_dirty_rows(self):
+        return self._n_dirty_rows
+
+    def dirtiest_m_vpns(self, n):
+        """
+        Return up to n m_vpns with the most dirty cached entries
+        """
+        return [m_vpn for m_vpn, _ in self._m_vpn_n_dirty.most_common(n)]
+
+    def needed_space_for_m_vpn(self, m_vpn):
+        return self.conf.n_mapping_entries_per_page - \
+                self.n_cached_of_m_vpn(m_vpn)
+
+    def _row_ids_of_m_vpn(self, m_vpn):
+        return sorted(self._m_vpn_row_ids.get(m_vpn, ()),
+                key = lambda rowid: self._lpns[rowid])
+
+    def get_m_vpn_mappings(self, m_vpn):
+        """ return all the mappings of m_vpn that are in cache
+        """
+        return {self._lpns[rowid]: decode_ppn(self._ppns[rowid])
+                for rowid in self._row_ids_of_m_vpn(m_vpn)}
+
+    def row_ids_of_m_vpn(self, m_vpn):
+        return self._row_ids_of_m_vpn(m_vpn)
+
+    def get_un_cached_lpn_of_m_vpn(self, m_vpn):
+        return set(lpn for lpn in self.conf.m_vpn_to_lpns(m_vpn)
+                if lpn not in self._lpn_to_rowid)
+
+
+class ArrayRow(object):
+    """
+    A row of ArrayLpnTable, with the attributes of Row
+    """
+    __slots__ = ('_table', '_rowid')
+
+    def __init__(self, table, rowid):
+        self._table = table
+        self._rowid = rowid
+
+    def _assert_modification_allowed(self):
+        state = self.state
+        assert state in (FREE_AND_LOCKED, USED, USED_AND_HOLD), \
+                "current state {}".format(state)
+
+    @property
+    def rowid(self):
+        return self._rowid
+
+    @property
+    def lpn(self):
+        lpn = self._table._lpns[self._rowid]
+        return None if lpn == NONE_VALUE else lpn
+
+    @property
+    def ppn(self):
+        return decode_ppn(self._table._ppns[self._rowid])
+
+    @property
+    def dirty(self):
+        return self._table._dirty[self._rowid] == 1
+
+    @dirty.setter
+    def dirty(self, dirty):
+        self._assert_modification_allowed()
+        self._table._set_dirty(self._rowid, dirty)
+
+    @property
+    def state(self):
+        return self._table.row_state(self._rowid)
+
+    @state.setter
+    def state(self, state_value):
+        self._table._set_state(self._rowid, state_value)
+
+    def __repr__(self):
+        return "lpn:{}, ppn:{}, dirty:{}, rowid:{}".format(self.lpn,
+            self.ppn, self.dirty, self._rowid)
+
+
+# sentinels of lpn/ppn arrays of ArrayLpnTable
+NONE_VALUE, UNINITIATED_VALUE = -1, -2
+
+
+def encode_ppn(ppn):
+    if ppn is None:
+        return NONE_VALUE
+    elif ppn == UNINITIATED:
+        return UNINITIATED_VALUE
+    return ppn
+
+
+def decode_ppn(value):
+    if value == NONE_VALUE:
+        return None
+    elif value == UNINITIATED_VALUE:
+        return UNINITIATED
+    return value
+
+
+STATES = (FREE, FREE_AND_LOCKED, USED, USED_AND_LOCKED, USED_AND_HOLD)
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+USED_CODE = STATE_CODES[USED]
+FREE_AND_LOCKED_CODE = STATE_CODES[FREE_AND_LOCKED]
+# new state -> allowed current states, see Row.state
+ALLOWED_STATE_TRANSITIONS = {
+        FREE: (FREE_AND_LOCKED,),
+        FREE_AND_LOCKED: (FREE, USED),
+        USED: (FREE_AND_LOCKED, USED_AND_LOCKED, USED_AND_HOLD),
+        USED_AND_LOCKED: (USED,),
+        USED_AND_HOLD: (USED,),
+        }
+
+
+def create_lpn_table(conf):
+    table_class = conf.get('lpn_table_class', 'LpnTableMvpn')
+    if table_class == 'LpnTableMvpn':
+        return LpnTableMvpn(conf)
+    elif table_class == 'ArrayLpnTable':
+        return ArrayLpnTable(conf)
+    else:
+        raise RuntimeError("lpn_table_class {} is not supported".format(
+            table_class))
+
+
 class _Row(object):
     def __init__(self, lpn, ppn, dirty, state, rowid):
         self.lpn = lpn
@@ -1165,10 +1893,23 @@ class CacheEntryData(object):
             self.ppn, self.dirty)
 
 
+def ppn_typecode(conf):
+    """
+    Typecode of arrays of PPNs (and the negative sentinels) of conf
+    """
+    if conf.total_num_pages() < 2**31:
+        return 'i'
+    else:
+        return 'l'
+
+
 class MappingOnFlash(object):
     """
     This mapping table is for data pages, not for translation pages.
     GMT should have entries as many as the number of pages in flash
+
+    Entries are in an array indexed by LPN, with ppns encoded by
+    encode_ppn(). The entries of a translation page are a slice of it.
     """
     def __init__(self, confobj):
         if not isinstance(confobj, config.Config):
@@ -1179,9 +1920,10 @@ class MappingOnFlash(object):
 
         self.n_entries_per_page = self.conf.n_mapping_entries_per_page
 
-        # do the easy thing first, if necessary, we can later use list or
-        # other data structure
-        self.entries = {}
+        n_entries = self.conf.total_translation_pages() * \
+                self.n_entries_per_page
+        self._ppns = array.array(ppn_typecode(self.conf),
+                [UNINITIATED_VALUE]) * n_entries
 
     def lpn_to_ppn(self, lpn):
         """
@@ -1189,14 +1931,14 @@ class MappingOnFlash(object):
         None because at the beginning there is no mapping. No valid data block
         on device.
         """
-        return self.entries.get(lpn, UNINITIATED)
+        return decode_ppn(self._ppns[lpn])
 
     def update(self, lpn, ppn):
-        self.entries[lpn] = ppn
+        self._ppns[lpn] = encode_ppn(ppn)
 
     def batch_update(self, mapping_dict):
         for lpn, ppn in mapping_dict.items():
-            self.update(lpn, ppn)
+            self._ppns[lpn] = encode_ppn(ppn)
 
     def lpns_to_ppns(self, lpns):
         d = MappingDict()
@@ -1205,8 +1947,26 @@ class MappingOnFlash(object):
 
         return d
 
+    def read_page(self, m_vpn):
+        """
+        Return a copy of the encoded entries of translation page m_vpn
+        """
+        start = m_vpn * self.n_entries_per_page
+        return self._ppns[start:start + self.n_entries_per_page]
+
+    def write_page(self, m_vpn, page):
+        """
+        page has all the encoded entries of translation page m_vpn
+        """
+        assert len(page) == self.n_entries_per_page
+        start = m_vpn * self.n_entries_per_page
+        self._ppns[start:start + self.n_entries_per_page] = page
+
     def __repr__(self):
-        return "global mapping table: {}".format(repr(self.entries))
+        entries = {lpn: decode_ppn(value)
+                for lpn, value in enumerate(self._ppns)
+                if value != UNINITIATED_VALUE}
+        return "global mapping table: {}".format(repr(entries))
 
 
 class GlobalTranslationDirectory(object):
@@ -1226,10 +1986,11 @@ class GlobalTranslationDirectory(object):
 
         self.n_entries_per_page = self.conf.n_mapping_entries_per_page
 
-        # M_VPN -> M_PPN
+        # M_VPN -> M_PPN, NONE_VALUE if m_vpn has no mapping
         # Virtual translation page number --> Physical translation page number
         # Dftl should initialize
-        self.mapping = {}
+        self._m_ppns = array.array(ppn_typecode(self.conf), [NONE_VALUE]) * \
+                self.conf.total_translation_pages()
 
         self._initialize()
 
@@ -1257,19 +2018,31 @@ class GlobalTranslationDirectory(object):
         """
         m_vpn virtual translation page number. It should always be successfull.
         """
-        return self.mapping[m_vpn]
+        m_ppn = self._m_ppns[m_vpn]
+        if m_ppn == NONE_VALUE:
+            raise KeyError(m_vpn)
+        return m_ppn
 
     def add_mapping(self, m_vpn, m_ppn):
-        if self.mapping.has_key(m_vpn):
+        if self._m_ppns[m_vpn] != NONE_VALUE:
             raise RuntimeError("self.mapping already has m_vpn:{}"\
                 .format(m_vpn))
-        self.mapping[m_vpn] = m_ppn
+        self._m_ppns[m_vpn] = m_ppn
 
     def update_mapping(self, m_vpn, m_ppn):
-        self.mapping[m_vpn] = m_ppn
+        self._m_ppns[m_vpn] = m_ppn
 
     def remove_mapping(self, m_vpn):
-        del self.mapping[m_vpn]
+        self.m_vpn_to_m_ppn(m_vpn)
+        self._m_ppns[m_vpn] = NONE_VALUE
+
+    @property
+    def mapping(self):
+        """
+        {m_vpn: m_ppn} of all the mapped translation pages
+        """
+        return {m_vpn: m_ppn for m_vpn, m_ppn in enumerate(self._m_ppns)
+                if m_ppn != NONE_VALUE}
 
     def lpn_to_m_ppn(self, lpn):
         m_vpn = self.conf.lpn_to_m_vpn(lpn)
@@ -1299,12 +2072,11 @@ class WearLevelingVictimBlocks(object):
         used_trans_blocks = self._block_pool.trans_usedblocks
 
         self._block_pool.remove_full_cur_blocks()
-        cur_blocks = self._block_pool.current_blocks()
 
         # we need used data or trans block
         victim_cnt = 0
         for blocknum, count in least_used_blocks:
-            if blocknum in cur_blocks:
+            if self._block_pool.is_current_block(blocknum):
                 # skip current blocks
                 # continue
                 pass
@@ -1337,62 +2109,88 @@ class VictimBlocks(object):
         return repr(list(self.iterator_verbose()))
 
     def iterator_verbose(self):
-        candidate_tuples = self._candidate_priorityq()
-        while True:
-            try:
-                valid_ratio, block_type, block_num = heapq.heappop(candidate_tuples)
-                yield valid_ratio, block_type, block_num
-            except IndexError:
-                # Out of victim blocks
-                raise StopIteration
+        """
+        Yield (valid_ratio, block_type, blocknum) of victim candidates,
+        fewest valid pages first. Ties are broken by block type and then
+        block number.
 
-    def get_valid_ratio_counter_of_used_blocks(self):
-        used_blocks = self._block_pool.used_blocks
-        counter = Counter()
-        for block in used_blocks:
-            valid_ratio = self._oob.states.block_valid_ratio(block)
-            ratio_str = "{0:.2f}".format(valid_ratio)
-            counter[ratio_str] += 1
-        return counter
+        Candidates come from the buckets of oob.states by number of
+        valid pages, a bucket is only looked at when the previous ones
+        are used up.
+        """
+        self._block_pool.remove_full_cur_blocks()
 
-    def _candidate_priorityq(self):
-        candidate_tuples = self._victim_candidates()
-        heapq.heapify(candidate_tuples)
-        return candidate_tuples
+        n_pages = float(self._conf.n_pages_per_block)
+        for n_valid in self._victim_valid_counts():
+            valid_ratio = n_valid / n_pages
+            for block_type, block in self._candidates_of_valid_count(n_valid):
+                yield valid_ratio, block_type, block
 
-    def _form_tuples(self, used_blocks, block_type):
-        assert block_type in (self.TYPE_DATA, self.TYPE_TRANS)
+    def pick(self, n_victims):
+        "Return tuples of up to n_victims best victims at this moment"
+        return list(itertools.islice(self.iterator_verbose(), n_victims))
 
+    def count_candidates(self):
+        """
+        Return the number of blocks iterator_verbose() would yield. It
+        assumes that programmed blocks are used blocks.
+        """
         self._block_pool.remove_full_cur_blocks()
-        cur_blocks = self._block_pool.current_blocks()
 
-        victim_candidates = []
-        for block in used_blocks:
-            if block in cur_blocks:
-                # skip current blocks
-                continue
+        states = self._oob.states
+        valid_counts = self._victim_valid_counts()
+        n_candidates = sum(len(states.blocks_of_valid_count(n_valid))
+                for n_valid in valid_counts)
+        for block in self._block_pool.current_blocks():
+            if states.block_erased_count(block) < self._conf.n_pages_per_block \
+                    and states.block_valid_count(block) in valid_counts:
+                n_candidates -= 1
+        return n_candidates
 
-            valid_ratio = self._oob.states.block_valid_ratio(block)
-            if valid_ratio == 1:
-                # skip all-valid blocks
-                continue
-            if valid_ratio > self._conf['max_victim_valid_ratio']:
+    def get_valid_ratio_counter_of_used_blocks(self):
+        n_pages = self._conf.n_pages_per_block
+        counter = Counter()
+        n_programmed = 0
+        for n_valid, n_blocks in self._oob.states.valid_count_dist().items():
+            ratio_str = "{0:.2f}".format(n_valid / float(n_pages))
+            counter[ratio_str] += n_blocks
+            n_programmed += n_blocks
+
+        # used blocks without programmed pages are in no bucket
+        n_unprogrammed = len(self._block_pool.used_blocks) - n_programmed
+        if n_unprogrammed > 0:
+            counter["{0:.2f}".format(0)] += n_unprogrammed
+        return counter
+
+    def _victim_valid_counts(self):
+        "numbers of valid pages a victim can have"
+        n_pages = self._conf.n_pages_per_block
+        valid_counts = []
+        # all-valid blocks are skipped
+        for n_valid in range(n_pages):
+            if n_valid / float(n_pages) > self._conf['max_victim_valid_ratio']:
                 # If valid ratio is too big, moving it does not provide
                 # too much benefit.
+                break
+            valid_counts.append(n_valid)
+        return valid_counts
+
+    def _candidates_of_valid_count(self, n_valid):
+        block_pool = self._block_pool
+        candidates = []
+        for block in self._oob.states.blocks_of_valid_count(n_valid):
+            if block_pool.is_current_block(block):
+                # skip current blocks
                 continue
 
-            victim_candidates.append( (valid_ratio, block_type, block) )
-
-        return victim_candidates
-
-    def _victim_candidates(self):
-        used_data_blocks = self._block_pool.data_usedblocks
-        used_trans_blocks = self._block_pool.trans_usedblocks
-
-        candidate_tuples = self._form_tuples(used_data_blocks, self.TYPE_DATA) + \
-            self._form_tuples(used_trans_blocks, self.TYPE_TRANS)
+            tag = block_pool.get_tag(block)
+            if tag == TDATA:
+                candidates.append((self.TYPE_DATA, block))
+            elif tag == TTRANS:
+                candidates.append((self.TYPE_TRANS, block))
 
-        return candidate_tuples
+        candidates.sort()
+        return candidates
 
 
 class Cleaner(object):
@@ -1515,12 +2313,21 @@ class Cleaner(object):
             self.gc_time_recorded = True
             print 'GC time recorded!........!'
 
-        all_victim_tuples = list(victim_blocks.iterator_verbose())
-        batches = utils.group_to_batches(all_victim_tuples, self.n_victim_per_batch)
-
-        for batch in batches:
-            if self.is_stopping_needed():
+        # Victims of a batch are picked after the previous batch is
+        # cleaned. As many blocks as there are candidates now are
+        # cleaned at most.
+        n_victims_left = victim_blocks.count_candidates()
+        while n_victims_left > 0 and not self.is_stopping_needed():
+            start_time = time.time()
+            batch = victim_blocks.pick(
+                    min(self.n_victim_per_batch, n_victims_left))
+            self.recorder.add_to_timer('gc_victim_selection', 'seconds',
+                    time.time() - start_time)
+            self.recorder.count_me('gc_victim_selection', 'batches')
+            if len(batch) == 0:
                 break
+
+            n_victims_left -= len(batch)
             yield self.env.process(self._clean_batch(batch, purpose=PURPOSE_GC))
 
         self._cleaner_res.release(req)
@@ -1753,18 +2560,19 @@ class OutOfBandAreas(object):
     events, and react accordingly to this event. The action may involve state
     and lpn_of_phy_page.
     """
-    def __init__(self, confobj):
+    def __init__(self, confobj, env=None):
         self.conf = confobj
+        self.env = env
 
         self.flash_num_blocks = confobj.n_blocks_per_dev
         self.flash_npage_per_block = confobj.n_pages_per_block
         self.total_pages = self.flash_num_blocks * self.flash_npage_per_block
 
         # Key data structures
-        self.states = FlashBitmap2(confobj)
+        self.states = BucketedFlashBitmap(confobj)
         # ppn->lpn mapping stored in OOB, Note that for translation pages, this
         # mapping is ppn -> m_vpn
-        self.ppn_to_lpn_mvpn = {}
+        self.ppn_to_lpn_mvpn = ArrayMap(self.total_pages)
         # Timestamp table PPN -> timestamp
         # Here are the rules:
         # 1. only programming a PPN updates the timestamp of PPN
@@ -1775,12 +2583,18 @@ class OutOfBandAreas(object):
         # 2. discarding, and reading a ppn does not change it.
         # 3. erasing a block will remove all the timestamps of the block
         # 4. so cur_timestamp can only be advanced by LBA operations
-        self.timestamp_table = {}
+        self.timestamp_table = ArrayMap(self.total_pages)
         self.cur_timestamp = 0
 
-        # flash block -> last invalidation time
-        # int -> timedate.timedate
-        self.last_inv_time_of_block = {}
+        # flash block -> last invalidation time, in simulated time
+        # (0 if there is no env)
+        self.last_inv_time_of_block = ArrayMap(self.flash_num_blocks,
+                dtype=np.float64, none_value=-1.0)
+
+    def _now(self):
+        if self.env is None:
+            return 0
+        return self.env.now
 
     ############# Time stamp related ############
     def _incr_timestamp(self):
@@ -1804,24 +2618,32 @@ class OutOfBandAreas(object):
         self.states.erase_block(flash_block)
 
         start, end = self.conf.block_to_page_range(flash_block)
-        for ppn in range(start, end):
-            try:
-                del self.ppn_to_lpn_mvpn[ppn]
-                # if you try to erase translation block here, it may fail,
-                # but it is expected.
-                del self.timestamp_table[ppn]
-            except KeyError:
-                pass
-
-        try:
-            del self.last_inv_time_of_block[flash_block]
-        except KeyError:
-            pass
+        self.ppn_to_lpn_mvpn.clear_range(start, end)
+        self.timestamp_table.clear_range(start, end)
+        self.last_inv_time_of_block.clear_range(flash_block, flash_block + 1)
 
     def relocate_data_page(self, lpn, old_ppn, new_ppn, update_time=True):
         self._relocate_page(virtual_pn=lpn, old_ppn=old_ppn, new_ppn=new_ppn,
                 update_time=update_time)
 
+    def relocate_data_pages(self, lpns, old_ppns, new_ppns):
+        """
+        relocate_data_page() of many pages, OOB areas of consecutive ppns are
+        changed together
+        """
+        lpns = list(lpns)
+        i = 0
+        for start, end in ppn_ranges(new_ppns):
+            n = end - start
+            self.ppn_to_lpn_mvpn.set_range(start, lpns[i:i + n])
+            self.timestamp_table.set_range(start,
+                    range(self.cur_timestamp, self.cur_timestamp + n))
+            self.cur_timestamp += n
+            i += n
+        self.validate_ppns(new_ppns)
+        self.invalidate_ppns(
+                [ppn for ppn in old_ppns if ppn != UNINITIATED])
+
     def relocate_trans_page(self, m_vpn, old_ppn, new_ppn, update_time=True):
         self._relocate_page(virtual_pn=m_vpn, old_ppn=old_ppn, new_ppn=new_ppn,
                 update_time=update_time)
@@ -1844,17 +2666,27 @@ class OutOfBandAreas(object):
             self.invalidate_ppn(old_ppn)
 
     def invalidate_ppns(self, ppns):
-        for ppn in ppns:
-            self.invalidate_ppn(ppn)
+        for start, end in ppn_ranges(ppns):
+            if end - start == 1:
+                self.invalidate_ppn(start)
+                continue
+            self.states.invalidate_page_range(start, end)
+            first_block, _ = self.conf.page_to_block_off(start)
+            last_block, _ = self.conf.page_to_block_off(end - 1)
+            self.last_inv_time_of_block.set_range(first_block,
+                    [self._now()] * (last_block - first_block + 1))
 
     def invalidate_ppn(self, ppn):
         self.states.invalidate_page(ppn)
         block, _ = self.conf.page_to_block_off(ppn)
-        self.last_inv_time_of_block[block] = datetime.datetime.now()
+        self.last_inv_time_of_block[block] = self._now()
 
     def validate_ppns(self, ppns):
-        for ppn in ppns:
-            self.validate_ppn(ppn)
+        for start, end in ppn_ranges(ppns):
+            if end - start == 1:
+                self.validate_ppn(start)
+            else:
+                self.states.validate_page_range(start, end)
 
     def validate_ppn(self, ppn):
         self.states.validate_page(ppn)
@@ -1867,11 +2699,7 @@ class OutOfBandAreas(object):
 
     def lpns_of_block(self, flash_block):
         s, e = self.conf.block_to_page_range(flash_block)
-        lpns = []
-        for ppn in range(s, e):
-            lpns.append(self.ppn_to_lpn_mvpn.get(ppn, 'NA'))
-
-        return lpns
+        return self.ppn_to_lpn_mvpn.get_range(s, e, 'NA')
 
 
 class Config(config.ConfigNCQFTL):
@@ -1886,6 +2714,27 @@ class Config(config.ConfigNCQFTL):
             "GC_low_threshold_ratio": 0.9,
             "over_provisioning": 1.28, #TODO: this is not used
             "mapping_cache_bytes": None, # cmt: cached mapping table
+            # class of the cached mapping table: 'LpnTableMvpn' (a Row
+            # object per entry) or 'ArrayLpnTable' (parallel arrays)
+            "lpn_table_class": "LpnTableMvpn",
+            # replacement policy of the cached mapping table, one of
+            # cachepolicy.POLICIES: lru, slru, clock, 2q, arc, tpage
+            "cache_replacement_policy": "lru",
+            "slru_protected_ratio": 0.5,
+            "twoq_kin_ratio": 0.25,
+            "twoq_kout_ratio": 0.5,
+            # number of translation pages to prefetch after a sequential
+            # stream of trans_prefetch_trigger pages, 0 to disable
+            "trans_prefetch_pages": 0,
+            "trans_prefetch_trigger": 2,
+            # background write-back of dirty translation pages by Ssd.
+            # Every trans_flush_interval, if the flash is idle or
+            # dirty entries are at least trans_flush_dirty_ratio of the
+            # cache, up to trans_flush_batch of the dirtiest
+            # translation pages are written back. None to disable.
+            "trans_flush_interval": None,
+            "trans_flush_dirty_ratio": 0.5,
+            "trans_flush_batch": 4,
             "do_not_check_gc_setting": False,
             "write_gc_log": True,
             }
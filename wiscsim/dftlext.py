@@ -1,13 +1,14 @@
 import bitarray
 from collections import deque, Counter
 import csv
-import datetime
 import random
 import os
 import Queue
 import sys
+import time
 
 import bidict
+import numpy as np
 
 import config
 import flash
@@ -17,6 +18,7 @@ import recorder
 from utilities import utils
 from .blkpool import BlockPool
 from .bitmap import FlashBitmap2
+from .oobstore import ArrayMap
 
 """
 This refactors Dftl
@@ -378,7 +380,7 @@ class OutOfBandAreas(object):
         self.states = FlashBitmap2(confobj)
         # ppn->lpn mapping stored in OOB, Note that for translation pages, this
         # mapping is ppn -> m_vpn
-        self.ppn_to_lpn_mvpn = {}
+        self.ppn_to_lpn_mvpn = ArrayMap(self.total_pages)
         # Timestamp table PPN -> timestamp
         # Here are the rules:
         # 1. only programming a PPN updates the timestamp of PPN
@@ -389,12 +391,12 @@ class OutOfBandAreas(object):
         # 2. discarding, and reading a ppn does not change it.
         # 3. erasing a block will remove all the timestamps of the block
         # 4. so cur_timestamp can only be advanced by LBA operations
-        self.timestamp_table = {}
+        self.timestamp_table = ArrayMap(self.total_pages)
         self.cur_timestamp = 0
 
-        # flash block -> last invalidation time
-        # int -> timedate.timedate
-        self.last_inv_time_of_block = {}
+        # flash block -> last invalidation time, seconds since the epoch
+        self.last_inv_time_of_block = ArrayMap(self.flash_num_blocks,
+                dtype=np.float64, none_value=-1.0)
 
     ############# Time stamp related ############
     def timestamp(self):
@@ -417,7 +419,7 @@ class OutOfBandAreas(object):
     def wipe_ppn(self, ppn):
         self.states.invalidate_page(ppn)
         block, _ = self.conf.page_to_block_off(ppn)
-        self.last_inv_time_of_block[block] = datetime.datetime.now()
+        self.last_inv_time_of_block[block] = time.time()
 
         # It is OK to delay it until we erase the block
         # try:
@@ -431,14 +433,8 @@ class OutOfBandAreas(object):
         self.states.erase_block(flash_block)
 
         start, end = self.conf.block_to_page_range(flash_block)
-        for ppn in range(start, end):
-            try:
-                del self.ppn_to_lpn_mvpn[ppn]
-                # if you try to erase translation block here, it may fail,
-                # but it is expected.
-                del self.timestamp_table[ppn]
-            except KeyError:
-                pass
+        self.ppn_to_lpn_mvpn.clear_range(start, end)
+        self.timestamp_table.clear_range(start, end)
 
         del self.last_inv_time_of_block[flash_block]
 
@@ -470,11 +466,7 @@ class OutOfBandAreas(object):
 
     def lpns_of_block(self, flash_block):
         s, e = self.conf.block_to_page_range(flash_block)
-        lpns = []
-        for ppn in range(s, e):
-            lpns.append(self.ppn_to_lpn_mvpn.get(ppn, 'NA'))
-
-        return lpns
+        return self.ppn_to_lpn_mvpn.get_range(s, e, 'NA')
 
 class CacheEntryData(object):
     """
@@ -519,7 +511,9 @@ class CachedMappingTable(object):
 
         # self.entries = {}
         # self.entries = lrulist.LruCache()
-        self.entries = lrulist.SegmentedLruCache(self.max_n_entries, 0.5)
+        # self.entries = lrulist.SegmentedLruCache(self.max_n_entries, 0.5)
+        self.entries = lrulist.CompactSegmentedLruCache(
+                self.max_n_entries, 0.5)
 
     def lpn_to_ppn(self, lpn):
         "Try to find ppn of the given lpn in cache"
@@ -551,7 +545,8 @@ class CachedMappingTable(object):
     def victim_entry(self):
         # lpn = random.choice(self.entries.keys())
         classname = type(self.entries).__name__
-        if classname in ('SegmentedLruCache', 'LruCache'):
+        if classname in ('SegmentedLruCache', 'LruCache',
+                'CompactSegmentedLruCache', 'CompactLruCache'):
             lpn = self.entries.victim_key()
         else:
             raise RuntimeError("You need to specify victim selection")
@@ -1357,7 +1352,6 @@ class GarbageCollector(object):
                 .format(blocknum, valid_ratio))
 
         age = current_time - self.oob.last_inv_time_of_block[blocknum]
-        age = age.total_seconds()
         bene_cost = age * ( 1 - valid_ratio ) / ( 2 * valid_ratio )
 
         return bene_cost, valid_ratio
@@ -1366,15 +1360,15 @@ class GarbageCollector(object):
         """
         Calculate benefit/cost and put it to a priority queue
         """
-        current_blocks = self.block_pool.current_blocks()
-        current_time = datetime.datetime.now()
+        is_current_block = self.block_pool.is_current_block
+        current_time = time.time()
         priority_q = Queue.PriorityQueue()
 
         for usedblocks, block_type in (
             (self.block_pool.data_usedblocks, DATA_BLOCK),
             (self.block_pool.trans_usedblocks, TRANS_BLOCK)):
             for blocknum in usedblocks:
-                if blocknum in current_blocks:
+                if is_current_block(blocknum):
                     continue
 
                 bene_cost, valid_ratio = self.benefit_cost(blocknum,
@@ -278,8 +278,8 @@ class Ftl(ftlbuilder.FtlBuilder):
         else:
             event_file_path = self.conf.get_ftlsim_events_output_path()
 
-        workload_line_iter = hostevent.FileLineIterator(event_file_path)
-        event_workload_iter = hostevent.EventIterator(self.conf, workload_line_iter)
+        event_workload_iter = hostevent.create_event_iterator(self.conf,
+                event_file_path)
 
         parser = EventNCQParser(event_workload_iter)
         table = parser.parse()
@@ -498,7 +498,7 @@ class EventNCQParser(object):
 
             row = {'action': action,
                    'operation': event.operation,
-                   'timestamp': event.timestamp,
+                   'timestamp': hostevent.timestamp_to_str(event.timestamp),
                    'offset': event.offset,
                    'size': event.size,
                    'pid': event.pid,
@@ -95,6 +95,27 @@ class NCQSingleQueue(object):
             self.slots.release(req)
 
 
+class HostBarrier(object):
+    """
+    Host processes calling wait() return when all n_hosts of them
+    have called it. The barrier can be used again after that.
+    """
+    def __init__(self, n_hosts, simpy_env):
+        self.n_hosts = n_hosts
+        self.env = simpy_env
+        self._n_waiting = 0
+        self._event = self.env.event()
+
+    def wait(self):
+        event = self._event
+        self._n_waiting += 1
+        if self._n_waiting == self.n_hosts:
+            self._n_waiting = 0
+            self._event = self.env.event()
+            event.succeed()
+        yield event
+
+
 def split_ext_by_segment(n_pages_per_segment, extent):
     if extent.lpn_count == 0:
         return None
@@ -1,7 +1,21 @@
+import heapq
+import itertools
+import mmap
+import os
+import struct
+
 from ftlsim_commons import Extent
 from commons import *
+from pyreuse.sysutils import blocktrace
+import tracecompress
+from utilities import utils
 
 class HostEventBase(object):
+    # Events are created for every request of a trace, so they have no
+    # per-instance __dict__. token and token_req are set by
+    # SimulatorDESSync.
+    __slots__ = ()
+
     def get_operation(self):
         raise NotImplementedError
 
@@ -10,6 +24,9 @@ class HostEventBase(object):
 
 
 class ControlEvent(HostEventBase):
+    __slots__ = ('operation', 'arg1', 'arg2', 'arg3', 'action',
+            'token', 'token_req')
+
     def __init__(self, operation, arg1=None, arg2=None, arg3=None):
         self.operation = operation
         self.arg1 = arg1
@@ -29,6 +46,10 @@ class ControlEvent(HostEventBase):
 
 
 class Event(HostEventBase):
+    __slots__ = ('pid', 'operation', 'offset', 'size', 'sync', 'timestamp',
+            'pre_wait_time', 'action', 'sector', 'sector_count',
+            'token', 'token_req', '_lpn_extent')
+
     def __init__(self, sector_size, pid, operation, offset, size,
             timestamp = None, pre_wait_time = None, sync = True, action = 'D'):
         self.pid = int(pid)
@@ -51,6 +72,30 @@ class Event(HostEventBase):
             self.size, sector_size)
 
         self.sector_count = self.size / sector_size
+        # (page_size, offset, size, Extent) of the last get_lpn_extent()
+        self._lpn_extent = None
+
+    @classmethod
+    def from_row(cls, sector_size, pid, operation, offset, size, timestamp,
+            pre_wait_time, sync, action):
+        """
+        Create an event from fields that are already checked and converted,
+        such as a row of a binary event file. It skips the conversions
+        and checks of __init__.
+        """
+        event = cls.__new__(cls)
+        event.pid = pid
+        event.operation = operation
+        event.offset = offset
+        event.size = size
+        event.sync = sync
+        event.timestamp = timestamp
+        event.pre_wait_time = pre_wait_time
+        event.action = action
+        event.sector = offset / sector_size
+        event.sector_count = size / sector_size
+        event._lpn_extent = None
+        return event
 
     def get_operation(self):
         return self.operation
@@ -59,9 +104,20 @@ class Event(HostEventBase):
         return 'Event'
 
     def get_lpn_extent(self, conf):
+        """
+        The extent is computed once and shared by all callers, which must
+        not modify it.
+        """
+        key = (conf.page_size, self.offset, self.size)
+        cached = self._lpn_extent
+        if cached is not None and cached[:3] == key:
+            return cached[3]
+
         lpn_start, lpn_count = conf.off_size_to_page_range(
                 self.offset, self.size, force_alignment=False)
-        return Extent(lpn_start = lpn_start, lpn_count = lpn_count)
+        extent = Extent(lpn_start = lpn_start, lpn_count = lpn_count)
+        self._lpn_extent = key + (extent,)
+        return extent
 
     def __str__(self):
         return "Event pid:{pid}, operation:{operation}, offset:{offset}, "\
@@ -75,23 +131,40 @@ class Event(HostEventBase):
 
 
 class FileLineIterator(object):
-    def __init__(self, file_path):
+    def __init__(self, file_path, start_offset=0):
         self.file_path = file_path
+        self.start_offset = start_offset
 
     def __iter__(self):
         with open(self.file_path, 'r') as f:
+            f.seek(self.start_offset)
             for line in f:
                 line = line.strip()
                 yield line
 
 
+def create_line_iterator(file_path):
+    """
+    Return a line iterator of a text file, which may be block-compressed
+    (see tracecompress).
+    """
+    if tracecompress.is_compressed_file(file_path):
+        return tracecompress.CompressedLineIterator(file_path)
+    else:
+        return FileLineIterator(file_path)
+
+
 class EventIterator(object):
     """
     Convert string line to event, and iter
+
+    filelineiter can also be the path of a (compressed) text event file.
     """
     def __init__(self, conf, filelineiter):
         self.conf = conf
         self.sector_size = self.conf['sector_size']
+        if isinstance(filelineiter, basestring):
+            filelineiter = create_line_iterator(filelineiter)
         self.filelineiter = filelineiter
         self.event_file_column_names = self.conf['event_file_column_names']
 
@@ -120,3 +193,517 @@ class EventIterator(object):
             yield self.str_to_event(line)
 
 
+class BlkparseEventIterator(object):
+    """
+    Convert raw blkparse output lines to events on the fly, so the
+    simulator can consume a trace without intermediate event files.
+
+    Events are in the order of the lines (like sort_block_trace=False).
+    pre_wait_time is the time since the previous event of the stream.
+    """
+    def __init__(self, conf, lineiter, padding_bytes=0):
+        self.conf = conf
+        self.sector_size = self.conf['sector_size']
+        self.lineiter = lineiter
+        # event offset + padding_bytes = blktrace addr
+        self.padding_bytes = padding_bytes
+
+        self._translation = {'read': OP_READ, 'write': OP_WRITE,
+                'discard':OP_DISCARD}
+
+    def __iter__(self):
+        prev_time = None
+        for line in self.lineiter:
+            fields = blocktrace.parse_data_line(line)
+            if fields is None:
+                continue
+
+            operation, sync = blocktrace.rwbs_to_operation(fields['RWBS'])
+            cur_time = float(fields['timestamp'])
+            if prev_time is None:
+                pre_wait_time = 0
+            else:
+                pre_wait_time = max(cur_time - prev_time, 0.0)
+            prev_time = cur_time
+
+            yield Event(sector_size = self.sector_size,
+                    pid = fields['pid'],
+                    operation = self._translation[operation],
+                    offset = int(fields['sector_start']) * self.sector_size \
+                            - self.padding_bytes,
+                    size = int(fields['sector_count']) * self.sector_size,
+                    timestamp = fields['timestamp'],
+                    pre_wait_time = pre_wait_time,
+                    sync = str(sync),
+                    action = fields['action'])
+
+
+
+
+#
+# Binary event trace format
+#
+# Parsing text event files (split, dict, Event) dominates simulation time
+# for large traces. The binary format stores the same information in
+# fixed-width columns so it can be memory-mapped and decoded in chunks.
+#
+# Layout (little-endian):
+#   magic (8 bytes) | n_events (uint64) | column 0 | column 1 | ...
+# Each column holds n_events fixed-width values. Columns are ordered by
+# width so that every column starts aligned.
+#
+BINARY_EVENT_MAGIC = 'WSEVTB01'
+BINARY_EVENT_HEADER = struct.Struct('<8sQ')
+
+# (column name, struct format code)
+BINARY_EVENT_COLUMNS = [
+        ('offset', 'q'),
+        ('size', 'q'),
+        ('timestamp', 'd'),
+        ('pre_wait_time', 'd'),
+        ('pid', 'i'),
+        ('operation', 'B'),
+        ('action', 'B'),
+        ('sync', 'B'),
+        ]
+
+BINARY_OPERATIONS = [OP_READ, OP_WRITE, OP_DISCARD]
+BINARY_ACTIONS = ['D', 'C']
+
+BINARY_SYNC_STRS = ['False', 'True']
+
+NA_VALUE = 'NA'
+
+
+def is_binary_event_file(file_path):
+    with open(file_path, 'rb') as f:
+        magic = f.read(len(BINARY_EVENT_MAGIC))
+    return magic == BINARY_EVENT_MAGIC
+
+
+def create_event_iterator(conf, file_path, start_event=None,
+        stop_event=None, start_time=None, stop_time=None):
+    """
+    Return an event iterator of file_path. The format of the file
+    (text, compressed text or binary) is detected automatically.
+
+    The iterator can be limited to events [start_event, stop_event) and
+    to timestamps [start_time, stop_time). See EventRangeIterator.
+    """
+    if (start_event, stop_event, start_time, stop_time) != \
+            (None, None, None, None):
+        return EventRangeIterator(conf, file_path,
+                start_event = start_event, stop_event = stop_event,
+                start_time = start_time, stop_time = stop_time)
+    elif is_binary_event_file(file_path):
+        return MmapEventIterator(conf, file_path)
+    else:
+        return EventIterator(conf, create_line_iterator(file_path))
+
+
+def timestamp_to_str(timestamp):
+    """
+    Return the text of an event timestamp, which is a float for binary
+    event files. Timestamps of blkparse have 9 decimals and get back their
+    text. Others get a text of the same value.
+    """
+    if isinstance(timestamp, basestring):
+        return timestamp
+    elif round(timestamp, 9) == timestamp:
+        return '%.9f' % timestamp
+    else:
+        return repr(timestamp)
+
+
+def _str_to_bool(value):
+    if isinstance(value, basestring):
+        return value.strip() == 'True'
+    else:
+        return bool(value)
+
+
+class BinaryEventFileWriter(object):
+    """
+    Write events to a binary event file.
+
+    Columns are spilled to temporary files while writing, so memory usage
+    does not grow with the number of events. The final file is assembled
+    in close().
+    """
+    def __init__(self, file_path, chunk_events=65536):
+        self.file_path = file_path
+        self.chunk_events = chunk_events
+        self.n_events = 0
+
+        self._op_codes = {op: i for i, op in enumerate(BINARY_OPERATIONS)}
+        self._action_codes = {a: i for i, a in enumerate(BINARY_ACTIONS)}
+
+        self._buffers = [[] for _ in BINARY_EVENT_COLUMNS]
+        self._spill_paths = ['{}.col{}.tmp'.format(file_path, i)
+                for i in range(len(BINARY_EVENT_COLUMNS))]
+        self._spill_files = [open(path, 'wb') for path in self._spill_paths]
+
+    def write(self, pid, action, operation, offset, size, timestamp,
+            pre_wait_time, sync):
+        if pre_wait_time in (None, NA_VALUE):
+            pre_wait_time = float('nan')
+        if timestamp in (None, NA_VALUE):
+            timestamp = float('nan')
+
+        values = (int(offset), int(size), float(timestamp),
+                float(pre_wait_time), int(pid),
+                self._op_codes[operation],
+                self._action_codes[action.strip()],
+                int(_str_to_bool(sync)))
+        for buf, value in zip(self._buffers, values):
+            buf.append(value)
+
+        self.n_events += 1
+        if len(self._buffers[0]) >= self.chunk_events:
+            self._spill()
+
+    def write_event(self, event):
+        self.write(pid = event.pid, action = event.action,
+                operation = event.operation, offset = event.offset,
+                size = event.size, timestamp = event.timestamp,
+                pre_wait_time = event.pre_wait_time, sync = event.sync)
+
+    def _spill(self):
+        for (_, code), buf, f in zip(BINARY_EVENT_COLUMNS, self._buffers,
+                self._spill_files):
+            f.write(struct.pack('<{}{}'.format(len(buf), code), *buf))
+            del buf[:]
+
+    def close(self):
+        self._spill()
+        for f in self._spill_files:
+            f.close()
+
+        with open(self.file_path, 'wb') as out:
+            out.write(BINARY_EVENT_HEADER.pack(BINARY_EVENT_MAGIC,
+                self.n_events))
+            for path in self._spill_paths:
+                with open(path, 'rb') as f:
+                    while True:
+                        data = f.read(4 * MB)
+                        if not data:
+                            break
+                        out.write(data)
+                os.remove(path)
+
+
+def convert_event_file_to_binary(conf, text_path, binary_path):
+    """
+    Convert a text event file (blkparse-events-for-ftlsim*.txt) to the
+    binary event format. Return the number of events converted.
+    """
+    writer = BinaryEventFileWriter(binary_path)
+    for event in EventIterator(conf, FileLineIterator(text_path)):
+        writer.write_event(event)
+    writer.close()
+
+    return writer.n_events
+
+
+class MmapEventIterator(object):
+    """
+    Iterate events of a binary event file. The file is memory-mapped and
+    decoded one chunk of events at a time with struct, so there is no
+    per-line string processing.
+    """
+    def __init__(self, conf, file_path, chunk_events=4096, start_event=0):
+        self.conf = conf
+        self.sector_size = self.conf['sector_size']
+        self.file_path = file_path
+        self.chunk_events = chunk_events
+        self.start_event = start_event
+
+        with open(self.file_path, 'rb') as f:
+            magic, self.n_events = BINARY_EVENT_HEADER.unpack(
+                    f.read(BINARY_EVENT_HEADER.size))
+        if magic != BINARY_EVENT_MAGIC:
+            raise RuntimeError("{} is not a binary event file".format(
+                file_path))
+
+        self._column_offsets = []
+        offset = BINARY_EVENT_HEADER.size
+        for _, code in BINARY_EVENT_COLUMNS:
+            self._column_offsets.append(offset)
+            offset += struct.calcsize('<' + code) * self.n_events
+
+    def __len__(self):
+        return self.n_events
+
+    def _read_columns(self, buf, start, count):
+        columns = []
+        for (_, code), col_offset in zip(BINARY_EVENT_COLUMNS,
+                self._column_offsets):
+            width = struct.calcsize('<' + code)
+            columns.append(struct.unpack_from('<{}{}'.format(count, code),
+                buf, col_offset + start * width))
+        return columns
+
+    def _to_event(self, offset, size, timestamp, pre_wait_time, pid,
+            op_code, action_code, sync):
+        # same values as EventIterator.str_to_event(), except that the
+        # timestamp is a float, see timestamp_to_str()
+        if pre_wait_time != pre_wait_time:
+            # NaN
+            pre_wait_time = NA_VALUE
+        if timestamp != timestamp:
+            timestamp = NA_VALUE
+        return Event.from_row(self.sector_size, pid,
+                BINARY_OPERATIONS[op_code], offset, size, timestamp,
+                pre_wait_time, BINARY_SYNC_STRS[sync],
+                BINARY_ACTIONS[action_code])
+
+    def __iter__(self):
+        if self.start_event >= self.n_events:
+            return
+
+        with open(self.file_path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                for start in xrange(self.start_event, self.n_events,
+                        self.chunk_events):
+                    count = min(self.chunk_events, self.n_events - start)
+                    columns = self._read_columns(buf, start, count)
+                    for row in zip(*columns):
+                        yield self._to_event(*row)
+            finally:
+                buf.close()
+
+
+
+#
+# Event file index
+#
+# A sidecar index (<path>.eventidx, JSON) of an event file has a
+# checkpoint every `interval` events. A checkpoint has the event number,
+# the byte offset of the event in text files, the timestamp of the event
+# and the number of read/write/discard events before it. It allows an
+# iterator to start at event N or time T after parsing at most `interval`
+# events. The index also has the size and mtime of the event file, an
+# index of an older version of the file is not used.
+#
+EVENT_INDEX_SUFFIX = '.eventidx'
+EVENT_INDEX_COLUMNS = ['event', 'offset', 'timestamp',
+        OP_READ, OP_WRITE, OP_DISCARD]
+
+
+def event_index_path_of(file_path):
+    return file_path + EVENT_INDEX_SUFFIX
+
+
+def _text_lines_with_offsets(file_path):
+    with open(file_path, 'r') as f:
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            yield offset, line.strip()
+
+
+def _file_signature(file_path):
+    st = os.stat(file_path)
+    return st.st_size, st.st_mtime
+
+
+def build_event_index(conf, file_path, interval=10000):
+    """
+    Create the index of an event file and save it next to the file.
+    Return the index.
+    """
+    file_size, file_mtime = _file_signature(file_path)
+    if is_binary_event_file(file_path) or \
+            tracecompress.is_compressed_file(file_path):
+        # the event number is all that is needed to seek these formats
+        events = ((None, event) for event in
+                create_event_iterator(conf, file_path))
+    else:
+        line_to_event = EventIterator(conf, []).str_to_event
+        events = ((offset, line_to_event(line)) for offset, line in
+                _text_lines_with_offsets(file_path))
+
+    op_counts = {OP_READ: 0, OP_WRITE: 0, OP_DISCARD: 0}
+    checkpoints = []
+    n_events = 0
+    for offset, event in events:
+        if n_events % interval == 0:
+            checkpoints.append([n_events, offset, float(event.timestamp),
+                op_counts[OP_READ], op_counts[OP_WRITE],
+                op_counts[OP_DISCARD]])
+        op_counts[event.operation] += 1
+        n_events += 1
+
+    index = {'interval': interval,
+             'file_size': file_size,
+             'file_mtime': file_mtime,
+             'n_events': n_events,
+             'op_counts': op_counts,
+             'columns': EVENT_INDEX_COLUMNS,
+             'checkpoints': checkpoints}
+    utils.dump_json(index, event_index_path_of(file_path))
+
+    return index
+
+
+def load_event_index(file_path):
+    """
+    Return the index of an event file, or None if it does not have one or
+    the file has changed since the index was built
+    """
+    index_path = event_index_path_of(file_path)
+    if not os.path.exists(index_path):
+        return None
+    index = utils.load_json(index_path)
+    file_size, file_mtime = _file_signature(file_path)
+    if index.get('file_size') != file_size or \
+            index.get('file_mtime') != file_mtime:
+        print 'Ignoring stale event index', index_path
+        return None
+    return index
+
+
+class EventRangeIterator(object):
+    """
+    Iterate events of an event file whose event numbers are in
+    [start_event, stop_event) and timestamps are in [start_time, stop_time).
+    None means no limit. Iteration ends at the first event at or after
+    stop_event or stop_time.
+
+    With an event index, iteration starts from the nearest checkpoint
+    instead of the beginning of the file. Seeking by time assumes that
+    timestamps do not decrease (sort_block_trace).
+    """
+    def __init__(self, conf, file_path, start_event=None, stop_event=None,
+            start_time=None, stop_time=None):
+        self.conf = conf
+        self.file_path = file_path
+        self.start_event = start_event
+        self.stop_event = stop_event
+        self.start_time = start_time
+        self.stop_time = stop_time
+
+        self.index = load_event_index(file_path)
+
+    def _start_checkpoint(self):
+        """
+        Return (event number, byte offset) of the last checkpoint that is
+        not after the first event in range
+        """
+        if self.index is None or \
+                (self.start_event is None and self.start_time is None):
+            return 0, 0
+
+        start = [0, 0]
+        for checkpoint in self.index['checkpoints']:
+            event_no, offset, timestamp = checkpoint[:3]
+            if self.start_event is not None and event_no > self.start_event:
+                break
+            if self.start_time is not None and timestamp >= self.start_time:
+                break
+            start = [event_no, offset]
+
+        return start
+
+    def _events_from(self, event_no, offset):
+        if is_binary_event_file(self.file_path):
+            return MmapEventIterator(self.conf, self.file_path,
+                    start_event = event_no)
+        elif tracecompress.is_compressed_file(self.file_path):
+            lines = tracecompress.CompressedLineIterator(self.file_path)
+            skip = event_no
+            block_id = 0
+            if lines.index is not None:
+                # start at the block that has event_no
+                for block_id, (_, _, n_lines) in enumerate(
+                        lines.index['blocks']):
+                    if skip < n_lines:
+                        break
+                    skip -= n_lines
+                lines = tracecompress.CompressedLineIterator(self.file_path,
+                        start_block = block_id)
+            return EventIterator(self.conf,
+                    itertools.islice(lines, skip, None))
+        else:
+            return EventIterator(self.conf,
+                    FileLineIterator(self.file_path, start_offset = offset))
+
+    def __iter__(self):
+        event_no, offset = self._start_checkpoint()
+        check_time = self.start_time is not None or \
+                self.stop_time is not None
+
+        for event in self._events_from(event_no, offset):
+            if self.stop_event is not None and event_no >= self.stop_event:
+                break
+
+            if check_time is True:
+                timestamp = float(event.timestamp)
+                if self.stop_time is not None and timestamp >= self.stop_time:
+                    break
+                in_range = self.start_time is None or \
+                        timestamp >= self.start_time
+            else:
+                in_range = True
+
+            if in_range and (self.start_event is None or
+                    event_no >= self.start_event):
+                yield event
+
+            event_no += 1
+
+
+#
+# Multiple event streams
+#
+def event_timestamp(event):
+    """
+    Return the timestamp of event in seconds, or None if it does not have
+    one (ControlEvent, NA or NaN)
+    """
+    timestamp = getattr(event, 'timestamp', None)
+    if timestamp is None or timestamp == NA_VALUE:
+        return None
+    timestamp = float(timestamp)
+    if timestamp != timestamp:
+        # NaN
+        return None
+    return timestamp
+
+
+class MergedEventIterator(object):
+    """
+    Merge event streams into one stream ordered by timestamp (k-way merge
+    with a heap). Only the next event of each stream is held in memory,
+    and the streams are not opened until iteration starts.
+
+    An event without timestamp keeps its place in its stream: it gets the
+    timestamp of the previous event of the same stream. Ties are broken
+    by stream order.
+    """
+    def __init__(self, event_iters):
+        self.event_iters = event_iters
+
+    def _push(self, heap, stream, stream_id, prev_timestamp):
+        for event in stream:
+            timestamp = event_timestamp(event)
+            if timestamp is None:
+                timestamp = prev_timestamp
+            heapq.heappush(heap, (timestamp, stream_id, event))
+            return
+
+    def __iter__(self):
+        heap = []
+        streams = []
+        for stream_id, event_iter in enumerate(self.event_iters):
+            stream = iter(event_iter)
+            streams.append(stream)
+            self._push(heap, stream, stream_id, float('-inf'))
+
+        while len(heap) > 0:
+            timestamp, stream_id, event = heapq.heappop(heap)
+            yield event
+            self._push(heap, streams[stream_id], stream_id, timestamp)
@@ -87,6 +87,9 @@ class LinkedList(object):
         self.add_before(node, old_head)
 
     def add_to_tail(self, node):
+        if self._head is self._end_guard:
+            # empty list, node is also the head
+            self._head = node
         self.add_before(node, self._end_guard)
 
     def move_toward_head_by_one(self, node):
@@ -529,3 +532,320 @@ class LruDict(collections.MutableMapping):
         return self._store[key]
 
 
+
+"""
+Compact LRU containers
+
+LruCache, LruDict and SegmentedLruCache pay for recency with Python method
+calls: a hit in LruCache goes through move_to_head(), delete(),
+add_to_head() and add_before(), each setting attributes of Node objects.
+collections.OrderedDict does not help on Python 2, it is implemented in
+Python with the same kind of linked list.
+
+The Compact* classes below are drop-in replacements. An entry is a link
+list [prev, next, key, value] in a circular list with a root link; a hit
+relinks it in place with a few list item stores. A link list is also much
+smaller than a Node instance and its __dict__.
+
+tests/lrulist_bench.py compares their throughput and memory with the
+classes above.
+"""
+
+_PREV, _NEXT, _KEY, _VALUE, _OWNER = 0, 1, 2, 3, 4
+
+
+def _new_root():
+    root = [None, None, None, None, None]
+    root[_PREV] = root[_NEXT] = root
+    return root
+
+
+def _unlink(link):
+    link_prev = link[_PREV]
+    link_next = link[_NEXT]
+    link_prev[_NEXT] = link_next
+    link_next[_PREV] = link_prev
+
+
+def _push_front(root, link):
+    "link becomes the most recent one"
+    first = root[_NEXT]
+    link[_PREV] = root
+    link[_NEXT] = first
+    first[_PREV] = root[_NEXT] = link
+
+
+def _push_back(root, link):
+    "link becomes the least recent one"
+    last = root[_PREV]
+    link[_PREV] = last
+    link[_NEXT] = root
+    last[_NEXT] = root[_PREV] = link
+
+
+def _iter_links(root):
+    "most recent -> least recent"
+    link = root[_NEXT]
+    while link is not root:
+        yield link
+        link = link[_NEXT]
+
+
+def _reversed_links(root):
+    "least recent -> most recent"
+    link = root[_PREV]
+    while link is not root:
+        yield link
+        link = link[_PREV]
+
+
+class CompactLruCache(collections.MutableMapping):
+    """
+    Same as LruCache. Geting and setting (recent use) a value will move it
+    to the head of the list.
+    """
+    def __init__(self, data = None, **kwargs):
+        # key -> [prev, next, key, value]
+        self.table = {}
+        self._root = _new_root()
+
+        if data == None:
+            data = {}
+        self.update(data, **kwargs)
+
+    def has_key(self, key):
+        return self.table.has_key(key)
+
+    def keys(self):
+        return self.table.keys()
+
+    def get(self, key, default = None):
+        if self.table.has_key(key):
+            # will affect list order
+            return self.__getitem__(key)
+        else:
+            # will not affect list order
+            return default
+
+    def __getitem__(self, key):
+        # _unlink() and _push_front() inlined, this is the hot path
+        link = self.table[key]
+        link_prev = link[_PREV]
+        link_next = link[_NEXT]
+        link_prev[_NEXT] = link_next
+        link_next[_PREV] = link_prev
+
+        root = self._root
+        first = root[_NEXT]
+        link[_PREV] = root
+        link[_NEXT] = first
+        first[_PREV] = root[_NEXT] = link
+        return link[_VALUE]
+
+    def __setitem__(self, key, value):
+        root = self._root
+        link = self.table.get(key)
+        if link is None:
+            # create new
+            first = root[_NEXT]
+            link = [root, first, key, value]
+            first[_PREV] = root[_NEXT] = self.table[key] = link
+        else:
+            # update
+            link[_VALUE] = value
+            link_prev = link[_PREV]
+            link_next = link[_NEXT]
+            link_prev[_NEXT] = link_next
+            link_next[_PREV] = link_prev
+
+            first = root[_NEXT]
+            link[_PREV] = root
+            link[_NEXT] = first
+            first[_PREV] = root[_NEXT] = link
+
+    def __delitem__(self, key):
+        _unlink(self.table.pop(key))
+
+    def add_as_least_used(self, key, value):
+        assert not self.table.has_key(key)
+        link = [None, None, key, value]
+        _push_back(self._root, link)
+        self.table[key] = link
+
+    def __iter__(self):
+        # most recent -> least recent
+        for link in _iter_links(self._root):
+            yield link[_KEY]
+
+    def __reversed__(self):
+        for link in _reversed_links(self._root):
+            yield link[_KEY]
+
+    def items(self):
+        return self.least_to_most_items()
+
+    def __len__(self):
+        return len(self.table)
+
+    def peek(self, key):
+        return self.table[key][_VALUE]
+
+    def orderless_update(self, key, value):
+        self.table[key][_VALUE] = value
+
+    def least_to_most_items(self):
+        for link in _reversed_links(self._root):
+            yield link[_KEY], link[_VALUE]
+
+    def least_recently_used_key(self):
+        return self._root[_PREV][_KEY]
+
+    def most_recently_used_key(self):
+        return self._root[_NEXT][_KEY]
+
+    def victim_key(self):
+        return self._root[_PREV][_KEY]
+
+    def __repr__(self):
+        return str([(link[_KEY], link[_VALUE])
+            for link in _iter_links(self._root)])
+
+
+class CompactLruDict(CompactLruCache):
+    """
+    Same as LruDict: iteration goes from the least to the most recently
+    used key. All [] operations will change order of the key.
+    """
+    def least_to_most_iter(self):
+        return self.__iter__()
+
+    def __iter__(self):
+        for link in _reversed_links(self._root):
+            yield link[_KEY]
+
+    def most_to_least_iter(self):
+        return self.__reversed__()
+
+    def __reversed__(self):
+        for link in _iter_links(self._root):
+            yield link[_KEY]
+
+    def items(self):
+        for link in _reversed_links(self._root):
+            yield link[_KEY], link[_VALUE]
+
+    def least_to_most_items(self):
+        return [(link[_KEY], link[_VALUE])
+                for link in _reversed_links(self._root)]
+
+    def most_recent(self):
+        return self.most_recently_used_key()
+
+    def least_recent(self):
+        return self.least_recently_used_key()
+
+
+class CompactSegmentedLruCache(object):
+    """
+    Same as SegmentedLruCache. A link is [prev, next, key, value, owner],
+    owner is the root of the segment the link is in.
+    """
+    def __init__(self, max_entries, max_protected_ratio):
+        self._protected_root = _new_root()
+        self._probationary_root = _new_root()
+        self._n_protected = 0
+
+        self.max_entries = max_entries
+        self.max_protected_entries = max_entries * max_protected_ratio
+
+        self.table = {}
+
+    def has_key(self, key):
+        return self.table.has_key(key)
+
+    def keys(self):
+        return self.table.keys()
+
+    def hit(self, link):
+        "this method should be called when we have a hit"
+        protected_root = self._protected_root
+        _unlink(link)
+        if link[_OWNER] is not protected_root:
+            # the only gate to get into the protected segment
+            if self._n_protected > 0 and \
+                    self._n_protected >= self.max_protected_entries:
+                # move the LRU of protected to MRU side of probationary
+                victim = protected_root[_PREV]
+                _unlink(victim)
+                _push_front(self._probationary_root, victim)
+                victim[_OWNER] = self._probationary_root
+            else:
+                self._n_protected += 1
+            link[_OWNER] = protected_root
+        _push_front(protected_root, link)
+
+    ############### APIs  ################
+
+    def items(self):
+        for key, link in self.table.items():
+            yield key, link[_VALUE]
+
+    def __getitem__(self, key):
+        link = self.table[key]
+        self.hit(link)
+        return link[_VALUE]
+
+    def get(self, key, default = None):
+        if self.table.has_key(key):
+            # will affect list order
+            return self.__getitem__(key)
+        else:
+            # will not affect list order
+            return default
+
+    def peek(self, key):
+        return self.table[key][_VALUE]
+
+    def __setitem__(self, key, value):
+        link = self.table.get(key)
+        if link is None:
+            # misses go to MRU side of probationary
+            link = [None, None, key, value, self._probationary_root]
+            _push_front(self._probationary_root, link)
+            self.table[key] = link
+        else:
+            link[_VALUE] = value
+            self.hit(link)
+
+    def victim_key(self):
+        """
+        Higher level class will handle the eviction.
+        """
+        for root in (self._probationary_root, self._protected_root):
+            link = root[_PREV]
+            if link is not root:
+                return link[_KEY]
+        return None
+
+    def is_full(self):
+        return len(self.table) == self.max_entries
+
+    def __delitem__(self, key):
+        link = self.table.pop(key)
+        _unlink(link)
+        if link[_OWNER] is self._protected_root:
+            self._n_protected -= 1
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __repr__(self):
+        def segment(root):
+            return [(link[_KEY], link[_VALUE]) for link in _iter_links(root)]
+        return 'Protected List:' + repr(segment(self._protected_root)) + \
+            '\n' + 'Probationary List:' + \
+            repr(segment(self._probationary_root))
+
@@ -11,6 +11,7 @@ import ftlbuilder
 import recorder
 from utilities import utils
 from .bitmap import FlashBitmap2
+from .oobstore import ArrayMap
 from wiscsim.devblockpool import *
 from ftlsim_commons import *
 from commons import *
@@ -153,7 +154,7 @@ class OutOfBandAreas(object):
 
         # Key data structures
         self.states = FlashBitmap2(confobj)
-        self.ppn_to_lpn = {}
+        self.ppn_to_lpn = ArrayMap(self.total_pages)
 
     def display_bitmap_by_block(self):
         npages_per_block = self.conf.n_pages_per_block
@@ -185,13 +186,7 @@ class OutOfBandAreas(object):
         self.states.erase_block(flash_block)
 
         start, end = self.conf.block_to_page_range(flash_block)
-        for ppn in range(start, end):
-            try:
-                del self.ppn_to_lpn[ppn]
-                # if you try to erase translation block here, it may fail,
-                # but it is expected.
-            except KeyError:
-                pass
+        self.ppn_to_lpn.clear_range(start, end)
 
     def remap(self, lpn, old_ppn, new_ppn):
         """
@@ -210,11 +205,7 @@ class OutOfBandAreas(object):
 
     def lpns_of_block(self, flash_block):
         s, e = self.conf.block_to_page_range(flash_block)
-        lpns = []
-        for ppn in range(s, e):
-            lpns.append(self.ppn_to_lpn.get(ppn, 'NA'))
-
-        return lpns
+        return self.ppn_to_lpn.get_range(s, e, 'NA')
 
     def is_any_page_valid(self, flash_block):
         ppn_start, ppn_end = self.conf.block_to_page_range(flash_block)
@@ -790,8 +781,9 @@ class WearLevelingVictimBlocks(object):
         erasure_cnt = self._block_pool.get_erasure_count()
         least_used_blocks = reversed(erasure_cnt.most_common())
 
-        used_data_blocks = self._block_pool.data_usedblocks
-        used_log_blocks = self._block_pool.log_usedblocks
+        # snapshot, the consumer changes tags of blocks between yields
+        used_data_blocks = set(self._block_pool.data_usedblocks)
+        used_log_blocks = set(self._block_pool.log_usedblocks)
 
         # we need used data or trans block
         victim_cnt = 0
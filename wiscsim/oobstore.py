@@ -0,0 +1,79 @@
+"""
+Array-backed stores for the out-of-band areas of FTLs
+
+The OOB classes of dftldes, dftlext and nkftl2 used to keep the reverse
+mapping (ppn -> lpn or m_vpn), page timestamps and block invalidation times
+in dicts. A dict entry costs about 100 bytes; these stores cost 8 bytes per
+page (or block) whether or not it is used, and erasing a block or listing
+the LPNs of a block is done on a slice of the array.
+"""
+import numpy as np
+
+
+class ArrayMap(object):
+    """
+    dict-like map from a page (or block) number in [0, n_keys) to a number,
+    backed by a numpy array. A key is missing iff its slot holds
+    none_value, so none_value cannot be stored.
+
+    Values are returned as Python numbers, not numpy scalars.
+    """
+    def __init__(self, n_keys, dtype=np.int64, none_value=-1):
+        self.none_value = none_value
+        self._values = np.full(n_keys, none_value, dtype=dtype)
+
+    def __getitem__(self, key):
+        value = self._values.item(key)
+        if value == self.none_value:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._values.item(key)
+        if value == self.none_value:
+            return default
+        return value
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        if self._values.item(key) == self.none_value:
+            raise KeyError(key)
+        self._values[key] = self.none_value
+
+    def __contains__(self, key):
+        return self._values.item(key) != self.none_value
+
+    def has_key(self, key):
+        return self.__contains__(key)
+
+    def __len__(self):
+        "it scans the array, do not call it in hot paths"
+        return int(np.count_nonzero(self._values != self.none_value))
+
+    def keys(self):
+        return np.flatnonzero(self._values != self.none_value).tolist()
+
+    def set_range(self, start, values):
+        """
+        Set keys [start, start + len(values)) to values
+        """
+        self._values[start:start + len(values)] = values
+
+    def clear_range(self, start, end):
+        """
+        Remove keys [start, end), missing keys are fine
+        """
+        self._values[start:end] = self.none_value
+
+    def get_range(self, start, end, default=None):
+        """
+        Return the list of values of keys [start, end), default for
+        missing keys
+        """
+        values = self._values[start:end]
+        result = values.tolist()
+        for i in np.flatnonzero(values == self.none_value).tolist():
+            result[i] = default
+        return result
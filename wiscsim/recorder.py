@@ -149,8 +149,10 @@ class Recorder(object):
              counter 2: #},
         }
         """
-        counter_dict = self.general_accumulator.setdefault(counter_set_name,
-                collections.Counter())
+        counter_dict = self.general_accumulator.get(counter_set_name)
+        if counter_dict is None:
+            counter_dict = collections.Counter()
+            self.general_accumulator[counter_set_name] = counter_dict
         counter_dict[item_name] += addition
 
     @switchable
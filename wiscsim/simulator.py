@@ -39,13 +39,16 @@ class Simulator(object):
         return
 
     def __init__(self, conf, event_iter):
-        "conf is class Config"
+        """
+        conf is class Config
+        event_iter can also be the path of an event file (text or binary)
+        """
         if not isinstance(conf, config.Config):
             raise TypeError("conf is not config.Config, it is {}".
                 format(type(conf).__name__))
 
         self.conf = conf
-        self.event_iter = event_iter
+        self.event_iter = as_event_iter(conf, event_iter)
 
         # initialize recorder
         self.recorder = recorder.Recorder(output_target = self.conf['output_target'],
@@ -63,7 +66,7 @@ class SimulatorDESNew(Simulator):
         super(SimulatorDESNew, self).__init__(conf, event_iter)
 
         self.env = simpy.Environment()
-        self.host = Host(self.conf, self.env, event_iter)
+        self.host = Host(self.conf, self.env, self.event_iter)
         self.ssd = ssdframework.Ssd(self.conf, self.env,
                 self.host.get_ncq(), self.recorder)
 
@@ -95,6 +98,14 @@ class SimulatorDESNew(Simulator):
             gclog.classify_lpn_in_gclog()
 
 
+def as_event_iter(conf, event_iter):
+    "Open event_iter if it is the path of an event file"
+    if isinstance(event_iter, basestring):
+        return hostevent.create_event_iterator(conf, event_iter)
+    else:
+        return event_iter
+
+
 def create_simulator(simulator_class, conf, event_iter):
     cls = eval(simulator_class)
     return cls(conf, event_iter)
@@ -270,10 +281,12 @@ class SimulatorDESSync(Simulator):
         if not isinstance(event_iters, list):
             raise RuntimeError("event_iters must be a list of iterators.")
 
-        self.event_iters = event_iters
+        self.event_iters = [as_event_iter(conf, event_iter)
+                for event_iter in event_iters]
 
         self.env = simpy.Environment()
         self.ssdframework = ssdframework.SSDFramework(self.conf, self.recorder, self.env)
+        self.host_barrier = HostBarrier(len(self.event_iters), self.env)
 
     def host_proc(self, pid, event_iter):
         """
@@ -286,6 +299,10 @@ class SimulatorDESSync(Simulator):
                 capacity = self.conf['process_queue_depth'])
 
         for event in event_iter:
+            if event.get_operation() == OP_HOST_BARRIER:
+                yield self.env.process(self.host_barrier.wait())
+                continue
+
             event.token = token
             event.token_req = event.token.request()
 
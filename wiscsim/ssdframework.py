@@ -27,6 +27,9 @@ import nkftl2
 
 from pyreuse.sysutils import blocktrace, blockclassifiers, dumpe2fsparser
 
+# names of host operations in request_latency and request_count
+REQUEST_NAMES = {OP_READ: 'read', OP_WRITE: 'write', OP_DISCARD: 'discard'}
+
 class SsdBase(object):
     def _process(self, pid):
         raise NotImplementedError()
@@ -61,6 +64,10 @@ class Ssd(SsdBase):
         self.gc_sleep_timer = 0
         self.gc_sleep_duration = 10
 
+        self._trans_flush_interval = self.conf.get('trans_flush_interval')
+        self._do_trans_flush = self.conf['ftl_type'] == 'dftldes' and \
+                self._trans_flush_interval is not None
+
     def _create_ftl(self):
         if self.conf['ftl_type'] == 'dftldes':
             return dftldes.Ftl(self.conf, self.recorder, self.flash_controller,
@@ -93,6 +100,7 @@ class Ssd(SsdBase):
 
             # handle host_event case by case
             operation = host_event.get_operation()
+            start_time = self.env.now
 
             if operation == OP_ENABLE_RECORDER:
                 self.recorder.enable()
@@ -231,6 +239,12 @@ class Ssd(SsdBase):
                 raise NotImplementedError("Operation {} not supported."\
                         .format(host_event.operation))
 
+            if operation in REQUEST_NAMES:
+                name = REQUEST_NAMES[operation]
+                self.recorder.add_to_timer('request_latency', name,
+                        self.env.now - start_time)
+                self.recorder.count_me('request_count', name)
+
             if req_i % 1000 == 0:
                 print '.',
                 sys.stdout.flush()
@@ -256,6 +270,7 @@ class Ssd(SsdBase):
         self._snapshot_erasure_count_dist = False
         self._do_wear_leveling = False
         self._snapshot_user_traffic = False
+        self._do_trans_flush = False
 
     def _cleaner_process(self, forced=False):
         # things may have changed since last time we check, because of locks
@@ -273,6 +288,21 @@ class Ssd(SsdBase):
                 print 'skip wear leveling'
         print 'wear leveling process ends'
 
+    def _trans_flusher_process(self):
+        """
+        Write back dirty translation pages in the background, so evictions
+        of the foreground requests find clean entries
+        """
+        dirty_ratio = self.conf['trans_flush_dirty_ratio']
+        n_pages = self.conf['trans_flush_batch']
+        while self._do_trans_flush is True:
+            yield self.env.timeout(self._trans_flush_interval)
+            ratio = self.ftl.trans_cache_dirty_ratio()
+            if ratio > 0 and (ratio >= dirty_ratio or
+                    self.flash_controller.is_idle()):
+                yield self.env.process(
+                        self.ftl.write_back_trans_cache(n_pages))
+
 
     def _valid_ratio_snapshot_process(self):
         while self._snapshot_valid_ratios is True:
@@ -307,6 +337,10 @@ class Ssd(SsdBase):
         p = self.env.process( self._user_traffic_size_snapshot_process() )
         procs.append(p)
 
+        if self._do_trans_flush is True:
+            p = self.env.process( self._trans_flusher_process() )
+            procs.append(p)
+
         yield simpy.events.AllOf(self.env, procs)
 
 
@@ -466,7 +500,7 @@ class SSDFramework(object):
         if not os.path.exists(raw_blkparse_file_path):
             return
 
-        blkresult = blocktrace.BlktraceResult(
+        blkresult = blocktrace.BlktraceResultChunked(
                 self.conf['sector_size'],
                 self.conf['event_file_column_names'],
                 raw_blkparse_file_path, None)
@@ -0,0 +1,153 @@
+"""
+Mattson stack-distance analysis of the dftldes mapping cache
+
+Running the DES once per cache_mapped_data_bytes is slow. An LRU cache
+has the inclusion property: an access hits in a cache of C entries iff
+its stack distance (distinct keys since the previous access of the same
+key) is less than C. So one pass over a trace gives the Mapping_Cache
+hit/miss counts of every cache size at once.
+
+Each LPN of a read, write or discard request is one translation
+(MappingCache.lpn_to_ppn), counted as a hit or a miss. Two models are
+provided:
+
+- 'lpn': the cache is an LRU of mapping entries. This is the mapping
+  cache without the translation page prefetch of LpnTableMvpn.
+- 'mvpn': the cache is an LRU of whole translation pages
+  (n_cache_entries / n_mapping_entries_per_page of them), like
+  LpnTableMvpn loading all entries of a translation page on a miss.
+
+As in the simulator, only translations while the recorder is enabled are
+counted; the others only warm up the cache.
+"""
+from collections import Counter
+
+import numpy as np
+
+from commons import *
+import hostevent
+import traceprofile
+
+
+GRANULARITIES = ('lpn', 'mvpn')
+
+
+class MappingCacheStackDistance(object):
+    """
+    Usage:
+        sd = MappingCacheStackDistance(conf)
+        sd.process(event_iter)
+        sd.mapping_cache_counter(n_cache_entries)
+        -> Counter({'hit': .., 'miss': ..})
+    """
+    def __init__(self, conf, sample_rate=1.0):
+        self.conf = conf
+        self.n_entries_per_tpage = conf.page_size / \
+                conf.get('translation_page_entry_bytes', 4)
+        self.sample_rate = sample_rate
+
+        self.stacks = {
+            'lpn': traceprofile.ReuseDistanceCounter(sample_rate),
+            'mvpn': traceprofile.ReuseDistanceCounter(sample_rate),
+            }
+        # whether the recorder is enabled
+        self.recording = True
+
+    def process(self, event_iter):
+        if isinstance(event_iter, basestring):
+            event_iter = hostevent.create_event_iterator(self.conf,
+                    event_iter)
+
+        for event in event_iter:
+            if event.get_type() == 'ControlEvent':
+                if event.operation == OP_ENABLE_RECORDER:
+                    self.recording = True
+                elif event.operation == OP_DISABLE_RECORDER:
+                    self.recording = False
+            elif event.action == 'D' and \
+                    event.operation in (OP_READ, OP_WRITE, OP_DISCARD):
+                extent = event.get_lpn_extent(self.conf)
+                self.translate(extent.lpn_start, extent.lpn_count)
+
+    def translate(self, lpn_start, lpn_count):
+        """
+        Access the mappings of LPNs [lpn_start, lpn_start + lpn_count)
+        """
+        lpn_stack = self.stacks['lpn']
+        lpn_stack.access_many(np.arange(lpn_start, lpn_start + lpn_count),
+                self.recording)
+
+        # LPNs of the same translation page in a request: only the first
+        # can miss, the others have distance 0
+        mvpn_stack = self.stacks['mvpn']
+        lpn = lpn_start
+        lpn_end = lpn_start + lpn_count
+        while lpn < lpn_end:
+            m_vpn = lpn / self.n_entries_per_tpage
+            run_end = min((m_vpn + 1) * self.n_entries_per_tpage, lpn_end)
+            if mvpn_stack.is_sampled(m_vpn):
+                mvpn_stack.access(m_vpn, self.recording)
+                if self.recording:
+                    mvpn_stack.distances[0] += run_end - lpn - 1
+            lpn = run_end
+
+    def _capacity(self, n_cache_entries, granularity):
+        if granularity == 'lpn':
+            return n_cache_entries
+        elif granularity == 'mvpn':
+            return n_cache_entries / self.n_entries_per_tpage
+        else:
+            raise ValueError("granularity must be one of {}".format(
+                GRANULARITIES))
+
+    def hit_curve(self, granularity='lpn'):
+        """
+        Return (capacities, hits, total): hits[i] is the number of hits of
+        a cache that holds more than capacities[i] keys (entries for
+        'lpn', translation pages for 'mvpn'); total is the number of
+        translations. Counts are scaled by 1/sample_rate.
+        """
+        stack = self.stacks[granularity]
+        scale = 1.0 / self.sample_rate
+        distances = np.array(sorted(stack.distances.keys()), dtype=np.int64)
+        counts = np.array([stack.distances[d] for d in distances],
+                dtype=np.float64)
+        hits = np.cumsum(counts) * scale
+        total = (counts.sum() + stack.n_cold) * scale
+        return distances * scale, hits, total
+
+    def mapping_cache_counter(self, n_cache_entries, granularity='lpn'):
+        """
+        Return the Mapping_Cache counter of the recorder for a cache of
+        n_cache_entries entries
+        """
+        return self.mapping_cache_counters([n_cache_entries],
+                granularity)[n_cache_entries]
+
+    def mapping_cache_counters(self, cache_entries_list, granularity='lpn'):
+        """
+        Return {n_cache_entries: Counter({'hit': .., 'miss': ..})}
+        """
+        capacities, hits, total = self.hit_curve(granularity)
+        result = {}
+        for n_cache_entries in cache_entries_list:
+            capacity = self._capacity(n_cache_entries, granularity)
+            # hits are accesses with distance < capacity
+            i = np.searchsorted(capacities, capacity, side='left')
+            n_hits = int(round(hits[i - 1])) if i > 0 else 0
+            n_misses = int(round(total)) - n_hits
+            # like the recorder, no keys for events that never happened
+            counter = Counter()
+            if n_hits > 0:
+                counter['hit'] = n_hits
+            if n_misses > 0:
+                counter['miss'] = n_misses
+            result[n_cache_entries] = counter
+        return result
+
+
+def sweep_mapping_cache(conf, event_iter, cache_entries_list,
+        granularity='lpn', sample_rate=1.0):
+    sd = MappingCacheStackDistance(conf, sample_rate)
+    sd.process(event_iter)
+    return sd.mapping_cache_counters(cache_entries_list, granularity)
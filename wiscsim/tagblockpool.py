@@ -1,4 +1,7 @@
+import array
 from collections import Counter
+import heapq
+import itertools
 
 TFREE = 'TAGFREE'
 
@@ -6,31 +9,118 @@ LEAST_ERASED = 'least'
 MOST_ERASED = 'most'
 
 
+class ErasureCounter(Counter):
+    """
+    {blocknum: erasure count} that also keeps the distribution of erasure
+    counts, {erasure count: number of blocks}, up to date on every change.
+    """
+    def __init__(self, n_blocks=0):
+        super(ErasureCounter, self).__init__()
+        # have to put the block number in the counter
+        # otherwise, if a free block is never used, it won't
+        # appear in the counter.
+        dict.update(self, itertools.izip(xrange(n_blocks),
+            itertools.repeat(0)))
+        self.dist = Counter()
+        if n_blocks > 0:
+            self.dist[0] = n_blocks
+
+    def _remove_from_dist(self, count):
+        n = self.dist[count] - 1
+        if n == 0:
+            del self.dist[count]
+        else:
+            self.dist[count] = n
+
+    def __setitem__(self, blocknum, count):
+        if blocknum in self:
+            self._remove_from_dist(dict.__getitem__(self, blocknum))
+        dict.__setitem__(self, blocknum, count)
+        self.dist[count] += 1
+
+    def __delitem__(self, blocknum):
+        self._remove_from_dist(dict.__getitem__(self, blocknum))
+        dict.__delitem__(self, blocknum)
+
+    def copy(self):
+        return Counter(self)
+
+
 class TagBlockPool(object):
+    """
+    Blocks of a tag are kept in a list in the order they got the tag. A
+    block leaving a tag leaves a None in the list, the list is compacted
+    when it is needed or half of it is None.
+
+    Blocks of a tag are also in heaps ordered by erasure count, one per
+    choice (LEAST_ERASED, MOST_ERASED), built when the choice is first
+    used. A heap entry is stale if the block has changed tag since the
+    entry was pushed, stale entries are skipped when popped. Ties are
+    broken like sorting by Counter.most_common(): the least erased block
+    with the largest block number, or the most erased block with the
+    smallest block number.
+    """
     def __init__(self, n, tags):
         self._tag_subpool = {tag:[] for tag in tags}
         self._tag_subpool[TFREE] = range(n)
+        # number of None in each list of _tag_subpool
+        self._n_removed = {tag:0 for tag in self._tag_subpool}
+
+        # tag of each block, index of each block in its list
+        self._tag_of_block = [TFREE] * n
+        self._index_of_block = array.array('l', range(n))
+        # incremented every time a block changes tag
+        self._generation = array.array('l', [0]) * n
+
+        # {(tag, choice): heap of (key, generation, blocknum)}
+        self._heaps = {}
 
         # {blocknum: count}
-        self._erasure_cnt = Counter()
-        # have to put the block number in the counter
-        # otherwise, if a free block is never used, it won't
-        # appear in the counter.
-        for block in range(n):
-            self._erasure_cnt[block] = 0
+        self._erasure_cnt = ErasureCounter(n)
+
+    def _compact(self, tag):
+        blocks = self._tag_subpool[tag]
+        blocks[:] = [block for block in blocks if block is not None]
+        index_of_block = self._index_of_block
+        for i, block in enumerate(blocks):
+            index_of_block[block] = i
+        self._n_removed[tag] = 0
 
     def get_blocks_of_tag(self, tag):
+        if self._n_removed[tag] > 0:
+            self._compact(tag)
         return self._tag_subpool[tag]
 
+    def get_tag(self, blocknum):
+        return self._tag_of_block[blocknum]
+
     def change_tag(self, blocknum, src, dst):
-        self._tag_subpool[src].remove(blocknum)
-        self._tag_subpool[dst].append(blocknum)
+        if self._tag_of_block[blocknum] != src:
+            raise ValueError("block {} is not tagged {}".format(
+                blocknum, src))
+
+        src_blocks = self._tag_subpool[src]
+        src_blocks[self._index_of_block[blocknum]] = None
+        self._n_removed[src] += 1
+        if self._n_removed[src] * 2 > len(src_blocks):
+            self._compact(src)
+
+        dst_blocks = self._tag_subpool[dst]
+        self._index_of_block[blocknum] = len(dst_blocks)
+        dst_blocks.append(blocknum)
+        self._tag_of_block[blocknum] = dst
+        self._generation[blocknum] += 1
 
         if dst == TFREE:
             self._erasure_cnt[blocknum] += 1
 
+        for choice in (LEAST_ERASED, MOST_ERASED):
+            heap = self._heaps.get((dst, choice))
+            if heap is not None:
+                heapq.heappush(heap, self._heap_entry(blocknum, choice))
+
     def count_blocks(self, tag):
-        return len(self._tag_subpool[tag])
+        return len(self._tag_subpool[tag]) - self._n_removed[tag]
 
     def pick(self, tag, choice=LEAST_ERASED):
         return self.get_least_or_most_erased_block(tag, choice)
@@ -59,28 +149,46 @@ class TagBlockPool(object):
         else:
             return None
 
-    def get_least_or_most_erased_blocks(self, tag, choice, nblocks):
+    def _heap_entry(self, blocknum, choice):
+        count = self._erasure_cnt[blocknum]
         if choice == LEAST_ERASED:
-            blocks_by_cnt = reversed(self._erasure_cnt.most_common())
-        elif choice == MOST_ERASED:
-            blocks_by_cnt = self._erasure_cnt.most_common()
+            key = (count, -blocknum)
         else:
+            key = (-count, blocknum)
+        return key, self._generation[blocknum], blocknum
+
+    def _get_heap(self, tag, choice):
+        heap = self._heaps.get((tag, choice))
+        if heap is None or len(heap) > 2 * self.count_blocks(tag) + 16:
+            # not built yet, or mostly stale
+            heap = [self._heap_entry(blocknum, choice)
+                    for blocknum in self.get_blocks_of_tag(tag)]
+            heapq.heapify(heap)
+            self._heaps[(tag, choice)] = heap
+        return heap
+
+    def get_least_or_most_erased_blocks(self, tag, choice, nblocks):
+        if choice not in (LEAST_ERASED, MOST_ERASED):
             raise NotImplementedError
 
-        tag_blocks = self.get_blocks_of_tag(tag)
+        heap = self._get_heap(tag, choice)
+        generation = self._generation
+
+        # pop from least used to most used (or the other way)
+        entries = []
+        while len(heap) > 0 and len(entries) < nblocks:
+            entry = heapq.heappop(heap)
+            if entry[1] == generation[entry[2]]:
+                entries.append(entry)
 
-        # iterate from least used to most used
-        blocks = []
-        for blocknum, count in blocks_by_cnt:
-            if blocknum in tag_blocks:
-                blocks.append(blocknum)
-                if len(blocks) == nblocks:
-                    break
+        # the blocks are still in the tag
+        for entry in entries:
+            heapq.heappush(heap, entry)
 
-        return blocks
+        return [entry[2] for entry in entries]
 
     def get_erasure_count_dist(self):
-        return Counter(self._erasure_cnt.values())
+        return Counter(self._erasure_cnt.dist)
 
 
 class CurrentBlock(object):
@@ -114,6 +222,8 @@ class BlockPoolWithCurBlocks(TagBlockPool):
         # {TAG1: {0: CurrentBlock obj, 1: CurrentBlock obj},
         #  TAG2: {0: CurrentBlock obj, 1: CurrentBlock obj}}
         self._cur_blocks = {tag:{} for tag in tags}
+        # block numbers of all current blocks, for O(1) membership test
+        self._cur_blocknums = set()
 
     def get_cur_block_obj(self, tag, block_index=None):
         """
@@ -149,8 +259,16 @@ class BlockPoolWithCurBlocks(TagBlockPool):
                     block_index for block_index, obj in cur_obj_dict.items()
                     if obj.is_full()]
             for block_index in to_del_block_index:
+                self._cur_blocknums.discard(cur_obj_dict[block_index].blocknum)
                 del cur_obj_dict[block_index]
 
+    def is_current_block(self, blocknum):
+        return blocknum in self._cur_blocknums
+
+    def get_cur_blocknums(self):
+        "the returned set is live, do not modify it"
+        return self._cur_blocknums
+
     def set_new_cur_block(self, tag, block_index, blocknum):
         """
         Set block blocknum to be the current block of tag and block_index.
@@ -158,8 +276,13 @@ class BlockPoolWithCurBlocks(TagBlockPool):
         pick_and_move().
         blocknum must has been tagged $tag before calling this function.
         """
+        old_obj = self._cur_blocks[tag].get(block_index, None)
+        if old_obj is not None:
+            self._cur_blocknums.discard(old_obj.blocknum)
+
         block_obj = CurrentBlock(self._n_pages_per_block, blocknum=blocknum)
         self._cur_blocks[tag][block_index] = block_obj
+        self._cur_blocknums.add(blocknum)
         return block_obj
 
 
@@ -0,0 +1,264 @@
+"""
+Block-compressed event traces
+
+A compressed trace is a sequence of independently compressed blocks of
+lines. Each block is a complete gzip member / bz2 stream / xz stream, so
+the whole file can still be read by zcat, bzcat or xzcat. A sidecar index
+(<path>.idx, JSON) records the file offset, compressed length and number
+of lines of every block, which allows reading any block directly and
+skipping blocks without decompressing them.
+"""
+import bz2
+import os
+import threading
+import Queue
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from utilities import utils
+
+
+INDEX_SUFFIX = '.idx'
+
+
+class GzipCodec(object):
+    name = 'gz'
+    magic = '\x1f\x8b'
+
+    def compress(self, data):
+        c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return c.compress(data) + c.flush()
+
+    def decompress(self, data):
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+    def decompressobj(self):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+class Bz2Codec(object):
+    name = 'bz2'
+    magic = 'BZh'
+
+    def compress(self, data):
+        return bz2.compress(data)
+
+    def decompress(self, data):
+        return bz2.decompress(data)
+
+    def decompressobj(self):
+        return bz2.BZ2Decompressor()
+
+
+class XzCodec(object):
+    name = 'xz'
+    magic = '\xfd7zXZ\x00'
+
+    def compress(self, data):
+        return lzma.compress(data)
+
+    def decompress(self, data):
+        return lzma.decompress(data)
+
+    def decompressobj(self):
+        return lzma.LZMADecompressor()
+
+
+CODECS = {'gz': GzipCodec(), 'bz2': Bz2Codec()}
+if lzma is not None:
+    CODECS['xz'] = XzCodec()
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise RuntimeError("Compression {} is not supported. Supported: {}"\
+            .format(name, CODECS.keys()))
+
+
+def detect_codec(file_path):
+    """
+    Return the codec of a compressed file, or None if the file is not
+    compressed by any of the supported codecs.
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(8)
+    for codec in CODECS.values():
+        if head.startswith(codec.magic):
+            return codec
+    return None
+
+
+def is_compressed_file(file_path):
+    return detect_codec(file_path) is not None
+
+
+def index_path_of(file_path):
+    return file_path + INDEX_SUFFIX
+
+
+def compress_lines(lines, out_path, codec_name='gz', lines_per_block=65536):
+    """
+    Write lines (without line endings) to a block-compressed file and its
+    sidecar index. Return the number of lines written.
+    """
+    codec = get_codec(codec_name)
+    blocks = []
+    n_lines = 0
+
+    def write_block(f, block_lines):
+        data = codec.compress(''.join(l + '\n' for l in block_lines))
+        blocks.append([f.tell(), len(data), len(block_lines)])
+        f.write(data)
+
+    with open(out_path, 'wb') as f:
+        block_lines = []
+        for line in lines:
+            block_lines.append(line)
+            if len(block_lines) == lines_per_block:
+                write_block(f, block_lines)
+                n_lines += len(block_lines)
+                block_lines = []
+        if len(block_lines) > 0:
+            write_block(f, block_lines)
+            n_lines += len(block_lines)
+
+    utils.dump_json({'codec': codec.name, 'n_lines': n_lines,
+        'blocks': blocks}, index_path_of(out_path))
+
+    return n_lines
+
+
+def compress_file(text_path, out_path, codec_name='gz',
+        lines_per_block=65536):
+    with open(text_path, 'r') as f:
+        return compress_lines((line.rstrip('\n') for line in f), out_path,
+                codec_name, lines_per_block)
+
+
+class CompressedLineIterator(object):
+    """
+    Iterate stripped lines of a compressed file, like FileLineIterator.
+
+    Blocks are decompressed by a background thread into a bounded queue,
+    so decompression overlaps with the consumer. With a sidecar index,
+    iteration can start at any block and blocks are read independently.
+    Without the index, the file is decompressed sequentially.
+    """
+    def __init__(self, file_path, start_block=0, n_prefetch_blocks=4):
+        self.file_path = file_path
+        self.start_block = start_block
+        self.n_prefetch_blocks = n_prefetch_blocks
+
+        self.codec = detect_codec(file_path)
+        if self.codec is None:
+            raise RuntimeError("{} is not a compressed file".format(
+                file_path))
+
+        index_path = index_path_of(file_path)
+        if os.path.exists(index_path):
+            self.index = utils.load_json(index_path)
+        else:
+            self.index = None
+            if start_block != 0:
+                raise RuntimeError("Cannot start at block {} without index "
+                    "{}".format(start_block, index_path))
+
+    def n_blocks(self):
+        "Return None if the number of blocks is unknown (no index)"
+        if self.index is None:
+            return None
+        return len(self.index['blocks'])
+
+    def read_block(self, f, block_id):
+        offset, length, _ = self.index['blocks'][block_id]
+        f.seek(offset)
+        return self.codec.decompress(f.read(length))
+
+    def _iter_indexed_chunks(self):
+        with open(self.file_path, 'rb') as f:
+            for block_id in range(self.start_block, self.n_blocks()):
+                yield self.read_block(f, block_id)
+
+    def _iter_sequential_chunks(self, read_size=1024*1024):
+        """
+        Decompress concatenated streams one after another
+        """
+        with open(self.file_path, 'rb') as f:
+            decomp = self.codec.decompressobj()
+            while True:
+                data = f.read(read_size)
+                if not data:
+                    break
+                while data:
+                    try:
+                        chunk = decomp.decompress(data)
+                    except EOFError:
+                        # the stream ended exactly at the end of the last
+                        # read. bz2 of Python 2 has no eof to tell it.
+                        decomp = self.codec.decompressobj()
+                        continue
+                    yield chunk
+                    data = decomp.unused_data
+                    if data or getattr(decomp, 'eof', False):
+                        # a new stream starts
+                        decomp = self.codec.decompressobj()
+
+    def _iter_chunks(self):
+        if self.index is None:
+            return self._iter_sequential_chunks()
+        else:
+            return self._iter_indexed_chunks()
+
+    def _produce(self, q, stop):
+        try:
+            for chunk in self._iter_chunks():
+                if not self._put(q, stop, ('data', chunk)):
+                    return
+        except Exception as e:
+            self._put(q, stop, ('error', e))
+        else:
+            self._put(q, stop, ('end', None))
+
+    def _put(self, q, stop, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        q = Queue.Queue(maxsize=self.n_prefetch_blocks)
+        stop = threading.Event()
+        t = threading.Thread(target=self._produce, args=(q, stop))
+        t.daemon = True
+        t.start()
+
+        partial = ''
+        try:
+            while True:
+                kind, value = q.get()
+                if kind == 'end':
+                    break
+                elif kind == 'error':
+                    raise value
+
+                lines = (partial + value).split('\n')
+                # the last piece may continue in the next chunk
+                partial = lines.pop()
+                for line in lines:
+                    yield line.strip()
+            if partial:
+                yield partial.strip()
+        finally:
+            stop.set()
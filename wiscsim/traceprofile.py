@@ -0,0 +1,522 @@
+"""
+One-pass trace profiler
+
+TraceProfiler reads an event stream once and reports the statistics we
+look at before choosing cache_mapped_data_bytes, segment_bytes or
+over-provisioning: bytes and request size histogram per operation,
+sequentiality, LPN/m_vpn footprint, access count (hotness) distributions
+and LRU reuse-distance histograms of the LPN and m_vpn streams.
+
+Events are processed in chunks of NumPy arrays. Memory is bounded:
+- footprints are bitmaps (1 bit per LPN)
+- per-key access counts are exact in a dense array up to dense_limit keys,
+  after that a count-min sketch serves point queries and exact counts are
+  kept only for a hash sample of keys
+- reuse distances are computed for a hash sample of keys (SHARDS-style)
+  with a Fenwick tree, in O(log n) per sampled access
+"""
+import argparse
+import pprint
+from collections import Counter
+
+import numpy as np
+
+import config
+from commons import *
+import hostevent
+
+
+OPS = [OP_READ, OP_WRITE, OP_DISCARD]
+OP_NAMES = {OP_READ: 'read', OP_WRITE: 'write', OP_DISCARD: 'discard'}
+
+# 2**64 / golden ratio, for multiplicative hashing
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+HASH_SHIFT = np.uint64(40)
+HASH_SPACE = 2**24
+
+
+def hash_keys(keys):
+    """
+    Return a hash of each key in [0, HASH_SPACE)
+    """
+    with np.errstate(over='ignore'):
+        return (np.asarray(keys, dtype=np.uint64) * HASH_MULTIPLIER) \
+                >> HASH_SHIFT
+
+
+def sample_mask(keys, sample_rate):
+    if sample_rate >= 1:
+        return np.ones(len(keys), dtype=bool)
+    return hash_keys(keys) < int(sample_rate * HASH_SPACE)
+
+
+def expand_extents(starts, counts):
+    """
+    Return all keys of the extents [start, start + count)
+    """
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    ext_starts = np.cumsum(counts) - counts
+    return np.arange(total, dtype=np.int64) \
+            - np.repeat(ext_starts, counts) + np.repeat(starts, counts)
+
+
+def log2_buckets_of_each(values):
+    """
+    Return the bucket of each value. Bucket b (a power of 2) holds the
+    values in (b/2, b]; bucket 0 holds the zeros.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    buckets = np.zeros(len(values), dtype=np.int64)
+    positive = values > 0
+    buckets[positive] = 2 ** np.ceil(np.log2(values[positive])).astype(
+            np.int64)
+    return buckets.tolist()
+
+
+def log2_buckets(values):
+    "Return a dict: bucket -> number of values"
+    return dict(Counter(log2_buckets_of_each(values)))
+
+
+class Bitmap(object):
+    """
+    A bitmap of non-negative integer keys that grows as needed
+    """
+    def __init__(self):
+        self.bytes = np.zeros(0, dtype=np.uint8)
+
+    def add(self, keys):
+        if len(keys) == 0:
+            return
+        keys = np.unique(keys)
+        byte_ids = keys >> 3
+        needed = int(byte_ids[-1]) + 1
+        if needed > len(self.bytes):
+            grown = np.zeros(max(needed, 2 * len(self.bytes)), dtype=np.uint8)
+            grown[:len(self.bytes)] = self.bytes
+            self.bytes = grown
+
+        masks = np.left_shift(1, keys & 7).astype(np.uint8)
+        # keys are sorted, so the bits of the same byte are adjacent
+        starts = np.flatnonzero(np.r_[True, byte_ids[1:] != byte_ids[:-1]])
+        merged = np.bitwise_or.reduceat(masks, starts)
+        self.bytes[byte_ids[starts]] |= merged
+
+    def count(self):
+        return int(np.unpackbits(self.bytes).sum())
+
+    def __or__(self, other):
+        result = Bitmap()
+        n = max(len(self.bytes), len(other.bytes))
+        result.bytes = np.zeros(n, dtype=np.uint8)
+        result.bytes[:len(self.bytes)] |= self.bytes
+        result.bytes[:len(other.bytes)] |= other.bytes
+        return result
+
+
+class CountMinSketch(object):
+    def __init__(self, width=2**20, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+        self.seeds = [np.uint64(2 * i + 1) for i in range(depth)]
+
+    def _columns(self, keys, row):
+        with np.errstate(over='ignore'):
+            h = hash_keys(np.asarray(keys, dtype=np.uint64) ^ (self.seeds[row]
+                * HASH_MULTIPLIER))
+        return (h % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, keys, counts):
+        for row in range(self.depth):
+            np.add.at(self.table[row], self._columns(keys, row), counts)
+
+    def estimate(self, keys):
+        keys = np.atleast_1d(keys)
+        return np.min([self.table[row][self._columns(keys, row)]
+            for row in range(self.depth)], axis=0)
+
+
+class AccessCounter(object):
+    """
+    Access counts of keys (LPNs or m_vpns)
+
+    Counts are exact in a dense array while all keys are below dense_limit.
+    After that, a count-min sketch answers point queries and exact counts
+    are kept for a hash sample of the keys, which is used for the hotness
+    statistics.
+    """
+    def __init__(self, dense_limit=2**24, sample_rate=0.01,
+            sketch_width=2**20, sketch_depth=4):
+        self.dense_limit = dense_limit
+        self.sample_rate = sample_rate
+        self.sketch_width = sketch_width
+        self.sketch_depth = sketch_depth
+
+        self.dense = np.zeros(0, dtype=np.uint32)
+        self.sketch = None
+        self.sampled = Counter()
+        self.n_accesses = 0
+
+    @property
+    def exact(self):
+        return self.sketch is None
+
+    def add(self, keys):
+        if len(keys) == 0:
+            return
+        self.n_accesses += len(keys)
+        keys, counts = np.unique(keys, return_counts=True)
+
+        if self.exact and keys[-1] >= self.dense_limit:
+            self._switch_to_sketch()
+
+        if self.exact:
+            needed = int(keys[-1]) + 1
+            if needed > len(self.dense):
+                grown = np.zeros(min(max(needed, 2 * len(self.dense)),
+                    self.dense_limit), dtype=np.uint32)
+                grown[:len(self.dense)] = self.dense
+                self.dense = grown
+            self.dense[keys] += counts.astype(np.uint32)
+        else:
+            self._add_to_sketch(keys, counts)
+
+    def _add_to_sketch(self, keys, counts):
+        self.sketch.add(keys, counts)
+        mask = sample_mask(keys, self.sample_rate)
+        self.sampled.update(dict(zip(keys[mask].tolist(),
+            counts[mask].tolist())))
+
+    def _switch_to_sketch(self):
+        self.sketch = CountMinSketch(self.sketch_width, self.sketch_depth)
+        keys = np.flatnonzero(self.dense)
+        counts = self.dense[keys]
+        self.dense = None
+        self._add_to_sketch(keys, counts)
+
+    def estimate(self, key):
+        if self.exact:
+            if key < len(self.dense):
+                return int(self.dense[key])
+            return 0
+        return int(self.sketch.estimate(key)[0])
+
+    def _touched_counts(self):
+        "return counts of touched keys and the scale of each"
+        if self.exact:
+            counts = self.dense[self.dense > 0]
+            return counts, 1.0
+        counts = np.array(self.sampled.values(), dtype=np.int64)
+        return counts, 1.0 / self.sample_rate
+
+    def hotness(self, top_fractions=(0.01, 0.05, 0.1, 0.2)):
+        counts, scale = self._touched_counts()
+        result = {'accesses': self.n_accesses,
+                  'exact': self.exact,
+                  'access_count_histogram': {},
+                  'top_share': {}}
+        if len(counts) == 0:
+            return result
+
+        result['access_count_histogram'] = {
+                bucket: int(round(n * scale))
+                for bucket, n in log2_buckets(counts).items()}
+
+        counts = np.sort(counts)[::-1]
+        cumulative = np.cumsum(counts, dtype=np.float64)
+        for fraction in top_fractions:
+            n_top = max(int(len(counts) * fraction), 1)
+            result['top_share'][fraction] = cumulative[n_top - 1] / \
+                    cumulative[-1]
+        return result
+
+
+class FenwickTree(object):
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    @classmethod
+    def from_ones(cls, size, n_ones):
+        "tree with 1 at positions [0, n_ones), built in O(size)"
+        tree = cls(size)
+        t = tree.tree
+        for i in range(1, size + 1):
+            if i <= n_ones:
+                t[i] += 1
+            j = i + (i & -i)
+            if j <= size:
+                t[j] += t[i]
+        return tree
+
+    def add(self, pos, delta):
+        i = pos + 1
+        t = self.tree
+        size = self.size
+        while i <= size:
+            t[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, pos):
+        "sum of [0, pos]"
+        i = pos + 1
+        t = self.tree
+        s = 0
+        while i > 0:
+            s += t[i]
+            i -= i & -i
+        return s
+
+
+class ReuseDistanceCounter(object):
+    """
+    LRU stack distances of a stream of keys
+
+    The distance of an access is the number of distinct keys accessed
+    since the previous access of the same key; an LRU cache of C entries
+    hits iff distance < C. Only keys in the hash sample are tracked, the
+    distances and counts are scaled by 1/sample_rate (SHARDS).
+
+    Each key has a marker at the time of its latest access in a Fenwick
+    tree, so a distance is a range sum. When time reaches the capacity of
+    the tree, markers are renumbered to 0..n_keys-1.
+    """
+    def __init__(self, sample_rate=1.0, capacity=2**16):
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self.tree = FenwickTree(capacity)
+        self.last_time = {}
+        self.now = 0
+
+        self.n_cold = 0
+        self.distances = Counter()
+
+    def is_sampled(self, key):
+        return bool(sample_mask([key], self.sample_rate)[0])
+
+    def access_many(self, keys, record=True):
+        keys = np.asarray(keys)
+        keys = keys[sample_mask(keys, self.sample_rate)]
+        for key in keys.tolist():
+            self.access(key, record)
+
+    def access(self, key, record=True):
+        """
+        Return the distance of the access, or None if it is the first
+        access of key. key must be in the sample. If record is False, the
+        access only updates the stack (e.g. to warm it up).
+        """
+        if self.now == self.capacity:
+            self._compact()
+
+        last = self.last_time.get(key)
+        if last is None:
+            distance = None
+            if record:
+                self.n_cold += 1
+        else:
+            distance = self.tree.prefix_sum(self.now - 1) - \
+                    self.tree.prefix_sum(last)
+            self.tree.add(last, -1)
+            if record:
+                self.distances[distance] += 1
+
+        self.tree.add(self.now, 1)
+        self.last_time[key] = self.now
+        self.now += 1
+
+        return distance
+
+    def _compact(self):
+        n_keys = len(self.last_time)
+        while n_keys * 2 > self.capacity:
+            self.capacity *= 2
+        keys = sorted(self.last_time, key=self.last_time.get)
+        self.last_time = dict(zip(keys, range(n_keys)))
+        self.tree = FenwickTree.from_ones(self.capacity, n_keys)
+        self.now = n_keys
+
+    def report(self):
+        scale = 1.0 / self.sample_rate
+        distances = self.distances.keys()
+        buckets = log2_buckets_of_each(np.array(distances) * scale)
+        histogram = Counter()
+        for bucket, distance in zip(buckets, distances):
+            histogram[bucket] += self.distances[distance] * scale
+        return {'sample_rate': self.sample_rate,
+                'cold': int(round(self.n_cold * scale)),
+                'histogram': {b: int(round(n)) for b, n in histogram.items()}}
+
+
+class TraceProfiler(object):
+    """
+    Usage:
+        profiler = TraceProfiler(conf)
+        profiler.process(event_iter)
+        report = profiler.report()
+
+    event_iter can be any iterator of events (ControlEvents are skipped)
+    or the path of an event file.
+    """
+    def __init__(self, conf, chunk_events=65536, dense_limit=2**24,
+            hotness_sample_rate=0.01, reuse_sample_rate=0.01,
+            max_pages_per_piece=2**20):
+        self.conf = conf
+        self.page_size = conf.page_size
+        self.n_entries_per_tpage = self.page_size / \
+                conf.get('translation_page_entry_bytes', 4)
+        self.chunk_events = chunk_events
+        self.max_pages_per_piece = max_pages_per_piece
+
+        self.n_requests = Counter()
+        self.bytes = Counter()
+        self.size_histograms = {op: Counter() for op in OPS}
+        self.n_sequential = Counter()
+        self.last_end = {op: None for op in OPS}
+
+        self.lpn_footprints = {op: Bitmap() for op in OPS}
+        self.mvpn_footprint = Bitmap()
+        self.lpn_counter = AccessCounter(dense_limit, hotness_sample_rate)
+        self.mvpn_counter = AccessCounter(dense_limit, hotness_sample_rate)
+        self.lpn_reuse = ReuseDistanceCounter(reuse_sample_rate)
+        self.mvpn_reuse = ReuseDistanceCounter(reuse_sample_rate)
+
+    def process(self, event_iter):
+        if isinstance(event_iter, basestring):
+            event_iter = hostevent.create_event_iterator(self.conf,
+                    event_iter)
+
+        ops, offsets, sizes = [], [], []
+        for event in event_iter:
+            if event.get_type() != 'Event' or event.action != 'D' or \
+                    event.operation not in OP_NAMES:
+                continue
+            ops.append(OPS.index(event.operation))
+            offsets.append(event.offset)
+            sizes.append(event.size)
+            if len(ops) == self.chunk_events:
+                self.process_arrays(ops, offsets, sizes)
+                ops, offsets, sizes = [], [], []
+        self.process_arrays(ops, offsets, sizes)
+
+    def process_arrays(self, ops, offsets, sizes):
+        """
+        Process requests given as arrays of operation index (in OPS),
+        byte offset and byte size, in trace order
+        """
+        if len(ops) == 0:
+            return
+        ops = np.asarray(ops, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        sizes = np.asarray(sizes, dtype=np.int64)
+
+        for i, op in enumerate(OPS):
+            mask = ops == i
+            self._count_requests(op, offsets[mask], sizes[mask])
+
+        # the page range of conf.off_size_to_page_range(force_alignment=False)
+        lpn_starts = offsets // self.page_size
+        lpn_counts = -(-sizes // self.page_size)
+        for piece in self._split_large_extents(ops, lpn_starts, lpn_counts):
+            self._count_pages(*piece)
+
+    def _count_requests(self, op, offsets, sizes):
+        if len(offsets) == 0:
+            return
+        self.n_requests[op] += len(offsets)
+        self.bytes[op] += int(sizes.sum())
+        self.size_histograms[op].update(log2_buckets(sizes))
+
+        # a request is sequential if it starts where the previous request
+        # of the same operation ends
+        ends = offsets + sizes
+        prev_ends = np.r_[[-1 if self.last_end[op] is None
+            else self.last_end[op]], ends[:-1]]
+        self.n_sequential[op] += int((offsets == prev_ends).sum())
+        self.last_end[op] = int(ends[-1])
+
+    def _split_large_extents(self, ops, starts, counts):
+        """
+        Yield pieces of (ops, starts, counts) whose expansion has at most
+        max_pages_per_piece pages, except for single huge extents
+        """
+        limit = self.max_pages_per_piece
+        begin = 0
+        total = 0
+        for i, count in enumerate(counts.tolist()):
+            if total + count > limit and i > begin:
+                yield ops[begin:i], starts[begin:i], counts[begin:i]
+                begin = i
+                total = 0
+            total += count
+        yield ops[begin:], starts[begin:], counts[begin:]
+
+    def _count_pages(self, ops, lpn_starts, lpn_counts):
+        lpns = expand_extents(lpn_starts, lpn_counts)
+        lpn_ops = np.repeat(ops, lpn_counts)
+        for i, op in enumerate(OPS):
+            self.lpn_footprints[op].add(lpns[lpn_ops == i])
+        self.lpn_counter.add(lpns)
+        self.lpn_reuse.access_many(lpns)
+
+        # each request accesses each of its translation pages once
+        mvpn_starts = lpn_starts // self.n_entries_per_tpage
+        mvpn_ends = (lpn_starts + np.maximum(lpn_counts, 1) - 1) \
+                // self.n_entries_per_tpage
+        mvpns = expand_extents(mvpn_starts, mvpn_ends - mvpn_starts + 1)
+        self.mvpn_footprint.add(mvpns)
+        self.mvpn_counter.add(mvpns)
+        self.mvpn_reuse.access_many(mvpns)
+
+    def report(self):
+        all_lpns = self.lpn_footprints[OP_READ] | \
+                self.lpn_footprints[OP_WRITE] | \
+                self.lpn_footprints[OP_DISCARD]
+
+        footprint = {'lpns': all_lpns.count(),
+                     'mvpns': self.mvpn_footprint.count()}
+        footprint['bytes'] = footprint['lpns'] * self.page_size
+        for op in OPS:
+            footprint[OP_NAMES[op] + '_lpns'] = \
+                    self.lpn_footprints[op].count()
+
+        return {
+            'n_requests': {OP_NAMES[op]: self.n_requests[op] for op in OPS},
+            'bytes': {OP_NAMES[op]: self.bytes[op] for op in OPS},
+            'request_size_histogram': {OP_NAMES[op]:
+                dict(self.size_histograms[op]) for op in OPS},
+            'sequential_ratio': {OP_NAMES[op]:
+                self.n_sequential[op] / float(self.n_requests[op])
+                for op in OPS if self.n_requests[op] > 0},
+            'footprint': footprint,
+            'lpn_hotness': self.lpn_counter.hotness(),
+            'mvpn_hotness': self.mvpn_counter.hotness(),
+            'lpn_reuse_distance': self.lpn_reuse.report(),
+            'mvpn_reuse_distance': self.mvpn_reuse.report(),
+            }
+
+
+def profile_trace(conf, event_iter, **kwargs):
+    profiler = TraceProfiler(conf, **kwargs)
+    profiler.process(event_iter)
+    return profiler.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile an event file')
+    parser.add_argument('event_file')
+    parser.add_argument('--page-size', type=int, default=4096)
+    parser.add_argument('--reuse-sample-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    conf = config.ConfigNCQFTL()
+    conf['flash_config']['page_size'] = args.page_size
+    pprint.pprint(profile_trace(conf, args.event_file,
+        reuse_sample_rate = args.reuse_sample_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""
+Spatially sampled trace replay
+
+For quick what-if studies, a trace can be replayed on a scaled-down SSD.
+Like SHARDS, the logical space is divided into data groups (by default,
+one flash block worth of LPNs) and a group is kept iff the hash of its id
+is below sample_rate. Kept groups are renumbered densely, so the
+sampled trace fits a flash that is sample_rate times the original size.
+Requests crossing group boundaries are split and only the pieces in kept
+groups are replayed. Control events are passed through.
+
+After the run, extensive recorder counters (flash_ops, traffic, gc, ...)
+are divided by the effective sample rate to estimate the full run.
+
+Usage:
+    sampler = SpatialSampler(conf, sample_rate=0.1)
+    sampled_conf = sampler.scaled_config()
+    wf = Workflow(sampled_conf)
+    wf.run_simulator(sampler.sample(wf.run_workload()))
+    rescale_recorder_result(sampled_conf['result_dir'],
+        sampler.effective_rate)
+"""
+import argparse
+import copy
+import math
+import os
+import pprint
+
+import numpy as np
+
+import config
+from commons import *
+import hostevent
+import traceprofile
+from utilities import utils
+
+
+# counter sets of recorder's general_accumulator that grow with the
+# amount of data
+RESCALED_COUNTER_SETS = ('flash_ops', 'traffic', 'gc', 'wearleveling',
+        'translation', 'Mapping_Cache', 'cache', 'victim_scan', 'prefetch',
+        'request_latency', 'request_count')
+
+RESCALED_RESULT_NAME = 'recorder.rescaled.json'
+
+
+class SpatialSampler(object):
+    def __init__(self, conf, sample_rate, group_bytes=None, salt=0):
+        self.conf = conf
+        self.sample_rate = sample_rate
+        self.page_size = conf.page_size
+        self.n_entries_per_tpage = self.page_size / \
+                conf.get('translation_page_entry_bytes', 4)
+
+        if group_bytes is None:
+            group_bytes = conf.block_bytes
+        if group_bytes % self.page_size != 0:
+            raise RuntimeError("group_bytes ({}) must be a multiple of "
+                "page size ({})".format(group_bytes, self.page_size))
+        self.group_bytes = group_bytes
+
+        self.n_groups = int(math.ceil(
+            float(conf.total_flash_bytes()) / group_bytes))
+        group_ids = np.arange(self.n_groups, dtype=np.int64)
+        sampled = traceprofile.sample_mask(
+                group_ids + salt * self.n_groups, sample_rate)
+
+        # new group id of each group, -1 if the group is not sampled
+        self.new_group_ids = np.full(self.n_groups, -1, dtype=np.int64)
+        self.n_sampled_groups = int(sampled.sum())
+        self.new_group_ids[sampled] = np.arange(self.n_sampled_groups)
+        self.new_group_ids = self.new_group_ids.tolist()
+
+        if self.n_sampled_groups == 0:
+            raise RuntimeError("No data group is sampled at rate {}. Use a "
+                "larger sample rate or smaller group_bytes".format(
+                    sample_rate))
+        self.effective_rate = self.n_sampled_groups / float(self.n_groups)
+
+    def sample_event(self, event):
+        """
+        Return the list of events to replay for event
+        """
+        if event.get_type() == 'ControlEvent' or \
+                event.operation not in (OP_READ, OP_WRITE, OP_DISCARD):
+            return [event]
+
+        sampled = []
+        offset = event.offset
+        end = event.offset + event.size
+        while offset < end:
+            group = offset / self.group_bytes
+            if group >= self.n_groups:
+                raise RuntimeError("Offset {} is out of the flash ({} bytes)"
+                    .format(offset, self.conf.total_flash_bytes()))
+            piece_end = min((group + 1) * self.group_bytes, end)
+            new_group = self.new_group_ids[group]
+            if new_group != -1:
+                new_offset = offset - (group - new_group) * self.group_bytes
+                sampled.append(hostevent.Event(
+                    sector_size = self.conf['sector_size'],
+                    pid = event.pid, operation = event.operation,
+                    offset = new_offset, size = piece_end - offset,
+                    timestamp = event.timestamp,
+                    pre_wait_time = event.pre_wait_time,
+                    sync = event.sync, action = event.action))
+            offset = piece_end
+
+        return sampled
+
+    def sample(self, event_iter):
+        """
+        Iterate the sampled events of event_iter, which can also be the
+        path of an event file
+        """
+        if isinstance(event_iter, basestring):
+            event_iter = hostevent.create_event_iterator(self.conf,
+                    event_iter)
+
+        for event in event_iter:
+            for sampled_event in self.sample_event(event):
+                yield sampled_event
+
+    def sample_event_file(self, event_path, out_path):
+        """
+        Write the sampled events of an event file to a binary event file.
+        Return the number of events written.
+        """
+        writer = hostevent.BinaryEventFileWriter(out_path)
+        for event in self.sample(event_path):
+            writer.write_event(event)
+        writer.close()
+
+        return writer.n_events
+
+    def scaled_config(self):
+        """
+        Return a copy of conf with flash (and mapping cache) scaled by the
+        effective sample rate
+        """
+        conf = copy.deepcopy(self.conf)
+
+        # keep whole blocks in every plane
+        n_planes = conf.n_blocks_per_dev / \
+                conf['flash_config']['n_blocks_per_plane']
+        plane_set_bytes = conf.block_bytes * n_planes
+        n_plane_sets = int(math.ceil(self.n_sampled_groups * self.group_bytes
+            / float(plane_set_bytes)))
+        conf.set_flash_num_blocks_by_bytes(n_plane_sets * plane_set_bytes)
+
+        if 'mapping_cache_bytes' in conf:
+            tpage_cache_bytes = self.n_entries_per_tpage * \
+                    conf['cache_entry_bytes']
+            n_tpages = int(round(conf['mapping_cache_bytes'] *
+                self.effective_rate / tpage_cache_bytes))
+            conf['mapping_cache_bytes'] = max(1, n_tpages) * tpage_cache_bytes
+
+        return conf
+
+
+def rescale_counters(general_accumulator, sample_rate,
+        counter_sets=RESCALED_COUNTER_SETS):
+    """
+    Return a copy of general_accumulator with counter_sets divided by
+    sample_rate
+    """
+    result = {}
+    for counter_set_name, counter_set in general_accumulator.items():
+        if counter_set_name in counter_sets:
+            result[counter_set_name] = {item: count / float(sample_rate)
+                    for item, count in counter_set.items()}
+        else:
+            result[counter_set_name] = dict(counter_set)
+    return result
+
+
+def rescale_recorder_result(result_dir, sample_rate):
+    """
+    Write recorder.rescaled.json next to recorder.json of a sampled run
+    """
+    result = utils.load_json(os.path.join(result_dir, 'recorder.json'))
+    result['general_accumulator'] = rescale_counters(
+            result['general_accumulator'], sample_rate)
+    result['sample_rate'] = sample_rate
+    utils.dump_json(result, os.path.join(result_dir, RESCALED_RESULT_NAME))
+    return result
+
+
+def compare_counters(full_accumulator, estimated_accumulator,
+        counter_sets=RESCALED_COUNTER_SETS):
+    """
+    Return {counter set: {item: (full, estimated, relative error)}}
+    """
+    comparison = {}
+    for counter_set_name in counter_sets:
+        full_set = full_accumulator.get(counter_set_name, {})
+        estimated_set = estimated_accumulator.get(counter_set_name, {})
+        if len(full_set) == 0 and len(estimated_set) == 0:
+            continue
+        items = comparison.setdefault(counter_set_name, {})
+        for item in set(full_set.keys()) | set(estimated_set.keys()):
+            full = full_set.get(item, 0)
+            estimated = estimated_set.get(item, 0)
+            if full == 0:
+                error = 0.0 if estimated == 0 else float('inf')
+            else:
+                error = abs(estimated - full) / float(full)
+            items[item] = (full, estimated, error)
+    return comparison
+
+
+def validate_sampling(conf, sample_rates, group_bytes=None):
+    """
+    Run conf's workload on the full SSD and on SSDs scaled by each of
+    sample_rates, and compare the rescaled recorder counters.
+
+    Results of sampled runs go to <result_dir>/sampled-<rate>.
+    Return {sample_rate: compare_counters(...)}.
+    """
+    # avoid circular import
+    from workflow import Workflow
+
+    Workflow(conf).run()
+    full_result = utils.load_json(
+            os.path.join(conf['result_dir'], 'recorder.json'))
+
+    comparisons = {}
+    for sample_rate in sample_rates:
+        sampler = SpatialSampler(conf, sample_rate, group_bytes)
+        sampled_conf = sampler.scaled_config()
+        sampled_conf['result_dir'] = os.path.join(conf['result_dir'],
+                'sampled-{}'.format(sample_rate))
+
+        wf = Workflow(sampled_conf)
+        wf.run_simulator(sampler.sample(wf.run_workload()))
+        result = rescale_recorder_result(sampled_conf['result_dir'],
+                sampler.effective_rate)
+
+        comparisons[sample_rate] = compare_counters(
+                full_result['general_accumulator'],
+                result['general_accumulator'])
+
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Write a spatially sampled event file')
+    parser.add_argument('event_file')
+    parser.add_argument('out_file')
+    parser.add_argument('sample_rate', type=float)
+    parser.add_argument('--config', help='config.json of the experiment')
+    args = parser.parse_args()
+
+    conf = config.ConfigNCQFTL()
+    if args.config is not None:
+        conf.load_from_json_file(args.config)
+    sampler = SpatialSampler(conf, args.sample_rate)
+    n_events = sampler.sample_event_file(args.event_file, args.out_file)
+    pprint.pprint({'n_events': n_events,
+        'effective_rate': sampler.effective_rate,
+        'n_sampled_groups': sampler.n_sampled_groups})
+
+
+if __name__ == '__main__':
+    main()
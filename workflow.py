@@ -48,9 +48,12 @@ class Workflow(object):
             event_iter = lbagen
         elif workload_src == LBAMULTIPROC:
             classname = self.conf['lba_workload_class']
-            cls = "workrunner.lbaworkloadgenerator.{}".format(classname)
+            cls = eval("workrunner.lbaworkloadgenerator.{}".format(classname))
             lbagen = cls(self.conf)
-            event_iter = lbagen.get_iter_list()
+            if self.conf['merge_multiproc_streams'] is True:
+                event_iter = lbagen.get_merged_iter()
+            else:
+                event_iter = lbagen.get_iter_list()
         else:
             raise RuntimeError("{} is not a valid workload source"\
                 .format(workload_src))
@@ -58,6 +61,10 @@ class Workflow(object):
         return event_iter
 
     def _run_simulator(self, event_iter):
+        """
+        event_iter can be an iterator of events or the path of an event
+        file in text or binary format.
+        """
         if self.conf['enable_simulation'] is not True:
             return
 
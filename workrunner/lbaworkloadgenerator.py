@@ -22,6 +22,10 @@ class LBAMultiProcGenerator(object):
     def get_iter_list(self):
         return
 
+    def get_merged_iter(self):
+        "Return one stream of the events of all processes, by timestamp"
+        return hostevent.MergedEventIterator(self.get_iter_list())
+
 
 class SampleWorkload(LBAWorkloadGenerator):
     def __init__(self, conf):
@@ -419,8 +423,13 @@ class BlktraceEvents(LBAWorkloadGenerator):
 
         self.mkfs_event_path = self.conf['lba_workload_configs']\
                 ['mkfs_event_path']
+        # subclasses may read their events from elsewhere
         self.ftlsim_event_path = self.conf['lba_workload_configs']\
-                ['ftlsim_event_path']
+                .get('ftlsim_event_path')
+        # optional start_event, stop_event, start_time and stop_time of
+        # the ftlsim events to replay
+        self.ftlsim_event_range = self.conf['lba_workload_configs'].get(
+                'ftlsim_event_range', {})
 
         self.stop_on_bytes = self.conf['stop_sim_on_bytes']
 
@@ -449,8 +458,8 @@ class BlktraceEvents(LBAWorkloadGenerator):
         yield hostevent.ControlEvent(operation=OP_REC_BW)
 
     def prepfs_events(self):
-        prepfs_line_iter = hostevent.FileLineIterator(self.mkfs_event_path)
-        event_prepfs_iter = hostevent.EventIterator(self.conf, prepfs_line_iter)
+        event_prepfs_iter = hostevent.create_event_iterator(self.conf,
+                self.mkfs_event_path)
 
         for event in event_prepfs_iter:
             yield event
@@ -464,8 +473,7 @@ class BlktraceEvents(LBAWorkloadGenerator):
         yield hostevent.ControlEvent(operation=OP_REC_TIMESTAMP,
                 arg1='interest_workload_start')
 
-        workload_line_iter = hostevent.FileLineIterator(self.ftlsim_event_path)
-        event_workload_iter = hostevent.EventIterator(self.conf, workload_line_iter)
+        event_workload_iter = self.ftlsim_events()
 
         total_rw_bytes = 0
         for event in event_workload_iter:
@@ -483,6 +491,10 @@ class BlktraceEvents(LBAWorkloadGenerator):
         yield hostevent.ControlEvent(operation=OP_REC_TIMESTAMP,
                 arg1='interest_workload_end')
 
+    def ftlsim_events(self):
+        return hostevent.create_event_iterator(self.conf,
+                self.ftlsim_event_path, **self.ftlsim_event_range)
+
     def gc_event(self):
         barriergen = BarrierGen(self.conf.ssd_ncq_depth())
         if self.conf['do_gc_after_workload'] is True:
@@ -495,3 +507,94 @@ class BlktraceEvents(LBAWorkloadGenerator):
 
 
 
+
+
+class MultiStreamBlktraceEvents(BlktraceEvents, LBAMultiProcGenerator):
+    """
+    Replay one event file per process (e.g. per tenant of a host) as
+    concurrent streams.
+
+    lba_workload_configs:
+        mkfs_event_path: events to prepare the file system
+        ftlsim_event_paths: list of event files, one per stream
+        stream_offset_stride_bytes: optional, events of stream i are moved
+            by i * stride bytes, so tenants use separate address ranges
+
+    Iterating this object merges the streams by timestamp, with the same
+    control events as BlktraceEvents. get_iter_list() returns one lazy
+    iterator per stream for SimulatorDESSync; the first one also carries
+    the mkfs and control events. The other streams wait at
+    OP_HOST_BARRIER until mkfs is done and the recorder is enabled.
+    """
+    def __init__(self, confobj):
+        super(MultiStreamBlktraceEvents, self).__init__(confobj)
+
+        workload_configs = self.conf['lba_workload_configs']
+        self.ftlsim_event_paths = workload_configs['ftlsim_event_paths']
+        self.stride_bytes = workload_configs.get(
+                'stream_offset_stride_bytes', 0)
+
+    def stream_events(self, stream_id):
+        shift = stream_id * self.stride_bytes
+        sector_size = self.conf['sector_size']
+        for event in hostevent.create_event_iterator(self.conf,
+                self.ftlsim_event_paths[stream_id],
+                **self.ftlsim_event_range):
+            if shift != 0:
+                event.offset += shift
+                event.sector = event.offset / sector_size
+            yield event
+
+    def ftlsim_events(self):
+        return hostevent.MergedEventIterator(
+                [self.stream_events(i)
+                    for i in range(len(self.ftlsim_event_paths))])
+
+    def get_iter_list(self):
+        return [self.first_stream_events()] + [self.other_stream_events(i)
+                for i in range(1, len(self.ftlsim_event_paths))]
+
+    def first_stream_events(self):
+        barriergen = BarrierGen(self.conf.ssd_ncq_depth())
+
+        yield hostevent.ControlEvent(operation=OP_DISABLE_RECORDER)
+
+        for event in self.prepfs_events():
+            yield event
+
+        yield hostevent.ControlEvent(operation=OP_ENABLE_RECORDER)
+        for req in barriergen.barrier_events():
+            yield req
+        yield hostevent.ControlEvent(operation=OP_REC_TIMESTAMP,
+                arg1='interest_workload_start')
+        # the other streams start from here
+        yield hostevent.ControlEvent(operation=OP_HOST_BARRIER)
+
+        for event in self.stream_events(0):
+            yield event
+
+        # wait until the other streams have issued all their events
+        yield hostevent.ControlEvent(operation=OP_HOST_BARRIER)
+        for req in barriergen.barrier_events():
+            yield req
+        yield hostevent.ControlEvent(operation=OP_REC_TIMESTAMP,
+                arg1='interest_workload_end')
+
+        for event in self.gc_event():
+            yield event
+
+        for req in barriergen.barrier_events():
+            yield req
+        yield hostevent.ControlEvent(operation=OP_REC_BW)
+        # the other streams must not shut the SSD before this
+        yield hostevent.ControlEvent(operation=OP_HOST_BARRIER)
+
+    def other_stream_events(self, stream_id):
+        yield hostevent.ControlEvent(operation=OP_HOST_BARRIER)
+        for event in self.stream_events(stream_id):
+            yield event
+        yield hostevent.ControlEvent(operation=OP_HOST_BARRIER)
+        yield hostevent.ControlEvent(operation=OP_HOST_BARRIER)
+
+    def get_merged_iter(self):
+        return iter(self)
@@ -1,4 +1,4 @@
-import sys, threading, Queue
+import os, sys, time, threading, Queue
 
 def enqueue_lines(f, line_queue):
     for line in iter(f.readline, b''):
@@ -25,6 +25,48 @@ class NonBlockingReader(object):
             return line
 
 
+class FollowFileIterator(object):
+    """
+    Iterate lines of a file that is still being written, like tail -f.
+
+    Iteration ends after done_event (a threading.Event) is set and all
+    lines written so far are returned. The file does not need to exist
+    when iteration starts.
+    """
+    def __init__(self, file_path, done_event, poll_interval=0.05):
+        self.file_path = file_path
+        self.done_event = done_event
+        self.poll_interval = poll_interval
+
+    def __iter__(self):
+        while not os.path.exists(self.file_path):
+            if self.done_event.is_set():
+                return
+            time.sleep(self.poll_interval)
+
+        with open(self.file_path, 'r') as f:
+            partial = ''
+            while True:
+                line = f.readline()
+                if line.endswith('\n'):
+                    yield partial + line
+                    partial = ''
+                    continue
+
+                # reached the current end of file
+                partial += line
+                if self.done_event.is_set():
+                    # the writer has finished, take what is left
+                    rest = partial + f.read()
+                    for line in rest.splitlines(True):
+                        yield line
+                    return
+
+                time.sleep(self.poll_interval)
+                # clear the EOF state of the file object
+                f.seek(f.tell())
+
+
 if __name__ == '__main__':
     nb_reader = NonBlockingReader("/sys/kernel/debug/tracing/trace_pipe")
 
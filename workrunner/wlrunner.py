@@ -1,5 +1,7 @@
 import re
 import os
+import sys
+import threading
 import time
 import datetime
 
@@ -12,6 +14,7 @@ import fshelper
 from wiscsim import hostevent
 from utilities import utils
 import workload
+from nonblockingreader import FollowFileIterator
 
 from commons import *
 
@@ -179,6 +182,8 @@ class WorkloadRunner(object):
         self.__set_linux_environment()
 
         if self.conf['enable_blktrace'] == True:
+            if self.conf['stream_blktrace_to_simulator'] is True:
+                return self.run_with_blktrace_streaming()
             return self.run_with_blktrace()
         else:
             return self.run_without_blktrace()
@@ -210,64 +215,80 @@ class WorkloadRunner(object):
 
         return None
 
-    def run_with_blktrace(self):
-        try:
-            # Set number of CPUs
-            cpuhandler.set_cpus(self.conf['n_online_cpus'])
+    def _get_trace_filter(self):
+        if self.conf['trace_issue_and_complete'] is True:
+            return ['issue', 'complete']
+        else:
+            return ['issue']
+
+    def _prepare_fs_with_blktrace(self, trace_filter):
+        """
+        Make, mount and age the file system while tracing it with
+        blktracer_prepfs.
+        """
+        # strat blktrace
+        # This is only for making and mounting file system, because we
+        # want to separate them with workloads.
+        self.blktracer_prepfs.start_tracing_and_collecting(trace_filter=trace_filter)
+        time.sleep(1)
+        while self.blktracer_prepfs.proc == None:
+            print 'Waiting for blktrace to start.....'
+            time.sleep(0.5)
 
-            self.prepare_device()
+        self.build_fs()
 
-            # strat blktrace
-            # This is only for making and mounting file system, because we
-            # want to separate them with workloads.
-            if self.conf['trace_issue_and_complete'] is True:
-                trace_filter=['issue', 'complete']
-            else:
-                trace_filter=['issue']
+        # Age the file system
+        print '----------------------------------------------------'
+        print '---------Running Aging Workload-------------------'
+        print '----------------------------------------------------'
+        self.aging_workload.run()
+        utils.drop_caches()
 
-            self.blktracer_prepfs.start_tracing_and_collecting(trace_filter=trace_filter)
-            time.sleep(1)
-            while self.blktracer_prepfs.proc == None:
-                print 'Waiting for blktrace to start.....'
-                time.sleep(0.5)
+        time.sleep(1)
+        self.blktracer_prepfs.stop_tracing_and_collecting()
+        time.sleep(1)
 
-            self.build_fs()
+    def _start_target_blktrace(self, trace_filter):
+        self.blktracer.start_tracing_and_collecting(trace_filter=trace_filter)
 
-            # Age the file system
-            print '----------------------------------------------------'
-            print '---------Running Aging Workload-------------------'
-            print '----------------------------------------------------'
-            self.aging_workload.run()
-            utils.drop_caches()
+        time.sleep(2)
+        while self.blktracer.proc == None:
+            print 'Waiting for blktrace to start.....'
+            time.sleep(0.5)
 
-            time.sleep(1)
-            self.blktracer_prepfs.stop_tracing_and_collecting()
-            time.sleep(1)
-            self.blktracer_prepfs.create_event_file_from_blkparse()
+    def _run_target_workload(self):
+        print 'Running workload ..................'
+        self._pre_target_workload()
 
-            self.blktracer.start_tracing_and_collecting(trace_filter=trace_filter)
+        print '----------------------------------------------------'
+        print '---------Running       TARGET workload-------------------'
+        print '----------------------------------------------------'
+        start_time = datetime.datetime.now()
+        self.workload.run()
+        end_time = datetime.datetime.now()
 
-            time.sleep(2)
-            while self.blktracer.proc == None:
-                print 'Waiting for blktrace to start.....'
-                time.sleep(0.5)
+        app_duration = end_time - start_time
+        print 'Application duration >>>>>>>>>', app_duration.total_seconds()
+        self.write_app_duration(app_duration.total_seconds())
 
-            print 'Running workload ..................'
-            self._pre_target_workload()
+        self._post_target_workload()
+        time.sleep(1) # has to sleep here so the blktrace gets all the data
 
-            print '----------------------------------------------------'
-            print '---------Running       TARGET workload-------------------'
-            print '----------------------------------------------------'
-            start_time = datetime.datetime.now()
-            self.workload.run()
-            end_time = datetime.datetime.now()
+    def run_with_blktrace(self):
+        try:
+            # Set number of CPUs
+            cpuhandler.set_cpus(self.conf['n_online_cpus'])
 
-            app_duration = end_time - start_time
-            print 'Application duration >>>>>>>>>', app_duration.total_seconds()
-            self.write_app_duration(app_duration.total_seconds())
+            self.prepare_device()
 
-            self._post_target_workload()
-            time.sleep(1) # has to sleep here so the blktrace gets all the data
+            trace_filter = self._get_trace_filter()
+            self._prepare_fs_with_blktrace(trace_filter)
+            self.blktracer_prepfs.create_event_file_from_blkparse()
+            self._index_event_file(
+                    self.conf.get_ftlsim_events_output_path_mkfs())
+
+            self._start_target_blktrace(trace_filter)
+            self._run_target_workload()
 
         except Exception:
             raise
@@ -276,12 +297,58 @@ class WorkloadRunner(object):
             self.blktracer.stop_tracing_and_collecting()
             utils.shcmd("sync")
             self.blktracer.create_event_file_from_blkparse()
+            self._index_event_file(self.conf.get_ftlsim_events_output_path())
             # self.remove_raw_trace()
             return self.get_event_iterator()
         finally:
             # always try to clean up the blktrace processes
             self.blktracer.stop_tracing_and_collecting()
 
+    def run_with_blktrace_streaming(self):
+        """
+        Like run_with_blktrace(), but no event files are created. The
+        returned iterator converts blkparse output to events as it is
+        produced, while the target workload keeps running in a background
+        thread, so simulation overlaps with tracing.
+        """
+        try:
+            cpuhandler.set_cpus(self.conf['n_online_cpus'])
+
+            self.prepare_device()
+
+            trace_filter = self._get_trace_filter()
+            self._prepare_fs_with_blktrace(trace_filter)
+
+            self._start_target_blktrace(trace_filter)
+        except Exception:
+            # the background thread cleans up after this succeeds
+            self.blktracer.stop_tracing_and_collecting()
+            raise
+
+        self._target_workload_done = threading.Event()
+        self._target_workload_exc_info = None
+        t = threading.Thread(target=self._run_target_workload_in_bg)
+        t.daemon = True
+        t.start()
+
+        return self.get_event_iterator()
+
+    def _run_target_workload_in_bg(self):
+        try:
+            self._run_target_workload()
+            utils.shcmd("sync")
+        except Exception:
+            self._target_workload_exc_info = sys.exc_info()
+        finally:
+            # always try to clean up the blktrace processes
+            self.blktracer.stop_tracing_and_collecting()
+            self._target_workload_done.set()
+
+    def _index_event_file(self, path):
+        interval = self.conf['event_file_index_interval']
+        if interval is not None:
+            hostevent.build_event_index(self.conf, path, interval)
+
     def write_app_duration(self, secs):
         path = os.path.join(self.conf['result_dir'], 'app_duration.txt')
         with open(path, 'w') as f:
@@ -357,9 +424,14 @@ class WorkloadRunner(object):
         yield hostevent.ControlEvent(operation=OP_REC_BW)
 
     def prepfs_events(self):
-        prepfs_line_iter = hostevent.FileLineIterator(
-            self.conf.get_ftlsim_events_output_path_mkfs())
-        event_prepfs_iter = hostevent.EventIterator(self.conf, prepfs_line_iter)
+        if self.conf['stream_blktrace_to_simulator'] is True:
+            event_prepfs_iter = hostevent.BlkparseEventIterator(self.conf,
+                hostevent.FileLineIterator(
+                    self.conf.get_blkparse_result_path_mkfs()),
+                padding_bytes = self.conf['dev_padding'])
+        else:
+            event_prepfs_iter = hostevent.create_event_iterator(self.conf,
+                self.conf.get_ftlsim_events_output_path_mkfs())
 
         for event in event_prepfs_iter:
             yield event
@@ -373,13 +445,23 @@ class WorkloadRunner(object):
         yield hostevent.ControlEvent(operation=OP_REC_TIMESTAMP,
                 arg1='interest_workload_start')
 
-        workload_line_iter = hostevent.FileLineIterator(
-            self.conf.get_ftlsim_events_output_path())
-        event_workload_iter = hostevent.EventIterator(self.conf, workload_line_iter)
+        if self.conf['stream_blktrace_to_simulator'] is True:
+            event_workload_iter = hostevent.BlkparseEventIterator(self.conf,
+                FollowFileIterator(self.conf.get_blkparse_result_path(),
+                    self._target_workload_done),
+                padding_bytes = self.conf['dev_padding'])
+        else:
+            event_workload_iter = hostevent.create_event_iterator(self.conf,
+                self.conf.get_ftlsim_events_output_path())
 
         for event in event_workload_iter:
             yield event
 
+        if self.conf['stream_blktrace_to_simulator'] is True and \
+                self._target_workload_exc_info is not None:
+            exc_type, exc_value, exc_tb = self._target_workload_exc_info
+            raise exc_type, exc_value, exc_tb
+
         for req in barriergen.barrier_events():
             yield req
         yield hostevent.ControlEvent(operation=OP_REC_TIMESTAMP,